@@ -0,0 +1,80 @@
+"""Incremental ZIP writer for streaming responses.
+
+``zipfile`` can write to a non-seekable sink by emitting data descriptors
+after each member. ``ZipStream`` collects what ``zipfile`` writes and hands it
+back in chunks, so an archive can be sent while later members are still
+being produced and without ever holding the whole archive in memory.
+"""
+
+import time
+import zipfile
+from typing import Iterator, List
+
+# Read size when copying a member into the archive
+ZIP_CHUNK_SIZE = 1024 * 1024
+
+# Outputs that are already compressed are stored as-is
+STORED_SUFFIXES = {".pdf", ".jpg", ".jpeg", ".png", ".webp", ".avif", ".zip", ".docx", ".xlsx", ".pptx"}
+
+
+class _Sink:
+    """Write-only file object without ``tell``/``seek``."""
+
+    def __init__(self):
+        self._chunks: List[bytes] = []
+
+    def write(self, data) -> int:
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def take(self) -> bytes:
+        data = b"".join(self._chunks)
+        self._chunks = []
+        return data
+
+
+class ZipStream:
+    def __init__(self):
+        self._sink = _Sink()
+        self._zip = zipfile.ZipFile(self._sink, "w", allowZip64=True)
+        self._names = set()
+
+    def unique_name(self, arcname: str) -> str:
+        """Return ``arcname``, or a numbered variant if it is already in the archive."""
+        name, counter = arcname, 1
+        while name in self._names:
+            counter += 1
+            stem, dot, suffix = arcname.rpartition(".")
+            name = f"{stem}-{counter}.{suffix}" if dot else f"{arcname}-{counter}"
+        self._names.add(name)
+        return name
+
+    def _info(self, arcname: str, size: int) -> zipfile.ZipInfo:
+        info = zipfile.ZipInfo(arcname, date_time=time.localtime()[:6])
+        info.file_size = size
+        suffix = "." + arcname.rpartition(".")[2].lower()
+        info.compress_type = zipfile.ZIP_STORED if suffix in STORED_SUFFIXES else zipfile.ZIP_DEFLATED
+        return info
+
+    def add_file(self, path: str, arcname: str) -> Iterator[bytes]:
+        """Copy a file into the archive, yielding archive bytes as they are produced."""
+        with open(path, "rb") as source:
+            source.seek(0, 2)
+            size = source.tell()
+            source.seek(0)
+            with self._zip.open(self._info(arcname, size), "w", force_zip64=size > zipfile.ZIP64_LIMIT) as dest:
+                for chunk in iter(lambda: source.read(ZIP_CHUNK_SIZE), b""):
+                    dest.write(chunk)
+                    yield self._sink.take()
+        yield self._sink.take()
+
+    def add_bytes(self, arcname: str, data: bytes) -> bytes:
+        self._zip.writestr(self._info(arcname, len(data)), data)
+        return self._sink.take()
+
+    def close(self) -> bytes:
+        self._zip.close()
+        return self._sink.take()
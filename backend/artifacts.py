@@ -0,0 +1,240 @@
+"""Lifecycle of request directories and delivery of the files they hold.
+
+Every request works in its own directory under ``UPLOAD_DIR``. The directory
+must outlive the response: ``ArtifactResponse`` streams the output and the
+directory is removed by a background task once the last byte has been sent.
+Directories whose owner crashed before cleaning up are reclaimed by
+``RequestDirectories.sweep``, which the app runs periodically; directories
+still marked in use are only reclaimed after ``ACTIVE_TTL_SECONDS``, in case
+their release was missed.
+
+``ArtifactResponse`` also answers single-range ``Range`` requests (so large
+outputs can be resumed or fetched in parts) and hands the file descriptor to
+the server when it supports the ASGI zero-copy send extension, avoiding
+reads into Python memory altogether.
+"""
+
+import asyncio
+import logging
+import os
+import re
+import shutil
+import stat
+import tempfile
+import time
+from pathlib import Path
+from typing import Dict, Optional, Tuple
+
+import anyio
+from starlette.responses import FileResponse
+from starlette.types import Receive, Scope, Send
+
+logger = logging.getLogger(__name__)
+
+# Request directories untouched for this long are considered orphaned
+ORPHAN_TTL_SECONDS = int(os.getenv("ORPHAN_TTL_SECONDS", "3600"))
+
+# Directories still marked in use are reclaimed after this long regardless
+ACTIVE_TTL_SECONDS = int(os.getenv("ACTIVE_TTL_SECONDS", str(24 * 3600)))
+
+# How often the sweeper runs
+SWEEP_INTERVAL_SECONDS = int(os.getenv("SWEEP_INTERVAL_SECONDS", "300"))
+
+# Prefix of request directories, so the sweeper never touches anything else
+REQUEST_DIR_PREFIX = "req-"
+
+RANGE_PATTERN = re.compile(r"^bytes=(\d*)-(\d*)$")
+
+
+def parse_range(header: str, size: int) -> Optional[Tuple[int, int]]:
+    """Parse a single ``bytes=`` range into an inclusive ``(start, end)``.
+
+    Returns None for multi-range or malformed headers (the full file is sent
+    instead) and raises ValueError for ranges that cannot be satisfied.
+    """
+    match = RANGE_PATTERN.match(header.strip())
+    if not match:
+        return None
+    first, last = match.groups()
+    if not first and not last:
+        return None
+    if not first:
+        # Suffix range: the last N bytes
+        length = int(last)
+        if length == 0:
+            raise ValueError("empty suffix range")
+        return max(0, size - length), size - 1
+    start = int(first)
+    end = min(int(last), size - 1) if last else size - 1
+    if start >= size or start > end:
+        raise ValueError("range not satisfiable")
+    return start, end
+
+
+class ArtifactResponse(FileResponse):
+    """FileResponse with Range support and zero-copy delivery when available."""
+
+    chunk_size = 1024 * 1024
+
+    def __init__(self, path, *args, **kwargs):
+        super().__init__(path, *args, **kwargs)
+        self.headers["accept-ranges"] = "bytes"
+
+    def _requested_range(self, scope: Scope, size: int, etag: str) -> Optional[Tuple[int, int]]:
+        headers = dict(scope.get("headers") or [])
+        range_header = headers.get(b"range")
+        if not range_header:
+            return None
+        if_range = headers.get(b"if-range")
+        if if_range and if_range.decode("latin-1") != etag:
+            # The client's copy is stale; send the whole current file
+            return None
+        return parse_range(range_header.decode("latin-1"), size)
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        try:
+            await self._send_file(scope, send)
+        finally:
+            # Release the request directory even when sending failed
+            if self.background is not None:
+                await self.background()
+
+    async def _send_file(self, scope: Scope, send: Send):
+        try:
+            file = await anyio.open_file(self.path, mode="rb")
+        except FileNotFoundError:
+            raise RuntimeError(f"File at path {self.path} does not exist.")
+        try:
+            stat_result = await anyio.to_thread.run_sync(os.fstat, file.wrapped.fileno())
+            if not stat.S_ISREG(stat_result.st_mode):
+                raise RuntimeError(f"File at path {self.path} is not a file.")
+            self.set_stat_headers(stat_result)
+            size = stat_result.st_size
+
+            start, end = 0, size - 1
+            try:
+                requested = self._requested_range(scope, size, self.headers.get("etag", ""))
+            except ValueError:
+                self.status_code = 416
+                self.headers["content-range"] = f"bytes */{size}"
+                self.headers["content-length"] = "0"
+                requested = None
+                end = -1
+            if requested is not None:
+                start, end = requested
+                self.status_code = 206
+                self.headers["content-range"] = f"bytes {start}-{end}/{size}"
+                self.headers["content-length"] = str(end - start + 1)
+
+            await send({"type": "http.response.start", "status": self.status_code, "headers": self.raw_headers})
+            await self._send_body(scope, send, file, start, end - start + 1)
+        finally:
+            await file.aclose()
+
+    async def _send_body(self, scope: Scope, send: Send, file, offset: int, count: int):
+        extensions = scope.get("extensions") or {}
+        if scope["method"].upper() == "HEAD" or count <= 0:
+            await send({"type": "http.response.body", "body": b"", "more_body": False})
+        elif "http.response.zerocopysend" in extensions:
+            # The server copies from our descriptor to the socket (sendfile)
+            await send({
+                "type": "http.response.zerocopysend",
+                "file": file.wrapped.fileno(),
+                "offset": offset,
+                "count": count,
+                "more_body": False,
+            })
+        elif "http.response.pathsend" in extensions and offset == 0 and self.status_code == 200:
+            await send({"type": "http.response.pathsend", "path": str(self.path)})
+        else:
+            await file.seek(offset)
+            remaining = count
+            while remaining > 0:
+                chunk = await file.read(min(self.chunk_size, remaining))
+                if not chunk:
+                    break
+                remaining -= len(chunk)
+                await send({"type": "http.response.body", "body": chunk, "more_body": remaining > 0})
+            if remaining > 0:
+                # The file shrank underneath us; end the body rather than hang
+                await send({"type": "http.response.body", "body": b"", "more_body": False})
+
+
+class RequestDirectories:
+    """Creates per-request working directories and reclaims abandoned ones."""
+
+    def __init__(
+        self,
+        root: Path,
+        ttl: float = ORPHAN_TTL_SECONDS,
+        interval: float = SWEEP_INTERVAL_SECONDS,
+        active_ttl: float = ACTIVE_TTL_SECONDS,
+    ):
+        self.root = Path(root)
+        self.ttl = ttl
+        self.interval = interval
+        self.active_ttl = active_ttl
+        self.active: Dict[str, float] = {}           # Path -> creation time
+        self._task: Optional[asyncio.Task] = None
+
+    def create(self) -> str:
+        path = tempfile.mkdtemp(dir=self.root, prefix=REQUEST_DIR_PREFIX)
+        self.active[path] = time.time()
+        return path
+
+    def release(self, path: str):
+        """Remove a request directory once nothing needs it any more."""
+        self.active.pop(path, None)
+        try:
+            shutil.rmtree(path)
+        except FileNotFoundError:
+            pass
+        except Exception as e:
+            logger.error(f"Error cleaning up: {e}")
+
+    def sweep(self, now: Optional[float] = None) -> int:
+        """Delete request directories that are not in use and older than the TTL.
+
+        Directories in use are deleted too once they are older than
+        ``active_ttl``: no request runs that long, so their release was lost.
+        """
+        now = now or time.time()
+        removed = 0
+        for path, created in list(self.active.items()):
+            if now - created > self.active_ttl:
+                logger.warning(f"Reclaiming request directory {path}, in use for {now - created:.0f}s")
+                self.active.pop(path, None)
+        for entry in self.root.iterdir():
+            if not entry.is_dir() or str(entry) in self.active:
+                continue
+            # Also reclaim directories from before request directories had a prefix
+            if not entry.name.startswith((REQUEST_DIR_PREFIX, "tmp")):
+                continue
+            try:
+                if now - entry.stat().st_mtime <= self.ttl:
+                    continue
+            except OSError:
+                continue
+            shutil.rmtree(entry, ignore_errors=True)
+            removed += 1
+        if removed:
+            logger.info(f"Removed {removed} orphaned request directories")
+        return removed
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._sweeper())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    async def _sweeper(self):
+        while True:
+            try:
+                await asyncio.to_thread(self.sweep)
+            except Exception as e:
+                logger.error(f"Request directory sweep failed: {e}")
+            await asyncio.sleep(self.interval)
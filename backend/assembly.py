@@ -0,0 +1,280 @@
+"""Page assembly engine for merging and splitting PDFs.
+
+``merge`` copies the inputs into one document a file at a time: each source
+is opened, its pages are grafted in and it is closed again before the next
+one, so merging hundreds of files never keeps more than one of them open.
+``split`` opens the source once and writes every requested range in the same
+pass, straight into a ZIP archive on disk. Ranges are validated against the
+page count before any work starts (``extraction.parse_page_ranges``).
+
+Outputs are saved in one of three modes:
+
+* ``compact`` garbage-collects and deduplicates objects (``garbage=4``), so
+  fonts and images shared by the merged files are stored once, and deflates
+  the streams.
+* ``linear`` is ``compact`` plus linearization ("fast web view"), which lets
+  viewers show the first page before the whole file has downloaded.
+* ``incremental`` (merge only) copies the first input to the output and
+  appends the other files to it with an incremental save. The first file is
+  not rewritten, which is the fastest way to append to a large document, but
+  nothing is deduplicated.
+
+``images_to_pdf`` assembles one PDF from many images (40-100 phone photos of
+notes is typical). Workers decode, resize and encode the images in parallel
+(``imaging.pdf_image``; JPEGs that need no resizing are embedded untouched)
+while this process inserts the encoded bytes as pages in upload order.
+Only ``iter_ordered``'s window of images is in flight, and every
+``IMAGES_FLUSH_PAGES`` pages the document is written out incrementally and
+reopened, so the pages already inserted are not kept in memory either.
+Pages either take the image's size or fit it into an A4 or Letter page
+turned to the image's orientation.
+"""
+
+import math
+import os
+import shutil
+import zipfile
+from concurrent.futures import Executor
+from typing import Callable, List, Optional, Tuple
+
+import fitz  # PyMuPDF
+from fastapi import HTTPException
+
+import imaging
+from workers import iter_ordered
+
+SAVE_MODES = ("compact", "linear", "incremental")
+
+# Release MuPDF's resource cache after this many merged files
+MERGE_STORE_SHRINK_EVERY = int(os.getenv("MERGE_STORE_SHRINK_EVERY", "25"))
+
+COMPACT_SAVE_OPTIONS = dict(garbage=4, deflate=True, deflate_images=True, deflate_fonts=True)
+
+# Page sizes for images_to_pdf; "image" makes each page the size of its image
+PAGE_SIZES = ("image", "a4", "letter")
+
+# Margin around images fitted into an A4 or Letter page, in points
+IMAGE_PAGE_MARGIN = float(os.getenv("IMAGE_PAGE_MARGIN", "18"))
+
+# Resolution images are downsampled to when fitted into a page without a max_dimension
+IMAGE_PAGE_DPI = int(os.getenv("IMAGE_PAGE_DPI", "200"))
+
+# Pages inserted between incremental saves while assembling images
+IMAGES_FLUSH_PAGES = int(os.getenv("IMAGES_FLUSH_PAGES", "16"))
+
+
+def validate_save_mode(save_mode: str, allowed: Tuple[str, ...] = SAVE_MODES) -> str:
+    if save_mode not in allowed:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Unknown save mode: {save_mode} (expected one of {', '.join(allowed)})",
+        )
+    return save_mode
+
+
+def _save_options(save_mode: str) -> dict:
+    if save_mode == "linear":
+        return dict(COMPACT_SAVE_OPTIONS, linear=True)
+    return dict(COMPACT_SAVE_OPTIONS)
+
+
+def open_source(pdf_path: str) -> "fitz.Document":
+    source = fitz.open(pdf_path)
+    if source.needs_pass:
+        source.close()
+        raise HTTPException(status_code=400, detail=f"{os.path.basename(pdf_path)} is password protected")
+    return source
+
+
+def merge(
+    pdf_paths: List[str],
+    output_path: str,
+    save_mode: str = "compact",
+    progress: Optional[Callable[[int, int], None]] = None,
+) -> str:
+    """Concatenate ``pdf_paths`` into ``output_path``, one open source at a time."""
+    validate_save_mode(save_mode)
+    if not pdf_paths:
+        raise HTTPException(status_code=400, detail="No files to merge")
+
+    if save_mode == "incremental":
+        shutil.copyfile(pdf_paths[0], output_path)
+        merged = open_source(output_path)
+        sources = pdf_paths[1:]
+    else:
+        merged = fitz.open()
+        sources = pdf_paths
+    try:
+        done = len(pdf_paths) - len(sources)
+        for index, pdf_path in enumerate(sources, start=1):
+            source = open_source(pdf_path)
+            try:
+                merged.insert_pdf(source)
+            finally:
+                source.close()
+            if index % MERGE_STORE_SHRINK_EVERY == 0:
+                # Fonts and images of closed sources can still sit in the cache
+                fitz.TOOLS.store_shrink(100)
+            if progress:
+                progress(done + index, len(pdf_paths))
+
+        if save_mode == "incremental" and merged.can_save_incrementally():
+            merged.saveIncr()
+        elif save_mode == "incremental":
+            # The first file was repaired on open and has to be rewritten
+            merged.save(f"{output_path}.tmp")
+            os.replace(f"{output_path}.tmp", output_path)
+        else:
+            merged.save(output_path, **_save_options(save_mode))
+    finally:
+        merged.close()
+    return output_path
+
+
+def range_name(stem: str, start: int, end: int) -> str:
+    """File name of the 0-based, end-exclusive range ``(start, end)``."""
+    if end - start == 1:
+        return f"{stem}-page-{start + 1}.pdf"
+    return f"{stem}-pages-{start + 1}-{end}.pdf"
+
+
+def split(
+    pdf_path: str,
+    output_path: str,
+    ranges: List[Tuple[int, int]],
+    stem: str,
+    save_mode: str = "compact",
+    progress: Optional[Callable[[int, int], None]] = None,
+) -> str:
+    """Write every range of ``pdf_path`` to ``output_path`` in one pass.
+
+    A single range is written as a PDF; several ranges become a ZIP with one
+    PDF per range. Each part is serialized in memory and written into the
+    archive as it is produced, so only one part is ever held in memory and
+    no part touches the disk on its own.
+    """
+    validate_save_mode(save_mode, ("compact", "linear"))
+    options = _save_options(save_mode)
+    source = open_source(pdf_path)
+    try:
+        if len(ranges) == 1:
+            start, end = ranges[0]
+            _write_range(source, start, end, output_path, options)
+            if progress:
+                progress(1, 1)
+            return output_path
+
+        names = set()
+        with zipfile.ZipFile(output_path, "w", zipfile.ZIP_STORED, allowZip64=True) as archive:
+            for index, (start, end) in enumerate(ranges, start=1):
+                name = range_name(stem, start, end)
+                if name in names:
+                    name = f"{name[:-4]}-{index}.pdf"
+                names.add(name)
+                archive.writestr(name, _range_bytes(source, start, end, options))
+                if progress:
+                    progress(index, len(ranges))
+    finally:
+        source.close()
+    return output_path
+
+
+def _write_range(source: "fitz.Document", start: int, end: int, output_path: str, options: dict):
+    part = fitz.open()
+    try:
+        part.insert_pdf(source, from_page=start, to_page=end - 1)
+        part.save(output_path, **options)
+    finally:
+        part.close()
+
+
+def _range_bytes(source: "fitz.Document", start: int, end: int, options: dict) -> bytes:
+    part = fitz.open()
+    try:
+        part.insert_pdf(source, from_page=start, to_page=end - 1)
+        return part.tobytes(**options)
+    finally:
+        part.close()
+
+
+def validate_page_size(page_size: str) -> str:
+    if page_size not in PAGE_SIZES:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Unknown page size: {page_size} (expected one of {', '.join(PAGE_SIZES)})",
+        )
+    return page_size
+
+
+def page_layout(width: float, height: float, page_size: str) -> Tuple[float, float, "fitz.Rect"]:
+    """Page width, height and image rectangle for an image of ``width`` x ``height`` pixels."""
+    if page_size == "image":
+        return width, height, fitz.Rect(0, 0, width, height)
+    page_width, page_height = fitz.paper_size(page_size)
+    if width > height:
+        page_width, page_height = page_height, page_width
+    scale = min((page_width - 2 * IMAGE_PAGE_MARGIN) / width, (page_height - 2 * IMAGE_PAGE_MARGIN) / height)
+    x0 = (page_width - width * scale) / 2
+    y0 = (page_height - height * scale) / 2
+    return page_width, page_height, fitz.Rect(x0, y0, page_width - x0, page_height - y0)
+
+
+def image_to_pdf(image_path: str, output_path: str, max_dimension: int = 0) -> str:
+    """One page the size of the image; fitting JPEGs are inserted without being decoded."""
+    width, height, data, rotate = imaging.pdf_image(image_path, max_dimension)
+    with fitz.open() as doc:
+        page = doc.new_page(width=width, height=height)
+        page.insert_image(page.rect, stream=data, rotate=rotate)
+        doc.save(output_path)
+    return output_path
+
+
+def images_to_pdf(
+    image_paths: List[str],
+    output_path: str,
+    page_size: str = "image",
+    max_dimension: int = 0,
+    quality: int = imaging.IMAGE_PDF_QUALITY,
+    executor: Optional[Executor] = None,
+    progress: Optional[Callable[[int, int], None]] = None,
+) -> str:
+    """One page per image, in order.
+
+    Pages the size of their image with no ``max_dimension`` embed JPEGs
+    as they are, like ``image_to_pdf``; other images are re-encoded at
+    ``quality``.
+    """
+    validate_page_size(page_size)
+    if not image_paths:
+        raise HTTPException(status_code=400, detail="No images to convert")
+    if page_size != "image" and not max_dimension:
+        # More pixels than the page can show at IMAGE_PAGE_DPI are wasted
+        max_dimension = math.ceil(max(fitz.paper_size(page_size)) / 72 * IMAGE_PAGE_DPI)
+
+    passthrough = page_size == "image" and not max_dimension
+    tasks = ((path, max_dimension, quality, passthrough) for path in image_paths)
+    doc = fitz.open()
+    saved = False
+    try:
+        for index, (width, height, data, rotate) in enumerate(iter_ordered(executor, imaging.pdf_image, tasks), start=1):
+            page_width, page_height, rect = page_layout(width, height, page_size)
+            page = doc.new_page(width=page_width, height=page_height)
+            page.insert_image(rect, stream=data, rotate=rotate)
+            if index % IMAGES_FLUSH_PAGES == 0 and index < len(image_paths):
+                # Write the pages so far to disk and drop them from memory
+                if saved:
+                    doc.saveIncr()
+                else:
+                    doc.save(output_path, garbage=1)
+                    saved = True
+                doc.close()
+                doc = fitz.open(output_path)
+            if progress:
+                progress(index, len(image_paths))
+        if saved:
+            doc.saveIncr()
+        else:
+            doc.save(output_path, garbage=1)
+    finally:
+        doc.close()
+    return output_path
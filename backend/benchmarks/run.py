@@ -0,0 +1,380 @@
+"""Benchmark every conversion type, directly and end to end through the API.
+
+Run from the backend directory:
+
+    python -m benchmarks.run --profile quick --mode both --output bench.json
+    python -m benchmarks.run --profile full --only pdf-compress --compare bench.json
+
+``direct`` mode calls the conversion functions from main.py, each case in a
+fresh process so its peak RSS is not polluted by earlier cases. ``http`` mode
+starts uvicorn with the result cache disabled and drives /api/convert with
+concurrent clients. Results are written as JSON so runs on different commits
+can be compared with ``--compare``.
+"""
+
+import argparse
+import importlib
+import json
+import multiprocessing
+import os
+import platform
+import resource
+import shutil
+import socket
+import subprocess
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Tuple
+
+from benchmarks import synthetic
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+
+PROFILES = {
+    "quick": {"pages": [1, 50], "images": [(1280, 960)]},
+    "full": {"pages": [1, 50, 500], "images": [(640, 480), (1920, 1080), (4032, 3024)]},
+}
+
+
+@dataclass
+class Case:
+    name: str
+    conversion_type: str
+    inputs: List[str]
+    fields: Dict[str, str] = field(default_factory=dict)
+    requires: Optional[str] = None  # Executable the case needs, skipped when missing
+
+
+def build_cases(profile: str, workdir: Path) -> List[Case]:
+    settings = PROFILES[profile]
+    cases = []
+    for pages in settings["pages"]:
+        text = synthetic.ensure_pdf(workdir, "text", pages)
+        scanned = synthetic.ensure_pdf(workdir, "scanned", pages)
+        mixed = synthetic.ensure_pdf(workdir, "mixed", pages)
+        for mode in ("raster", "smart"):
+            for kind, path in (("mixed", mixed), ("scanned", scanned)):
+                cases.append(Case(
+                    f"pdf-compress/{mode}/{kind}-{pages}p", "pdf-compress", [path],
+                    {"compression_level": "60", "compression_mode": mode},
+                ))
+        cases.append(Case(f"pdf-ocr/scanned-{pages}p", "pdf-ocr", [scanned], requires="tesseract"))
+        cases.append(Case(f"pdf-ocr-searchable/scanned-{pages}p", "pdf-ocr-searchable", [scanned], requires="tesseract"))
+        cases.append(Case(f"pdf-to-text/text-{pages}p", "pdf-to-text", [text]))
+        cases.append(Case(f"merge-pdfs/4x-text-{pages}p", "merge-pdfs", [text] * 4))
+        half = max(1, pages // 2)
+        ranges = f"1-{half},{half + 1}-{pages}" if pages > 1 else "1"
+        cases.append(Case(f"split-pdf/text-{pages}p", "split-pdf", [text], {"split_ranges": ranges}))
+        # Direct calls start LibreOffice per document; the API uses the warm pool
+        docx = synthetic.ensure_docx(workdir, pages)
+        cases.append(Case(f"docx-to-pdf/{pages}p", "docx-to-pdf", [docx], requires="soffice"))
+    for size in settings["images"]:
+        label = f"{size[0]}x{size[1]}"
+        jpeg = synthetic.ensure_image(workdir, "jpg", size)
+        png = synthetic.ensure_image(workdir, "png", size)
+        cases.append(Case(f"jpg-to-pdf/{label}", "jpg-to-pdf", [jpeg]))
+        cases.append(Case(f"png-to-pdf/{label}", "png-to-pdf", [png]))
+        cases.append(Case(f"image-compress/{label}", "image-compress", [jpeg], {"compression_level": "60"}))
+        cases.append(Case(
+            f"image-compress/{label}-max1600", "image-compress", [jpeg],
+            {"compression_level": "60", "max_dimension": "1600"},
+        ))
+    return cases
+
+
+# Statistics
+
+def percentile(values: List[float], pct: float) -> float:
+    """Nearest-rank percentile of an unsorted list."""
+    ordered = sorted(values)
+    rank = max(0, min(len(ordered) - 1, int(round(pct / 100 * len(ordered) + 0.5)) - 1))
+    return ordered[rank]
+
+
+def summarize(latencies: List[float], wall: float) -> Dict[str, float]:
+    return {
+        "latency_ms": {
+            "p50": round(percentile(latencies, 50) * 1000, 2),
+            "p95": round(percentile(latencies, 95) * 1000, 2),
+            "p99": round(percentile(latencies, 99) * 1000, 2),
+            "mean": round(sum(latencies) / len(latencies) * 1000, 2),
+        },
+        "throughput_per_s": round(len(latencies) / wall, 3) if wall > 0 else None,
+    }
+
+
+# Direct function calls
+
+def _direct_call(case: Case, output_dir: Path, executor) -> Optional[str]:
+    import main
+    from extraction import parse_page_ranges
+    from ocr import OCROptions, page_count
+
+    level = int(case.fields.get("compression_level", 70))
+    source = case.inputs[0]
+    stem = Path(source).stem
+    if case.conversion_type == "pdf-compress":
+        output = str(output_dir / f"{stem}-compressed.pdf")
+        main.compress_pdf(source, output, level, mode=case.fields["compression_mode"], executor=executor)
+        return output
+    if case.conversion_type == "pdf-ocr":
+        main.ocr_pdf(source, options=OCROptions(), executor=executor)
+        return None
+    if case.conversion_type == "pdf-ocr-searchable":
+        output = str(output_dir / f"{stem}-searchable.pdf")
+        return main.ocr_pdf_searchable(source, output, options=OCROptions(), executor=executor)
+    if case.conversion_type == "pdf-to-text":
+        main.extract_text_from_pdf(source)
+        return None
+    if case.conversion_type == "merge-pdfs":
+        output = str(output_dir / "merged.pdf")
+        main.merge_pdfs(case.inputs, output)
+        return output
+    if case.conversion_type == "docx-to-pdf":
+        output = str(output_dir / f"{stem}.pdf")
+        main.docx_to_pdf(source, output)
+        return output
+    if case.conversion_type == "split-pdf":
+        ranges = parse_page_ranges(case.fields["split_ranges"], page_count(source))
+        output = str(output_dir / f"{stem}-split.zip")
+        return main.split_pdf(source, output, ranges, stem)
+    if case.conversion_type in ("jpg-to-pdf", "png-to-pdf"):
+        output = str(output_dir / f"{stem}.pdf")
+        main.image_to_pdf(source, output)
+        return output
+    if case.conversion_type == "image-compress":
+        output = str(output_dir / f"{stem}-compressed.jpg")
+        return main.compress_image(source, output, level, max_dimension=int(case.fields.get("max_dimension", 0)))
+    raise ValueError(f"No direct call for {case.conversion_type}")
+
+
+def _import_module(name: str):
+    importlib.import_module(name)
+
+
+def _run_direct_case(case: Case, iterations: int, workers: int, scratch: str) -> Dict:
+    """Runs in a fresh process; returns timings and the peak RSS of it and its workers."""
+    sys.path.insert(0, str(BACKEND_DIR))
+    import main  # noqa: F401 -- keep import time out of the first sample
+
+    output_dir = Path(scratch)
+    executor = None
+    if workers > 1:
+        executor = ProcessPoolExecutor(workers, mp_context=multiprocessing.get_context("spawn"))
+        # Spawn the workers and import the engine modules before timing
+        list(executor.map(_import_module, ["compression", "ocr"] * workers))
+    try:
+        latencies = []
+        output_path = None
+        started = time.perf_counter()
+        for _ in range(iterations):
+            shutil.rmtree(output_dir, ignore_errors=True)
+            output_dir.mkdir(parents=True)
+            t0 = time.perf_counter()
+            output_path = _direct_call(case, output_dir, executor)
+            latencies.append(time.perf_counter() - t0)
+        wall = time.perf_counter() - started
+        output_bytes = os.path.getsize(output_path) if output_path else None
+        # Sum the peaks while the workers are still alive; getrusage only reports the largest child
+        peak_rss_mb = _process_tree_peak_rss_mb(os.getpid())
+    finally:
+        if executor is not None:
+            executor.shutdown()
+    if peak_rss_mb is None:
+        peak_kb = max(
+            resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+            resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss,
+        )
+        peak_rss_mb = round(peak_kb / 1024, 1)
+    return dict(summarize(latencies, wall), peak_rss_mb=peak_rss_mb, output_bytes=output_bytes)
+
+
+def run_direct(case: Case, iterations: int, workers: int, workdir: Path) -> Dict:
+    context = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(1, mp_context=context) as runner:
+        scratch = str(workdir / "direct-output")
+        return runner.submit(_run_direct_case, case, iterations, workers, scratch).result()
+
+
+# End to end through the API
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def _process_tree_peak_rss_mb(pid: int) -> Optional[float]:
+    """Sum of VmHWM (peak RSS) over a process and its descendants (Linux only)."""
+    total_kb = 0
+    pending = [pid]
+    while pending:
+        current = pending.pop()
+        try:
+            with open(f"/proc/{current}/status") as f:
+                for line in f:
+                    if line.startswith("VmHWM:"):
+                        total_kb += int(line.split()[1])
+            for task in os.listdir(f"/proc/{current}/task"):
+                with open(f"/proc/{current}/task/{task}/children") as f:
+                    pending.extend(int(child) for child in f.read().split())
+        except OSError:
+            if current == pid:
+                return None
+    return round(total_kb / 1024, 1)
+
+
+class Server:
+    def __init__(self, workers: int, workdir: Path):
+        self.port = _free_port()
+        self.url = f"http://127.0.0.1:{self.port}"
+        env = dict(os.environ, CACHE_MAX_BYTES="0", WORKER_PROCESSES=str(workers))
+        self.process = subprocess.Popen(
+            [sys.executable, "-m", "uvicorn", "main:app", "--port", str(self.port), "--log-level", "warning"],
+            cwd=BACKEND_DIR, env=env,
+        )
+
+    def wait_ready(self, timeout: float = 30):
+        import requests
+
+        deadline = time.time() + timeout
+        while time.time() < deadline:
+            try:
+                if requests.get(self.url + "/", timeout=1).ok:
+                    return
+            except requests.RequestException:
+                time.sleep(0.2)
+        raise RuntimeError("API server did not start")
+
+    def stop(self):
+        self.process.terminate()
+        try:
+            self.process.wait(10)
+        except subprocess.TimeoutExpired:
+            self.process.kill()
+
+
+def run_http(case: Case, server: Server, requests_total: int, concurrency: int) -> Dict:
+    import requests
+
+    field_name = "files" if case.conversion_type == "merge-pdfs" else "file"
+    payloads = [(field_name, Path(path).name, Path(path).read_bytes()) for path in case.inputs]
+
+    def one_request():
+        files = [(name, (filename, data)) for name, filename, data in payloads]
+        data = dict(case.fields, conversion_type=case.conversion_type)
+        t0 = time.perf_counter()
+        response = requests.post(server.url + "/api/convert", files=files, data=data, timeout=3600)
+        elapsed = time.perf_counter() - t0
+        return elapsed, response.status_code, len(response.content)
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(concurrency) as clients:
+        results = list(clients.map(lambda _: one_request(), range(requests_total)))
+    wall = time.perf_counter() - started
+
+    ok = [r for r in results if r[1] == 200]
+    summary = summarize([r[0] for r in results], wall)
+    summary.update(
+        errors=len(results) - len(ok),
+        output_bytes=ok[-1][2] if ok else None,
+        server_peak_rss_mb=_process_tree_peak_rss_mb(server.process.pid),
+    )
+    return summary
+
+
+# Driver
+
+def git_commit() -> Optional[str]:
+    try:
+        return subprocess.check_output(["git", "rev-parse", "HEAD"], cwd=BACKEND_DIR, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(current: Dict, baseline_path: str):
+    with open(baseline_path) as f:
+        baseline = {(r["name"], r["mode"]): r for r in json.load(f)["results"]}
+    print(f"{'case':55} {'mode':7} {'p50 ms':>18} {'throughput/s':>20}")
+    for result in current["results"]:
+        before = baseline.get((result["name"], result["mode"]))
+        if not before or "latency_ms" not in result or "latency_ms" not in before:
+            continue
+        p50_old, p50_new = before["latency_ms"]["p50"], result["latency_ms"]["p50"]
+        tp_old, tp_new = before["throughput_per_s"], result["throughput_per_s"]
+        print(f"{result['name']:55} {result['mode']:7} {p50_old:8.1f} -> {p50_new:7.1f} {tp_old:9.2f} -> {tp_new:8.2f}")
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--profile", choices=sorted(PROFILES), default="quick")
+    parser.add_argument("--mode", choices=["direct", "http", "both"], default="both")
+    parser.add_argument("--iterations", type=int, default=3, help="direct calls per case")
+    parser.add_argument("--requests", type=int, default=8, help="HTTP requests per case")
+    parser.add_argument("--concurrency", type=int, default=4, help="concurrent HTTP clients")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="worker processes")
+    parser.add_argument("--only", help="run only cases whose name contains this text")
+    parser.add_argument("--workdir", default=str(BACKEND_DIR / ".bench"), help="where inputs are generated")
+    parser.add_argument("--output", help="write JSON results here instead of stdout")
+    parser.add_argument("--compare", help="print deltas against a previous JSON result file")
+    args = parser.parse_args(argv)
+
+    workdir = Path(args.workdir)
+    cases = [c for c in build_cases(args.profile, workdir) if not args.only or args.only in c.name]
+    modes = ["direct", "http"] if args.mode == "both" else [args.mode]
+
+    report = {
+        "commit": git_commit(),
+        "timestamp": time.time(),
+        "python": platform.python_version(),
+        "cpu_count": os.cpu_count(),
+        "profile": args.profile,
+        "workers": args.workers,
+        "results": [],
+    }
+
+    server = None
+    try:
+        if "http" in modes:
+            server = Server(args.workers, workdir)
+            server.wait_ready()
+        for case in cases:
+            for mode in modes:
+                result = {
+                    "name": case.name,
+                    "mode": mode,
+                    "conversion_type": case.conversion_type,
+                    "input_bytes": sum(os.path.getsize(p) for p in case.inputs),
+                }
+                if case.requires and shutil.which(case.requires) is None:
+                    result["status"] = f"skipped: {case.requires} not installed"
+                else:
+                    print(f"running {case.name} ({mode})", file=sys.stderr)
+                    try:
+                        if mode == "direct":
+                            result.update(run_direct(case, args.iterations, args.workers, workdir), iterations=args.iterations)
+                        else:
+                            result.update(run_http(case, server, args.requests, args.concurrency), concurrency=args.concurrency)
+                        result["status"] = "ok"
+                    except Exception as e:
+                        result["status"] = f"error: {e}"
+                report["results"].append(result)
+    finally:
+        if server is not None:
+            server.stop()
+
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output)
+    else:
+        print(output)
+    if args.compare:
+        compare(report, args.compare)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,149 @@
+"""Synthetic benchmark inputs generated locally and deterministically.
+
+Every generator takes an output path and writes the document there; the
+``ensure_*`` helpers reuse an existing file so repeated runs don't pay the
+generation cost again.
+"""
+
+import io
+import os
+import random
+from pathlib import Path
+from typing import Tuple
+
+import fitz  # PyMuPDF
+from PIL import Image, ImageDraw, ImageFilter
+
+WORDS = (
+    "lecture notes theorem proof equation derivative integral matrix vector "
+    "photosynthesis mitochondria enzyme protein history revolution economy "
+    "market supply demand algorithm complexity graph network memory process"
+).split()
+
+PAGE_WIDTH, PAGE_HEIGHT = 612, 792  # US Letter in points
+
+
+def _sentence(rng: random.Random, words: int = 12) -> str:
+    return " ".join(rng.choice(WORDS) for _ in range(words)).capitalize() + "."
+
+
+def _text_page_image(rng: random.Random, dpi: int = 150) -> Image.Image:
+    """A grayscale 'scan' of a page of text, with slight blur and noise."""
+    scale = dpi / 72
+    img = Image.new("L", (int(PAGE_WIDTH * scale), int(PAGE_HEIGHT * scale)), 250)
+    draw = ImageDraw.Draw(img)
+    y = int(60 * scale)
+    while y < img.height - int(60 * scale):
+        draw.text((int(60 * scale), y), _sentence(rng, 10), fill=20)
+        y += int(16 * scale)
+    img = img.filter(ImageFilter.GaussianBlur(0.6))
+    noise = Image.effect_noise(img.size, 12)
+    return Image.blend(img, noise, 0.08)
+
+
+def _photo(rng: random.Random, size: Tuple[int, int]) -> Image.Image:
+    """A photo-like RGB image: smooth gradients plus sensor noise."""
+    width, height = size
+    small = Image.new("RGB", (16, 12))
+    small.putdata([(rng.randrange(256), rng.randrange(256), rng.randrange(256)) for _ in range(16 * 12)])
+    img = small.resize(size, Image.BICUBIC)
+    noise = Image.merge("RGB", [Image.effect_noise(size, 24)] * 3)
+    return Image.blend(img, noise, 0.1)
+
+
+def text_pdf(path: str, pages: int, seed: int = 1):
+    rng = random.Random(seed)
+    doc = fitz.open()
+    for page_num in range(pages):
+        page = doc.new_page(width=PAGE_WIDTH, height=PAGE_HEIGHT)
+        page.insert_text((72, 60), f"Chapter {page_num + 1}", fontsize=18)
+        y = 90
+        while y < PAGE_HEIGHT - 60:
+            page.insert_text((72, y), _sentence(rng), fontsize=10)
+            y += 14
+    doc.save(path, garbage=3, deflate=True)
+    doc.close()
+
+
+def scanned_pdf(path: str, pages: int, seed: int = 2, dpi: int = 150):
+    rng = random.Random(seed)
+    doc = fitz.open()
+    for _ in range(pages):
+        buffer = io.BytesIO()
+        _text_page_image(rng, dpi).save(buffer, "JPEG", quality=75)
+        page = doc.new_page(width=PAGE_WIDTH, height=PAGE_HEIGHT)
+        page.insert_image(page.rect, stream=buffer.getvalue())
+    doc.save(path, garbage=3, deflate=True)
+    doc.close()
+
+
+def mixed_pdf(path: str, pages: int, seed: int = 3):
+    """Text pages where every third page also carries a large photo."""
+    rng = random.Random(seed)
+    doc = fitz.open()
+    for page_num in range(pages):
+        page = doc.new_page(width=PAGE_WIDTH, height=PAGE_HEIGHT)
+        y = 60
+        while y < PAGE_HEIGHT / 2:
+            page.insert_text((72, y), _sentence(rng), fontsize=10)
+            y += 14
+        if page_num % 3 == 0:
+            buffer = io.BytesIO()
+            _photo(rng, (2400, 1600)).save(buffer, "JPEG", quality=92)
+            page.insert_image(fitz.Rect(72, PAGE_HEIGHT / 2, PAGE_WIDTH - 72, PAGE_HEIGHT - 72), stream=buffer.getvalue())
+    doc.save(path, garbage=3, deflate=True)
+    doc.close()
+
+
+def photo_image(path: str, size: Tuple[int, int], seed: int = 4):
+    img = _photo(random.Random(seed), size)
+    if path.lower().endswith(".png"):
+        img.save(path, "PNG")
+    else:
+        img.save(path, "JPEG", quality=92)
+
+
+def docx_document(path: str, pages: int, seed: int = 5):
+    """A Word document of roughly ``pages`` pages: a heading and paragraphs per page."""
+    import docx
+
+    rng = random.Random(seed)
+    document = docx.Document()
+    for page_num in range(pages):
+        document.add_heading(f"Chapter {page_num + 1}", level=1)
+        for _ in range(6):
+            document.add_paragraph(" ".join(_sentence(rng) for _ in range(5)))
+    document.save(path)
+
+
+PDF_GENERATORS = {"text": text_pdf, "scanned": scanned_pdf, "mixed": mixed_pdf}
+
+
+def ensure_pdf(directory: Path, kind: str, pages: int) -> str:
+    path = directory / f"{kind}-{pages}p.pdf"
+    if not path.exists():
+        directory.mkdir(parents=True, exist_ok=True)
+        temp_path = f"{path}.tmp"
+        PDF_GENERATORS[kind](temp_path, pages)
+        os.replace(temp_path, path)
+    return str(path)
+
+
+def ensure_image(directory: Path, fmt: str, size: Tuple[int, int]) -> str:
+    path = directory / f"photo-{size[0]}x{size[1]}.{fmt}"
+    if not path.exists():
+        directory.mkdir(parents=True, exist_ok=True)
+        temp_path = f"{path}.tmp.{fmt}"
+        photo_image(temp_path, size)
+        os.replace(temp_path, path)
+    return str(path)
+
+
+def ensure_docx(directory: Path, pages: int) -> str:
+    path = directory / f"document-{pages}p.docx"
+    if not path.exists():
+        directory.mkdir(parents=True, exist_ok=True)
+        temp_path = f"{path}.tmp.docx"
+        docx_document(temp_path, pages)
+        os.replace(temp_path, path)
+    return str(path)
@@ -0,0 +1,244 @@
+"""Disk-backed, content-addressed cache of conversion results.
+
+Entries are keyed by the SHA-256 of the uploaded bytes plus the conversion
+type and every parameter that affects the output. Each entry is a directory
+holding the artifact (or nothing, for JSON results) and ``meta.json``; it is
+built under a temporary name and renamed into place, so readers never see a
+half-written entry. Hits are hard-linked into the caller's directory, which
+keeps serving safe even if eviction removes the entry meanwhile. Eviction is
+least-recently-used by ``meta.json`` mtime and is serialized across processes
+with a file lock. Each process keeps a running total of the cache size, so
+the entries are only walked when it crosses ``max_bytes``; a walk then trims
+the cache well below the limit and corrects the total for what other
+processes stored.
+"""
+
+import fcntl
+import hashlib
+import json
+import logging
+import os
+import shutil
+import tempfile
+import threading
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+CACHE_DIR = Path(os.getenv("CACHE_DIR", "./cache"))
+
+# Total size of cached artifacts before least-recently-used entries are evicted
+CACHE_MAX_BYTES = int(os.getenv("CACHE_MAX_BYTES", str(1024 * 1024 * 1024)))
+
+# Fraction of the limit an eviction trims the cache down to, so walks stay rare
+CACHE_EVICT_RATIO = float(os.getenv("CACHE_EVICT_RATIO", "0.9"))
+
+# Bump when a conversion's output changes so stale entries are never served
+CACHE_VERSION = "1"
+
+# Conversions whose output depends on a secret are never cached
+UNCACHEABLE_TYPES = {"pdf-protect", "pdf-unlock"}
+
+# Options each conversion reads; the others would only split its cache entries
+KEY_OPTIONS = {
+    "merge-pdfs": ("save_mode",),
+    "images-to-pdf": ("page_size", "max_dimension", "compression_level"),
+    "pipeline": (),
+    "pdf-to-docx": (),
+    "pdf-to-xlsx": (),
+    "pdf-to-pptx": (),
+    "docx-to-pdf": (),
+    "xlsx-to-pdf": (),
+    "pptx-to-pdf": (),
+    "jpg-to-png": ("max_dimension",),
+    "jpg-to-pdf": ("max_dimension",),
+    "png-to-pdf": ("max_dimension",),
+    "png-to-jpg": ("max_dimension",),
+    "image-to-text": (),
+    "pdf-to-text": ("page_ranges", "text_format"),
+    "pdf-ocr": ("ocr",),
+    "pdf-ocr-searchable": ("ocr",),
+    "image-compress": ("compression_level", "image_format", "max_dimension"),
+    "pdf-compress": ("compression_level", "compression_mode"),
+    "split-pdf": ("split_ranges", "save_mode"),
+}
+
+
+def key_params(conversion_type: str, options: Dict[str, Any]) -> Dict[str, Any]:
+    """Keep the options a conversion reads; unknown types keep them all"""
+    names = KEY_OPTIONS.get(conversion_type)
+    if names is None:
+        return dict(options)
+    return {name: options[name] for name in names}
+
+
+@dataclass
+class CacheEntry:
+    key: str
+    path: Optional[str]               # Artifact inside the cache, if any
+    filename: Optional[str]
+    stem_suffix: Optional[str]        # Filename minus the input's stem, if derived from it
+    media_type: Optional[str]
+    data: Optional[Dict[str, Any]]
+
+    def filename_for(self, stem: str) -> Optional[str]:
+        """Output filename for an upload with the given stem."""
+        if self.stem_suffix is not None:
+            return stem + self.stem_suffix
+        return self.filename
+
+
+def hash_file(path: str, chunk_size: int = 1024 * 1024) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def link_or_copy(source: str, target: str):
+    try:
+        os.link(source, target)
+    except OSError:
+        shutil.copyfile(source, target)
+
+
+class ResultCache:
+    def __init__(self, root: Path = CACHE_DIR, max_bytes: int = CACHE_MAX_BYTES):
+        self.root = Path(root)
+        self.max_bytes = max_bytes
+        self.root.mkdir(parents=True, exist_ok=True)
+        # Estimated bytes in the cache; None until the first walk
+        self._size: Optional[int] = None
+        self._size_lock = threading.Lock()
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_bytes > 0
+
+    def cacheable(self, conversion_type: str) -> bool:
+        return self.enabled and conversion_type not in UNCACHEABLE_TYPES
+
+    @staticmethod
+    def key(conversion_type: str, input_hashes: List[str], params: Dict[str, Any]) -> str:
+        material = json.dumps(
+            {"v": CACHE_VERSION, "type": conversion_type, "inputs": input_hashes, "params": params},
+            sort_keys=True,
+        )
+        return hashlib.sha256(material.encode()).hexdigest()
+
+    def _entry_dir(self, key: str) -> Path:
+        return self.root / key[:2] / key
+
+    def get(self, key: str) -> Optional[CacheEntry]:
+        entry_dir = self._entry_dir(key)
+        meta_path = entry_dir / "meta.json"
+        try:
+            with open(meta_path) as f:
+                meta = json.load(f)
+            # Touch for LRU ordering
+            os.utime(meta_path)
+        except (OSError, ValueError):
+            return None
+
+        path = str(entry_dir / meta["artifact"]) if meta.get("artifact") else None
+        if path is not None and not os.path.exists(path):
+            return None
+        return CacheEntry(
+            key=key,
+            path=path,
+            filename=meta.get("filename"),
+            stem_suffix=meta.get("stem_suffix"),
+            media_type=meta.get("media_type"),
+            data=meta.get("data"),
+        )
+
+    def put(
+        self,
+        key: str,
+        artifact_path: Optional[str],
+        filename: Optional[str],
+        stem: str,
+        media_type: Optional[str],
+        data: Optional[Dict[str, Any]],
+        evict: bool = True,
+    ):
+        """Store a result; pass ``evict=False`` when storing many and call ``evict()`` once after."""
+        entry_dir = self._entry_dir(key)
+        if entry_dir.exists():
+            return
+        entry_dir.parent.mkdir(parents=True, exist_ok=True)
+        staging = Path(tempfile.mkdtemp(dir=entry_dir.parent, prefix=".tmp-"))
+        try:
+            meta = {
+                "artifact": None,
+                "filename": filename,
+                "stem_suffix": filename[len(stem):] if filename and filename.startswith(stem) else None,
+                "media_type": media_type,
+                "data": data,
+                "size": 0,
+                "created_at": time.time(),
+            }
+            if artifact_path:
+                meta["artifact"] = "artifact" + Path(artifact_path).suffix
+                link_or_copy(artifact_path, str(staging / meta["artifact"]))
+                meta["size"] = os.path.getsize(artifact_path)
+            elif data is not None:
+                meta["size"] = len(json.dumps(data))
+            with open(staging / "meta.json", "w") as f:
+                json.dump(meta, f)
+            try:
+                os.rename(staging, entry_dir)
+            except OSError:
+                # Another worker stored the same result first
+                shutil.rmtree(staging, ignore_errors=True)
+            else:
+                with self._size_lock:
+                    if self._size is not None:
+                        self._size += meta["size"]
+        except Exception:
+            shutil.rmtree(staging, ignore_errors=True)
+            raise
+        if evict:
+            self.evict()
+
+    def _entries(self):
+        for bucket in self.root.iterdir():
+            if not bucket.is_dir():
+                continue
+            for entry_dir in bucket.iterdir():
+                if entry_dir.name.startswith(".tmp-"):
+                    continue
+                meta_path = entry_dir / "meta.json"
+                try:
+                    with open(meta_path) as f:
+                        size = json.load(f).get("size", 0)
+                    yield entry_dir, meta_path.stat().st_mtime, size
+                except (OSError, ValueError):
+                    continue
+
+    def evict(self):
+        """Remove least recently used entries once the cache outgrows ``max_bytes``.
+
+        Cheap while the running total is under the limit; otherwise the
+        entries are walked and removed down to ``CACHE_EVICT_RATIO`` of it.
+        """
+        with self._size_lock:
+            if self._size is not None and self._size <= self.max_bytes:
+                return
+        with open(self.root / ".lock", "w") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            entries = sorted(self._entries(), key=lambda entry: entry[1])
+            total = sum(size for _, _, size in entries)
+            if total > self.max_bytes:
+                target = int(self.max_bytes * CACHE_EVICT_RATIO)
+                for entry_dir, _, size in entries:
+                    if total <= target:
+                        break
+                    shutil.rmtree(entry_dir, ignore_errors=True)
+                    total -= size
+        with self._size_lock:
+            self._size = total
@@ -0,0 +1,403 @@
+"""Bulk conversion of directory trees, without going through the HTTP API.
+
+Run from the backend directory:
+
+    python cli.py archive/ out/ --conversion pdf-compress --compression-mode smart
+    python cli.py archive/ out/ --conversion pdf-to-text --workers 8
+
+Every matching file under the source directory is converted with the same
+engine modules that serve /api/convert, so engine optimizations benefit
+both. The API itself (main.py) is never imported, so no upload or cache
+directories appear where the CLI runs. Files are spread over a pool of
+worker processes, one file per task; outputs mirror the source tree under
+the output directory and are written under a temporary name, then renamed,
+so an interrupted run never leaves a truncated output behind.
+
+Progress is checkpointed in a manifest (``.manifest.jsonl`` in the output
+directory by default), one JSON line per finished file. A rerun skips files
+the manifest records as done with the same conversion settings: without
+reading them when their size and mtime are unchanged, otherwise after
+comparing their SHA-256. A file whose content was already converted under
+another path gets a hard link to the existing output. Failed files are
+retried on the next run. A worker process that crashes (a native library
+dying on a malformed file) takes the files in flight with it: the pool is
+replaced and those files are converted again one at a time, so only the
+file that crashes it is recorded as failed, and the run goes on.
+"""
+
+import argparse
+import json
+import logging
+import multiprocessing
+import os
+import sys
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+
+from fastapi import HTTPException
+
+import assembly
+import compression
+import imaging
+from cache import hash_file, link_or_copy
+from exporters import export_docx
+from extraction import iter_text_pages
+from ocr import OCR_DEFAULT_DPI, OCROptions, format_page, iter_ocr_pages, make_searchable, page_count
+
+logger = logging.getLogger("cli")
+
+PDF_EXTENSIONS = (".pdf",)
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".webp", ".tif", ".tiff", ".bmp")
+
+# Seconds between progress lines
+PROGRESS_INTERVAL = 5.0
+
+# Files in flight per worker process; bounds memory when a tree has many files
+FILES_PER_WORKER = 4
+
+
+def _write_text(output_path: str, text: str) -> str:
+    with open(output_path, "w", encoding="utf-8") as f:
+        f.write(text)
+    return output_path
+
+
+def _pdf_compress(source: str, output: str, settings: Dict) -> str:
+    return compression.compress(source, output, settings["compression_level"], mode=settings["compression_mode"])
+
+
+def _pdf_ocr(source: str, output: str, settings: Dict) -> str:
+    pages = iter_ocr_pages(source, _ocr_options(settings))
+    return _write_text(output, "".join(format_page(page) for page in pages))
+
+
+def _pdf_ocr_searchable(source: str, output: str, settings: Dict) -> str:
+    make_searchable(source, output, _ocr_options(settings))
+    return output
+
+
+def _pdf_to_text(source: str, output: str, settings: Dict) -> str:
+    return _write_text(output, "".join(page["text"] for page in iter_text_pages(source)))
+
+
+def _pdf_to_docx(source: str, output: str, settings: Dict) -> str:
+    return export_docx(source, output)
+
+
+def _image_to_pdf(source: str, output: str, settings: Dict) -> str:
+    return assembly.image_to_pdf(source, output, settings["max_dimension"])
+
+
+def _image_compress(source: str, output: str, settings: Dict) -> str:
+    # The extension of the returned path follows the format actually written
+    return imaging.convert_image(
+        source, output, settings["image_format"], settings["compression_level"], settings["max_dimension"]
+    )
+
+
+def _ocr_options(settings: Dict) -> OCROptions:
+    return OCROptions(dpi=settings["ocr_dpi"], language=settings["ocr_language"])
+
+
+@dataclass(frozen=True)
+class Conversion:
+    extensions: Tuple[str, ...]
+    suffix: str                              # Appended to the input's stem
+    run: Callable[..., str]
+    settings: Tuple[str, ...]                # Settings that change the output
+
+
+CONVERSIONS: Dict[str, Conversion] = {
+    "pdf-compress": Conversion(PDF_EXTENSIONS, "-compressed.pdf", _pdf_compress, ("compression_level", "compression_mode")),
+    "pdf-ocr": Conversion(PDF_EXTENSIONS, "-ocr.txt", _pdf_ocr, ("ocr_dpi", "ocr_language")),
+    "pdf-ocr-searchable": Conversion(PDF_EXTENSIONS, "-searchable.pdf", _pdf_ocr_searchable, ("ocr_dpi", "ocr_language")),
+    "pdf-to-text": Conversion(PDF_EXTENSIONS, ".txt", _pdf_to_text, ()),
+    "pdf-to-docx": Conversion(PDF_EXTENSIONS, ".docx", _pdf_to_docx, ()),
+    "image-to-pdf": Conversion(IMAGE_EXTENSIONS, ".pdf", _image_to_pdf, ("max_dimension",)),
+    "image-compress": Conversion(
+        IMAGE_EXTENSIONS, "-compressed.jpg", _image_compress, ("compression_level", "image_format", "max_dimension")
+    ),
+}
+
+
+def convert_file(conversion_type: str, source: str, output: str, settings: Dict) -> Dict:
+    """Convert one file in a worker process; never raises, failures are reported."""
+    conversion = CONVERSIONS[conversion_type]
+    staging = str(Path(output).with_name(f".partial-{os.getpid()}-{Path(output).name}"))
+    started = time.perf_counter()
+    try:
+        written = conversion.run(source, staging, settings)
+        # Keep the extension the conversion chose (image formats)
+        output = str(Path(output).with_suffix(Path(written).suffix))
+        os.replace(written, output)
+    except HTTPException as e:
+        return {"error": str(e.detail)}
+    except Exception as e:
+        return {"error": f"{type(e).__name__}: {e}"}
+    finally:
+        for leftover in Path(output).parent.glob(f".partial-{os.getpid()}-{Path(output).stem}*"):
+            leftover.unlink()
+    pages = 0
+    if source.lower().endswith(PDF_EXTENSIONS):
+        try:
+            pages = page_count(source)
+        except Exception:
+            pass
+    return {"output": output, "seconds": time.perf_counter() - started, "pages": pages}
+
+
+class Manifest:
+    """Append-only record of finished files; the last line for a path wins."""
+
+    def __init__(self, path: Path, fingerprint: Dict):
+        self.path = path
+        self.fingerprint = fingerprint
+        self.done: Dict[str, Dict] = {}            # Source path -> record
+        self.outputs: Dict[str, str] = {}          # SHA-256 -> output of a done file
+        if path.exists():
+            with open(path, encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        continue  # A line cut short by an interruption
+                    self._remember(record)
+        self._file = open(path, "a", encoding="utf-8")
+
+    def _remember(self, record: Dict):
+        source = record.get("source")
+        if record.get("status") == "done" and record.get("settings") == self.fingerprint:
+            self.done[source] = record
+            self.outputs[record["sha256"]] = record["output"]
+        else:
+            self.done.pop(source, None)
+
+    def record(self, record: Dict):
+        record = dict(record, settings=self.fingerprint, at=time.time())
+        self._file.write(json.dumps(record) + "\n")
+        self._file.flush()
+        self._remember(record)
+
+    def close(self):
+        self._file.close()
+
+
+def iter_sources(root: Path, extensions: Tuple[str, ...], exclude: Path) -> Iterator[Path]:
+    for directory, subdirectories, filenames in os.walk(root):
+        # Deterministic order, and never descend into the output tree
+        subdirectories[:] = sorted(
+            name for name in subdirectories
+            if not name.startswith(".") and Path(directory, name).resolve() != exclude
+        )
+        for filename in sorted(filenames):
+            if filename.lower().endswith(extensions) and not filename.startswith("."):
+                yield Path(directory, filename)
+
+
+class Progress:
+    def __init__(self, total: int, interval: float = PROGRESS_INTERVAL):
+        self.total = total
+        self.interval = interval
+        self.started = time.perf_counter()
+        self.last_report = self.started
+        self.done = self.skipped = self.linked = self.failed = 0
+        self.bytes_in = 0
+        self.pages = 0
+
+    def report(self, force: bool = False):
+        now = time.perf_counter()
+        if not force and now - self.last_report < self.interval:
+            return
+        self.last_report = now
+        elapsed = max(now - self.started, 1e-9)
+        finished = self.done + self.skipped + self.linked + self.failed
+        converted = self.done + self.failed
+        rate = converted / elapsed
+        remaining = self.total - finished
+        eta = f"{remaining / rate:.0f}s" if rate > 0 else "?"
+        logger.info(
+            f"{finished}/{self.total} files ({self.done} converted, {self.skipped} skipped, "
+            f"{self.linked} linked, {self.failed} failed) {rate:.2f} files/s "
+            f"{self.bytes_in / elapsed / 1024 / 1024:.2f} MB/s {self.pages / elapsed:.1f} pages/s eta {eta}"
+        )
+
+
+def run(args: argparse.Namespace) -> int:
+    conversion = CONVERSIONS[args.conversion]
+    source_root = Path(args.source).resolve()
+    output_root = Path(args.output).resolve()
+    output_root.mkdir(parents=True, exist_ok=True)
+    settings = {
+        "compression_level": args.compression_level,
+        "compression_mode": args.compression_mode,
+        "ocr_dpi": args.ocr_dpi,
+        "ocr_language": args.ocr_language,
+        "image_format": args.image_format,
+        "max_dimension": args.max_dimension,
+    }
+    fingerprint = {"conversion": args.conversion, **{name: settings[name] for name in conversion.settings}}
+    manifest = Manifest(Path(args.manifest) if args.manifest else output_root / ".manifest.jsonl", fingerprint)
+
+    sources = list(iter_sources(source_root, conversion.extensions, output_root))
+    progress = Progress(len(sources))
+    logger.info(f"{len(sources)} files to {args.conversion} with {args.workers} workers")
+
+    executor = _executor(args.workers)
+    pending = {}                                   # Future -> (entry, target, convert_file arguments)
+    duplicates: Dict[str, List] = {}               # SHA-256 in flight -> (entry, target) waiting for it
+    window = args.workers * FILES_PER_WORKER
+    interrupted = False
+    try:
+        for source in sources:
+            relative = str(source.relative_to(source_root))
+            stat = source.stat()
+            previous = manifest.done.get(relative)
+            if previous and previous["size"] == stat.st_size and previous["mtime_ns"] == stat.st_mtime_ns \
+                    and os.path.exists(previous["output"]):
+                progress.skipped += 1
+                progress.report()
+                continue
+
+            sha256 = hash_file(str(source))
+            entry = {"source": relative, "sha256": sha256, "size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+            target = output_root / Path(relative).parent / f"{source.stem}{conversion.suffix}"
+            target.parent.mkdir(parents=True, exist_ok=True)
+            existing = manifest.outputs.get(sha256)
+            if previous and previous["sha256"] == sha256 and os.path.exists(previous["output"]):
+                # Touched but unchanged; refresh size and mtime so the next run skips it unread
+                manifest.record(dict(entry, status="done", output=previous["output"]))
+                progress.skipped += 1
+            elif existing and os.path.exists(existing):
+                _link_output(existing, entry, target, manifest, progress)
+            elif sha256 in duplicates:
+                # The same bytes are being converted for another path
+                duplicates[sha256].append((entry, target))
+            else:
+                task = (args.conversion, str(source), str(target), settings)
+                future = executor.submit(convert_file, *task)
+                pending[future] = (entry, target, task)
+                duplicates[sha256] = []
+                if len(pending) >= window:
+                    executor = _collect_some(executor, pending, duplicates, manifest, progress, args.workers)
+            progress.report()
+        while pending:
+            executor = _collect_some(executor, pending, duplicates, manifest, progress, args.workers)
+            progress.report()
+    except KeyboardInterrupt:
+        interrupted = True
+        logger.warning("Interrupted; finished files are in the manifest, rerun to resume")
+        for future in pending:
+            future.cancel()
+    finally:
+        executor.shutdown(wait=not interrupted, cancel_futures=True)
+        manifest.close()
+    progress.report(force=True)
+    if interrupted:
+        return 130
+    return 1 if progress.failed else 0
+
+
+def _link_output(existing: str, entry: Dict, target: Path, manifest: Manifest, progress: Progress):
+    """Give ``target`` the output already converted from the same bytes."""
+    output = str(target.with_suffix(Path(existing).suffix))
+    if os.path.abspath(existing) != output:
+        if os.path.exists(output):
+            os.unlink(output)
+        link_or_copy(existing, output)
+    manifest.record(dict(entry, status="done", output=output))
+    progress.linked += 1
+
+
+def _executor(workers: int) -> ProcessPoolExecutor:
+    return ProcessPoolExecutor(workers, mp_context=multiprocessing.get_context("spawn"))
+
+
+def _collect_some(
+    executor: ProcessPoolExecutor, pending: Dict, duplicates: Dict, manifest: Manifest, progress: Progress, workers: int
+) -> ProcessPoolExecutor:
+    """Record at least one finished file; return the executor to submit to next."""
+    crashed = _collect(wait(pending, return_when=FIRST_COMPLETED).done, pending, duplicates, manifest, progress)
+    if not crashed:
+        return executor
+    # A worker died and took the pool with it; every file in flight failed with it
+    executor.shutdown(wait=False, cancel_futures=True)
+    crashed += _collect(wait(pending).done, pending, duplicates, manifest, progress)
+    logger.error(f"A worker process crashed; converting the {len(crashed)} files in flight one at a time")
+    for entry, _, _, _ in crashed:
+        manifest.record(dict(entry, status="failed", error="A worker process crashed"))
+
+    # Alone in the pool, only the file that crashes it fails
+    executor = _executor(workers)
+    for entry, target, task, waiting in crashed:
+        try:
+            result = executor.submit(convert_file, *task).result()
+        except BrokenProcessPool:
+            executor.shutdown(wait=False)
+            executor = _executor(workers)
+            result = {"error": "A worker process crashed converting this file"}
+        _record(entry, result, waiting, manifest, progress)
+    return executor
+
+
+def _collect(finished, pending: Dict, duplicates: Dict, manifest: Manifest, progress: Progress) -> List[Tuple]:
+    """Record finished files; return ``(entry, target, task, waiting)`` of those lost to a crashed worker."""
+    crashed = []
+    for future in finished:
+        entry, target, task = pending.pop(future)
+        waiting = duplicates.pop(entry["sha256"], [])
+        try:
+            result = future.result()
+        except BrokenProcessPool:
+            crashed.append((entry, target, task, waiting))
+            continue
+        _record(entry, result, waiting, manifest, progress)
+    return crashed
+
+
+def _record(entry: Dict, result: Dict, waiting: List, manifest: Manifest, progress: Progress):
+    if "error" in result:
+        # Identical bytes would fail the same way
+        for failed in [entry] + [duplicate for duplicate, _ in waiting]:
+            logger.error(f"{failed['source']}: {result['error']}")
+            manifest.record(dict(failed, status="failed", error=result["error"]))
+            progress.failed += 1
+        return
+    manifest.record(dict(entry, status="done", output=result["output"], seconds=round(result["seconds"], 3)))
+    progress.done += 1
+    progress.bytes_in += entry["size"]
+    progress.pages += result["pages"]
+    for duplicate, target in waiting:
+        _link_output(result["output"], duplicate, target, manifest, progress)
+
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Convert every matching file under a directory tree.")
+    parser.add_argument("source", help="Directory to walk")
+    parser.add_argument("output", help="Directory for the outputs, mirroring the source tree")
+    parser.add_argument("--conversion", required=True, choices=sorted(CONVERSIONS))
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="Worker processes (default: one per core)")
+    parser.add_argument("--manifest", help="Checkpoint manifest (default: OUTPUT/.manifest.jsonl)")
+    parser.add_argument("--compression-level", type=int, default=70)
+    parser.add_argument("--compression-mode", default="raster", choices=["raster", "smart"])
+    parser.add_argument("--ocr-dpi", type=int, default=OCR_DEFAULT_DPI)
+    parser.add_argument("--ocr-language", default="eng")
+    parser.add_argument("--image-format", default="auto")
+    parser.add_argument("--max-dimension", type=int, default=0)
+    args = parser.parse_args(argv)
+    args.workers = max(1, args.workers)
+    if not 1 <= args.compression_level <= 100:
+        parser.error("--compression-level must be between 1 and 100")
+    try:
+        imaging.validate_options(args.image_format, args.max_dimension)
+    except HTTPException as e:
+        parser.error(str(e.detail))
+    return args
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+    sys.exit(run(parse_args()))
@@ -0,0 +1,240 @@
+"""PDF compression engine.
+
+Two modes:
+
+* ``raster`` renders every page to a JPEG (the historical behaviour) but keeps
+  everything in memory: workers render page chunks straight to encoded JPEG
+  bytes and the coordinator inserts them with ``insert_image(stream=...)``.
+* ``smart`` keeps text and vector content untouched and only recompresses and
+  downsamples the embedded raster images in place, then garbage-collects and
+  deflates the document. Text-heavy PDFs stay searchable and shrink instead
+  of growing. Finding the images, replacing them and saving each run in one
+  worker task, and the images are re-encoded by the other workers in
+  parallel in chunks that each open the document once, so the coordinating
+  process only hands out work.
+"""
+
+import io
+import os
+from concurrent.futures import Executor
+from dataclasses import dataclass
+from typing import Callable, Dict, List, Optional, Tuple
+
+import fitz  # PyMuPDF
+from fastapi import HTTPException
+from PIL import Image
+
+from workers import iter_ordered, run_in_worker
+
+COMPRESSION_MODES = ("raster", "smart")
+
+# Pages rendered per worker task in raster mode
+COMPRESS_CHUNK_PAGES = int(os.getenv("COMPRESS_CHUNK_PAGES", "4"))
+
+# Images re-encoded per worker task in smart mode; each task opens the document once
+SMART_CHUNK_IMAGES = int(os.getenv("SMART_CHUNK_IMAGES", "8"))
+
+# Images smaller than this are not worth recompressing
+SMART_MIN_IMAGE_BYTES = int(os.getenv("SMART_MIN_IMAGE_BYTES", "8192"))
+
+# Save options that drop unused objects, merge duplicates and deflate streams
+SAVE_OPTIONS = dict(garbage=4, deflate=True, deflate_images=True, deflate_fonts=True)
+
+
+def validate_mode(mode: str) -> str:
+    if mode not in COMPRESSION_MODES:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Unsupported compression mode: {mode} (expected one of {', '.join(COMPRESSION_MODES)})",
+        )
+    return mode
+
+
+def raster_scale(quality: int) -> float:
+    # Map 10-100 to 0.2-1.0
+    return max(0.2, quality / 100)
+
+
+def target_dpi(quality: int) -> int:
+    """Resolution embedded images are downsampled to in smart mode."""
+    return int(72 + 2 * max(10, min(100, quality)))
+
+
+# Raster mode
+
+def render_page_range(pdf_path: str, start: int, end: int, quality: int) -> List[Tuple[float, float, bytes]]:
+    """Render pages to JPEG bytes; runs inside a worker process."""
+    scale = raster_scale(quality)
+    pages = []
+    with fitz.open(pdf_path) as doc:
+        for page_num in range(start, min(end, len(doc))):
+            page = doc.load_page(page_num)
+            pix = page.get_pixmap(matrix=fitz.Matrix(scale, scale), alpha=False)
+            pages.append((page.rect.width, page.rect.height, pix.tobytes("jpeg", jpg_quality=quality)))
+    return pages
+
+
+def compress_raster(
+    pdf_path: str,
+    output_path: str,
+    quality: int,
+    executor: Optional[Executor] = None,
+    progress: Optional[Callable[[int, int], None]] = None,
+):
+    with fitz.open(pdf_path) as doc:
+        total = len(doc)
+    chunks = ((pdf_path, start, start + COMPRESS_CHUNK_PAGES, quality) for start in range(0, total, COMPRESS_CHUNK_PAGES))
+
+    new_pdf = fitz.open()
+    try:
+        done = 0
+        for pages in iter_ordered(executor, render_page_range, chunks):
+            for width, height, jpeg in pages:
+                new_page = new_pdf.new_page(width=width, height=height)
+                new_page.insert_image(new_page.rect, stream=jpeg)
+            done += len(pages)
+            if progress:
+                progress(done, total)
+        new_pdf.save(output_path, deflate=True, garbage=3)
+    finally:
+        new_pdf.close()
+
+
+# Smart mode
+
+@dataclass
+class ImageCandidate:
+    xref: int
+    page_number: int   # 0-based page that displays the image
+    max_width: int     # Pixel size needed at the target DPI
+    max_height: int
+
+
+def find_image_candidates(doc: "fitz.Document", quality: int) -> List[ImageCandidate]:
+    """Collect each distinct embedded image with the largest size it is displayed at."""
+    dpi = target_dpi(quality)
+    candidates: Dict[int, ImageCandidate] = {}
+    for page in doc:
+        for info in page.get_images(full=True):
+            xref, smask = info[0], info[1]
+            # Images with soft masks would lose transparency as JPEG
+            if smask:
+                continue
+            rects = page.get_image_rects(xref)
+            if not rects:
+                continue
+            width = max(int(rect.width / 72 * dpi) for rect in rects)
+            height = max(int(rect.height / 72 * dpi) for rect in rects)
+            existing = candidates.get(xref)
+            if existing is None:
+                candidates[xref] = ImageCandidate(xref, page.number, width, height)
+            else:
+                existing.max_width = max(existing.max_width, width)
+                existing.max_height = max(existing.max_height, height)
+    return list(candidates.values())
+
+
+def recompress_image_bytes(data: bytes, max_width: int, max_height: int, quality: int) -> Optional[bytes]:
+    """Downsample and re-encode one image; return None if that would not help."""
+    if len(data) < SMART_MIN_IMAGE_BYTES:
+        return None
+    try:
+        img = Image.open(io.BytesIO(data))
+        # Let the JPEG decoder scale down by powers of two while decoding
+        img.draft("RGB", (max_width, max_height))
+        if img.mode not in ("RGB", "L"):
+            img = img.convert("RGB")
+        if img.width > max_width or img.height > max_height:
+            img.thumbnail((max(1, max_width), max(1, max_height)), Image.LANCZOS)
+        buffer = io.BytesIO()
+        img.save(buffer, "JPEG", quality=quality, optimize=True)
+    except Exception:
+        # Formats Pillow cannot decode (JBIG2, some JPX) are left as they are
+        return None
+    encoded = buffer.getvalue()
+    return encoded if len(encoded) < len(data) else None
+
+
+def recompress_image_chunk(pdf_path: str, images: List[Tuple[int, int, int]], quality: int) -> List[Optional[bytes]]:
+    """Re-encode ``(xref, max_width, max_height)`` images of one document; runs inside a worker process."""
+    with fitz.open(pdf_path) as doc:
+        return [
+            recompress_image_bytes(doc.extract_image(xref).get("image", b""), max_width, max_height, quality)
+            for xref, max_width, max_height in images
+        ]
+
+
+def scan_images(pdf_path: str, quality: int) -> List[ImageCandidate]:
+    """Find the images worth recompressing; runs inside a worker process."""
+    with fitz.open(pdf_path) as doc:
+        return find_image_candidates(doc, quality)
+
+
+def encode_images(
+    pdf_path: str,
+    candidates: List[ImageCandidate],
+    quality: int,
+    executor: Optional[Executor] = None,
+    progress: Optional[Callable[[int, int], None]] = None,
+) -> List[Tuple[int, int, bytes]]:
+    """Re-encode ``candidates`` of the file at ``pdf_path`` in chunks of
+    ``SMART_CHUNK_IMAGES`` per worker task.
+
+    Returns ``(page_number, xref, encoded)`` for the images that shrank.
+    """
+    chunks = [candidates[start:start + SMART_CHUNK_IMAGES] for start in range(0, len(candidates), SMART_CHUNK_IMAGES)]
+    results = iter_ordered(
+        executor,
+        recompress_image_chunk,
+        ((pdf_path, [(c.xref, c.max_width, c.max_height) for c in chunk], quality) for chunk in chunks),
+    )
+    replacements = []
+    done = 0
+    for chunk, encoded_chunk in zip(chunks, results):
+        for candidate, encoded in zip(chunk, encoded_chunk):
+            if encoded is not None:
+                replacements.append((candidate.page_number, candidate.xref, encoded))
+        done += len(chunk)
+        if progress:
+            progress(done, len(candidates))
+    return replacements
+
+
+def replace_images(doc: "fitz.Document", replacements: List[Tuple[int, int, bytes]]):
+    for page_number, xref, encoded in replacements:
+        doc[page_number].replace_image(xref, stream=encoded)
+
+
+def rewrite_images(pdf_path: str, output_path: str, replacements: List[Tuple[int, int, bytes]], save_options: Dict):
+    """Apply re-encoded images and save; runs inside a worker process."""
+    with fitz.open(pdf_path) as doc:
+        replace_images(doc, replacements)
+        doc.save(output_path, **save_options)
+    return output_path
+
+
+def compress_smart(
+    pdf_path: str,
+    output_path: str,
+    quality: int,
+    executor: Optional[Executor] = None,
+    progress: Optional[Callable[[int, int], None]] = None,
+):
+    candidates = run_in_worker(executor, scan_images, pdf_path, quality)
+    replacements = encode_images(pdf_path, candidates, quality, executor=executor, progress=progress)
+    run_in_worker(executor, rewrite_images, pdf_path, output_path, replacements, SAVE_OPTIONS)
+
+
+def compress(
+    pdf_path: str,
+    output_path: str,
+    quality: int = 70,
+    mode: str = "raster",
+    executor: Optional[Executor] = None,
+    progress: Optional[Callable[[int, int], None]] = None,
+):
+    if validate_mode(mode) == "smart":
+        compress_smart(pdf_path, output_path, quality, executor=executor, progress=progress)
+    else:
+        compress_raster(pdf_path, output_path, quality, executor=executor, progress=progress)
+    return output_path
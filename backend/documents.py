@@ -0,0 +1,99 @@
+"""Uploaded PDFs kept on the server so they can be previewed page by page.
+
+``POST /api/documents`` stores an upload under the SHA-256 of its bytes and
+returns that hash as the document id. The same file uploaded twice is stored
+once, and the id doubles as the content hash the preview cache is keyed by.
+Documents are hard-linked out of the request directory (no copy for uploads
+on the same filesystem) and removed once they have not been used for
+``DOCUMENT_TTL_SECONDS``; every lookup refreshes their mtime.
+"""
+
+import asyncio
+import logging
+import os
+import re
+import time
+from pathlib import Path
+from typing import Optional
+
+from cache import link_or_copy
+
+logger = logging.getLogger(__name__)
+
+# Stored documents unused for this long are removed
+DOCUMENT_TTL_SECONDS = int(os.getenv("DOCUMENT_TTL_SECONDS", str(24 * 3600)))
+
+# How often expired documents are removed
+DOCUMENT_SWEEP_INTERVAL_SECONDS = int(os.getenv("DOCUMENT_SWEEP_INTERVAL_SECONDS", "600"))
+
+DOCUMENT_ID_PATTERN = re.compile(r"^[0-9a-f]{64}$")
+
+
+class DocumentStore:
+    """Content-addressed PDFs with a sliding expiry."""
+
+    def __init__(self, root: Path, ttl: float = DOCUMENT_TTL_SECONDS, interval: float = DOCUMENT_SWEEP_INTERVAL_SECONDS):
+        self.root = Path(root)
+        self.ttl = ttl
+        self.interval = interval
+        self.root.mkdir(parents=True, exist_ok=True)
+        self._task: Optional[asyncio.Task] = None
+
+    def _path(self, document_id: str) -> Path:
+        return self.root / f"{document_id}.pdf"
+
+    def put(self, path: str, sha256: str) -> str:
+        """Store the file at ``path`` (whose hash is ``sha256``) and return its document id."""
+        target = self._path(sha256)
+        if target.exists():
+            os.utime(target)
+            return sha256
+        staging = self.root / f".tmp-{sha256}-{os.getpid()}-{time.monotonic_ns()}"
+        link_or_copy(path, str(staging))
+        os.replace(staging, target)
+        return sha256
+
+    def get(self, document_id: str) -> Optional[str]:
+        """Path of a stored document, or None if the id is unknown or expired."""
+        if not DOCUMENT_ID_PATTERN.match(document_id):
+            return None
+        path = self._path(document_id)
+        try:
+            os.utime(path)
+        except OSError:
+            return None
+        return str(path)
+
+    def sweep(self, now: Optional[float] = None) -> int:
+        """Delete documents (and abandoned staging files) unused for longer than the TTL."""
+        now = now or time.time()
+        removed = 0
+        for entry in self.root.iterdir():
+            try:
+                if now - entry.stat().st_mtime <= self.ttl:
+                    continue
+                entry.unlink()
+            except OSError:
+                continue
+            removed += 1
+        if removed:
+            logger.info(f"Removed {removed} expired documents")
+        return removed
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._sweeper())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    async def _sweeper(self):
+        while True:
+            try:
+                await asyncio.to_thread(self.sweep)
+            except Exception as e:
+                logger.error(f"Document sweep failed: {e}")
+            await asyncio.sleep(self.interval)
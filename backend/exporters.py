@@ -0,0 +1,276 @@
+"""PDF to Word, Excel and PowerPoint exporters.
+
+Each exporter has two halves. Worker processes reopen the PDF by path and
+turn a chunk of pages into small picklable descriptions: paragraphs with
+heading levels, table rows, or positioned text boxes and images. The
+coordinator receives the chunks in page order through ``iter_ordered``, which
+keeps only a bounded window in flight, and appends them to the output
+document. Spreadsheets use openpyxl's write-only mode, which streams rows to
+disk. python-docx and python-pptx keep their document in memory until it is
+saved, but only the extracted content is held, never PyMuPDF page objects.
+"""
+
+import os
+import re
+from collections import Counter
+from concurrent.futures import Executor
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+import fitz  # PyMuPDF
+
+from workers import iter_ordered
+
+# Pages handed to a worker per task
+EXPORT_CHUNK_PAGES = int(os.getenv("EXPORT_CHUNK_PAGES", "8"))
+
+# Text this much larger than the page's body text becomes a heading
+HEADING_SCALE = (1.6, 1.25)  # level 1, level 2; bold body-size lines become level 3
+
+# Excel limits sheet titles to 31 characters
+MAX_SHEET_TITLE = 31
+
+EMU_PER_POINT = 12700
+
+# Image formats PowerPoint embeds as-is; others are converted to PNG
+PPTX_IMAGE_EXTENSIONS = {"jpeg", "jpg", "png", "gif", "bmp", "tiff"}
+
+NUMBER_PATTERN = re.compile(r"^-?\d+(?:\.\d+)?$")
+
+# Characters XML 1.0 cannot hold; PDFs carry them (often as glyph codes) but
+# openpyxl, python-docx and python-pptx refuse them
+XML_ILLEGAL_PATTERN = re.compile("[\x00-\x08\x0b\x0c\x0e-\x1f\ud800-\udfff\ufffe\uffff]")
+
+
+def _iter_pages(
+    pdf_path: str,
+    extract: Callable,
+    executor: Optional[Executor],
+    progress: Optional[Callable[[int, int], None]],
+    chunk_pages: int = EXPORT_CHUNK_PAGES,
+) -> Iterator[Any]:
+    """Yield ``extract``'s per-page results in page order."""
+    with fitz.open(pdf_path) as doc:
+        total = len(doc)
+    chunk_pages = max(1, chunk_pages)
+    chunks = ((pdf_path, start, min(start + chunk_pages, total)) for start in range(0, total, chunk_pages))
+    done = 0
+    for pages in iter_ordered(executor, extract, chunks):
+        for page in pages:
+            yield page
+        done += len(pages)
+        if progress:
+            progress(done, total)
+
+
+def _xml_text(text: str) -> str:
+    return XML_ILLEGAL_PATTERN.sub("", text)
+
+
+def _block_text(block: Dict[str, Any]) -> str:
+    lines = [_xml_text("".join(span["text"] for span in line["spans"])).strip() for line in block["lines"]]
+    text = ""
+    for line in filter(None, lines):
+        # Rejoin words hyphenated across lines
+        if text.endswith("-") and line[:1].islower():
+            text = text[:-1] + line
+        else:
+            text = f"{text} {line}" if text else line
+    return text
+
+
+def _body_size(blocks: List[Dict[str, Any]]) -> float:
+    """Most common font size on the page, weighted by characters."""
+    sizes: Counter = Counter()
+    for block in blocks:
+        for line in block["lines"]:
+            for span in line["spans"]:
+                sizes[round(span["size"], 1)] += len(span["text"].strip())
+    return sizes.most_common(1)[0][0] if sizes else 0.0
+
+
+# Word
+
+def docx_page_range(pdf_path: str, start: int, end: int) -> List[List[Tuple[int, str]]]:
+    """Paragraphs of pages ``start`` to ``end - 1`` as ``(heading_level, text)``; level 0 is body text."""
+    pages = []
+    with fitz.open(pdf_path) as doc:
+        for page_num in range(start, end):
+            page = doc.load_page(page_num)
+            blocks = [b for b in page.get_text("dict", flags=fitz.TEXTFLAGS_TEXT)["blocks"] if b.get("lines")]
+            body = _body_size(blocks)
+            paragraphs = []
+            for block in blocks:
+                text = _block_text(block)
+                if not text:
+                    continue
+                spans = [span for line in block["lines"] for span in line["spans"] if span["text"].strip()]
+                size = max(span["size"] for span in spans)
+                bold = all(span["flags"] & 16 for span in spans)  # bit 4: bold
+                level = 0
+                if body and len(text) < 200:
+                    if size >= body * HEADING_SCALE[0]:
+                        level = 1
+                    elif size >= body * HEADING_SCALE[1]:
+                        level = 2
+                    elif bold and len(text) < 100 and len(blocks) > 1:
+                        level = 3
+                paragraphs.append((level, text))
+            pages.append(paragraphs)
+    return pages
+
+
+def export_docx(
+    pdf_path: str,
+    output_path: str,
+    executor: Optional[Executor] = None,
+    progress: Optional[Callable[[int, int], None]] = None,
+) -> str:
+    import docx
+
+    document = docx.Document()
+    for paragraphs in _iter_pages(pdf_path, docx_page_range, executor, progress):
+        for level, text in paragraphs:
+            if level:
+                document.add_heading(text, level=level)
+            else:
+                document.add_paragraph(text)
+    document.save(output_path)
+    return output_path
+
+
+# Excel
+
+def _cell_value(value: Optional[str]) -> Any:
+    if value is None:
+        return None
+    value = _xml_text(value).strip()
+    if NUMBER_PATTERN.match(value):
+        return float(value) if "." in value else int(value)
+    return value
+
+
+def xlsx_page_range(pdf_path: str, start: int, end: int) -> List[Tuple[int, List[List[List[Any]]], List[str]]]:
+    """``(page_number, tables, text_lines)`` for each page; text lines only when it has no tables."""
+    pages = []
+    with fitz.open(pdf_path) as doc:
+        for page_num in range(start, end):
+            page = doc.load_page(page_num)
+            tables = [
+                [[_cell_value(cell) for cell in row] for row in table.extract()]
+                for table in page.find_tables().tables
+            ]
+            lines = [] if tables else [line for line in page.get_text().splitlines() if line.strip()]
+            pages.append((page_num + 1, tables, lines))
+    return pages
+
+
+def export_xlsx(
+    pdf_path: str,
+    output_path: str,
+    executor: Optional[Executor] = None,
+    progress: Optional[Callable[[int, int], None]] = None,
+) -> str:
+    """One worksheet per detected table; text of pages without tables goes to a "Text" sheet."""
+    from openpyxl import Workbook
+
+    workbook = Workbook(write_only=True)
+    text_sheet = None
+    for page_number, tables, lines in _iter_pages(pdf_path, xlsx_page_range, executor, progress):
+        for index, rows in enumerate(tables, start=1):
+            title = f"Page {page_number}" if len(tables) == 1 else f"Page {page_number} Table {index}"
+            sheet = workbook.create_sheet(title[:MAX_SHEET_TITLE])
+            for row in rows:
+                sheet.append(row)
+        if lines:
+            if text_sheet is None:
+                text_sheet = workbook.create_sheet("Text")
+                text_sheet.append(["Page", "Text"])
+            for line in lines:
+                text_sheet.append([page_number, line])
+    if text_sheet is None and not workbook.worksheets:
+        # Empty document; a workbook needs at least one sheet
+        workbook.create_sheet("Text")
+    workbook.save(output_path)
+    return output_path
+
+
+# PowerPoint
+
+def pptx_page_range(pdf_path: str, start: int, end: int) -> List[Dict[str, Any]]:
+    """Text boxes and images of each page, positioned in points."""
+    pages = []
+    with fitz.open(pdf_path) as doc:
+        for page_num in range(start, end):
+            page = doc.load_page(page_num)
+            texts = []
+            for block in page.get_text("dict", flags=fitz.TEXTFLAGS_TEXT)["blocks"]:
+                text = _block_text(block) if block.get("lines") else ""
+                if not text:
+                    continue
+                sizes = [span["size"] for line in block["lines"] for span in line["spans"] if span["text"].strip()]
+                texts.append({"bbox": tuple(block["bbox"]), "text": text, "size": max(sizes)})
+            images = []
+            for info in page.get_image_info(xrefs=True):
+                xref = info.get("xref")
+                if not xref:
+                    continue  # Inline images have no xref to extract
+                extracted = doc.extract_image(xref)
+                data, ext = extracted.get("image"), extracted.get("ext", "")
+                if not data:
+                    continue
+                if ext not in PPTX_IMAGE_EXTENSIONS:
+                    pix = fitz.Pixmap(doc, xref)
+                    if pix.n - pix.alpha >= 4:
+                        pix = fitz.Pixmap(fitz.csRGB, pix)
+                    data, ext = pix.tobytes("png"), "png"
+                images.append({"bbox": tuple(info["bbox"]), "data": data, "ext": ext})
+            pages.append({"width": page.rect.width, "height": page.rect.height, "texts": texts, "images": images})
+    return pages
+
+
+def export_pptx(
+    pdf_path: str,
+    output_path: str,
+    executor: Optional[Executor] = None,
+    progress: Optional[Callable[[int, int], None]] = None,
+) -> str:
+    """One slide per page with the page's images and text boxes in place."""
+    from io import BytesIO
+
+    from pptx import Presentation
+    from pptx.util import Emu, Pt
+
+    presentation = Presentation()
+    blank_layout = presentation.slide_layouts[6]
+    sized = False
+    for page in _iter_pages(pdf_path, pptx_page_range, executor, progress):
+        if not sized:
+            # Slides take the size of the first page
+            presentation.slide_width = Emu(int(page["width"] * EMU_PER_POINT))
+            presentation.slide_height = Emu(int(page["height"] * EMU_PER_POINT))
+            sized = True
+        slide = presentation.slides.add_slide(blank_layout)
+        for image in page["images"]:
+            x0, y0, x1, y1 = image["bbox"]
+            if x1 <= x0 or y1 <= y0:
+                continue
+            slide.shapes.add_picture(
+                BytesIO(image["data"]),
+                Emu(int(x0 * EMU_PER_POINT)), Emu(int(y0 * EMU_PER_POINT)),
+                Emu(int((x1 - x0) * EMU_PER_POINT)), Emu(int((y1 - y0) * EMU_PER_POINT)),
+            )
+        for text in page["texts"]:
+            x0, y0, x1, y1 = text["bbox"]
+            box = slide.shapes.add_textbox(
+                Emu(int(x0 * EMU_PER_POINT)), Emu(int(y0 * EMU_PER_POINT)),
+                Emu(int(max(x1 - x0, 1) * EMU_PER_POINT)), Emu(int(max(y1 - y0, 1) * EMU_PER_POINT)),
+            )
+            frame = box.text_frame
+            frame.word_wrap = True
+            frame.margin_left = frame.margin_right = frame.margin_top = frame.margin_bottom = 0
+            frame.text = text["text"]
+            for paragraph in frame.paragraphs:
+                for run in paragraph.runs:
+                    run.font.size = Pt(round(text["size"], 1))
+    presentation.save(output_path)
+    return output_path
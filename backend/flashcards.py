@@ -0,0 +1,403 @@
+"""Flashcard generation pipeline.
+
+Text is cleaned up, split into sections (at headings, page breaks and blank
+lines) and packed into sentence-aligned chunks. Each chunk is turned into
+cards by a pluggable backend:
+
+* ``heuristic``: deterministic and offline; builds definition and
+  fill-in-the-blank cards from the chunk's sentences.
+* ``llm``: posts the chunk to an OpenAI-compatible chat completions endpoint
+  (``FLASHCARD_LLM_URL``), which may just as well be a local stub server.
+  Chunks the service fails on fall back to the heuristic backend.
+
+Cards are memoized per chunk hash in the result cache, so re-uploading a
+document, or an edited version of it, only regenerates the sections that
+changed. Near-identical cards are removed before the result is returned.
+"""
+
+import hashlib
+import json
+import logging
+import os
+import re
+import threading
+from concurrent.futures import Executor, ThreadPoolExecutor
+from dataclasses import dataclass
+from difflib import SequenceMatcher
+from typing import Dict, Iterator, List, Optional, Tuple
+
+import requests
+from fastapi import HTTPException
+
+from cache import ResultCache
+from workers import iter_ordered
+
+logger = logging.getLogger(__name__)
+
+# Backend used when the request does not pick one
+FLASHCARD_BACKEND = os.getenv("FLASHCARD_BACKEND", "heuristic")
+
+# Target size of a chunk of text handed to a backend
+FLASHCARD_CHUNK_CHARS = int(os.getenv("FLASHCARD_CHUNK_CHARS", "1500"))
+
+# Cards generated per chunk, and per document after deduplication
+FLASHCARD_CARDS_PER_CHUNK = int(os.getenv("FLASHCARD_CARDS_PER_CHUNK", "3"))
+FLASHCARD_MAX_CARDS = int(os.getenv("FLASHCARD_MAX_CARDS", "100"))
+
+# Cards whose question and answer are at least this similar are duplicates
+FLASHCARD_DUPLICATE_SIMILARITY = float(os.getenv("FLASHCARD_DUPLICATE_SIMILARITY", "0.85"))
+
+# Chunks per worker task for the heuristic backend
+FLASHCARD_TASK_CHUNKS = int(os.getenv("FLASHCARD_TASK_CHUNKS", "8"))
+
+# OpenAI-compatible chat completions endpoint for the llm backend
+FLASHCARD_LLM_URL = os.getenv("FLASHCARD_LLM_URL", "http://localhost:8080/v1/chat/completions")
+FLASHCARD_LLM_MODEL = os.getenv("FLASHCARD_LLM_MODEL", "local")
+FLASHCARD_LLM_API_KEY = os.getenv("FLASHCARD_LLM_API_KEY", "")
+FLASHCARD_LLM_TIMEOUT = float(os.getenv("FLASHCARD_LLM_TIMEOUT", "60"))
+FLASHCARD_LLM_CONCURRENCY = int(os.getenv("FLASHCARD_LLM_CONCURRENCY", "4"))
+
+# Bump when chunking or a backend changes so memoized cards are regenerated
+FLASHCARD_VERSION = "1"
+
+STOPWORDS = set("""
+a about above after again against all also an and any are as at be because been before being below between
+both but by can could did do does doing down during each either few for from further had has have having he
+her here hers him his how however i if in into is it its itself just many may might more most much must my
+no nor not now of off on once one only or other our out over own same she should so some such than that the
+their them then there these they this those through thus to too under until up upon us very was we were what
+when where which while who whom why will with within without would you your
+""".split())
+
+SENTENCE_PATTERN = re.compile(r"(?<=[.!?])\s+(?=[\"'(\[]?[A-Z0-9])")
+WORD_PATTERN = re.compile(r"[A-Za-z][A-Za-z\-']+")
+HEADING_PATTERN = re.compile(r"^(?:(?:chapter|section|part|unit|lesson)\s+\w+|\d+(?:\.\d+)*\.?\s+\S.*)$", re.IGNORECASE)
+DEFINITION_PATTERN = re.compile(
+    r"^(?P<term>(?:an?\s+|the\s+)?[A-Za-z][\w\-' ]{1,60}?)\s+"
+    r"(?P<verb>is defined as|refers to|is known as|is called|means|is|are)\s+"
+    r"(?P<definition>(?:an?|the|one|any)\b.{8,})$",
+    re.IGNORECASE,
+)
+
+ARTICLE_PATTERN = re.compile(r"^(?:an?|the)\s+", re.IGNORECASE)
+
+
+@dataclass
+class Chunk:
+    section: str
+    text: str
+
+    @property
+    def digest(self) -> str:
+        return hashlib.sha256(f"{self.section}\n{self.text}".encode()).hexdigest()
+
+
+# Text segmentation
+
+def _is_heading(line: str) -> bool:
+    words = line.split()
+    if not words or len(words) > 10 or len(line) > 80 or line[-1] in ".!?,;:":
+        return False
+    if HEADING_PATTERN.match(line):
+        return True
+    # Short Title Case or ALL CAPS lines
+    capitalized = sum(1 for word in words if word[:1].isupper())
+    return len(words) <= 8 and capitalized >= max(1, len(words) * 0.6)
+
+
+def split_sections(text: str) -> Iterator[Tuple[str, List[str]]]:
+    """Yield ``(heading, paragraphs)`` pairs in document order."""
+    heading = ""
+    paragraphs: List[str] = []
+    current: List[str] = []
+
+    def flush_paragraph():
+        if current:
+            paragraphs.append(" ".join(current))
+            current.clear()
+
+    # Rejoin words hyphenated across line breaks
+    text = re.sub(r"(\w)-\n(\w)", r"\1\2", text.replace("\r", ""))
+    for raw_line in re.split(r"\n|\f", text):
+        line = " ".join(raw_line.split())
+        if not line:
+            flush_paragraph()
+            continue
+        if _is_heading(line):
+            flush_paragraph()
+            if paragraphs:
+                yield heading, paragraphs
+                paragraphs = []
+            heading = line
+            continue
+        current.append(line)
+    flush_paragraph()
+    if paragraphs:
+        yield heading, paragraphs
+
+
+def split_sentences(paragraph: str) -> List[str]:
+    return [sentence.strip() for sentence in SENTENCE_PATTERN.split(paragraph) if sentence.strip()]
+
+
+def chunk_text(text: str, chunk_chars: int = FLASHCARD_CHUNK_CHARS) -> List[Chunk]:
+    """Pack each section's sentences into chunks of about ``chunk_chars``.
+
+    Chunks never straddle sections, so editing one section leaves the other
+    chunks (and their memoized cards) untouched.
+    """
+    chunks = []
+    for heading, paragraphs in split_sections(text):
+        sentences: List[str] = []
+        size = 0
+        for paragraph in paragraphs:
+            for sentence in split_sentences(paragraph):
+                if sentences and size + len(sentence) > chunk_chars:
+                    chunks.append(Chunk(heading, " ".join(sentences)))
+                    sentences, size = [], 0
+                sentences.append(sentence)
+                size += len(sentence) + 1
+        if sentences:
+            chunks.append(Chunk(heading, " ".join(sentences)))
+    return chunks
+
+
+# Backends
+
+class FlashcardBackend:
+    """Turns one chunk of text into question/answer cards."""
+
+    name = ""
+    io_bound = False  # Network backends run in threads, CPU backends in worker processes
+
+    @property
+    def version(self) -> str:
+        """Identifies the backend's configuration in memoization keys."""
+        return self.name
+
+    def generate(self, chunk: Chunk, limit: int) -> List[Dict[str, str]]:
+        raise NotImplementedError
+
+
+class HeuristicBackend(FlashcardBackend):
+    """Deterministic cards from definitions and key terms; no network needed."""
+
+    name = "heuristic"
+
+    def _keyword(self, sentence: str, counts: Dict[str, int]) -> Optional[str]:
+        candidates = [
+            word.strip("'-") for word in WORD_PATTERN.findall(sentence)
+            if len(word) > 3 and word.lower() not in STOPWORDS
+        ]
+        if not candidates:
+            return None
+        # Prefer terms repeated in the chunk, then proper nouns, then longer words
+        return max(candidates, key=lambda word: (counts.get(word.lower(), 0), word[:1].isupper(), len(word)))
+
+    def generate(self, chunk: Chunk, limit: int) -> List[Dict[str, str]]:
+        sentences = [s for s in split_sentences(chunk.text) if 30 <= len(s) <= 300]
+        counts: Dict[str, int] = {}
+        for word in WORD_PATTERN.findall(chunk.text):
+            counts[word.lower()] = counts.get(word.lower(), 0) + 1
+
+        cards = []
+        # Definitions make the best cards
+        for sentence in sentences:
+            match = DEFINITION_PATTERN.match(sentence.rstrip("."))
+            if match and len(match.group("term").split()) <= 6:
+                term = ARTICLE_PATTERN.sub("", match.group("term").strip())
+                verb = "are" if match.group("verb").lower() == "are" else "is"
+                cards.append({"question": f"What {verb} {term}?", "answer": sentence})
+        # Then fill in the blank on the sentences that mention the chunk's key terms
+        scored = []
+        for index, sentence in enumerate(sentences):
+            keyword = self._keyword(sentence, counts)
+            if keyword:
+                scored.append((counts.get(keyword.lower(), 0), -index, sentence, keyword))
+        for _, _, sentence, keyword in sorted(scored, reverse=True):
+            if len(cards) >= limit:
+                break
+            blanked = re.sub(rf"\b{re.escape(keyword)}\b", "_____", sentence, count=1)
+            question = f"{chunk.section}: {blanked}" if chunk.section else blanked
+            cards.append({"question": f"Fill in the blank. {question}", "answer": keyword})
+        return cards[:limit]
+
+
+class LLMBackend(FlashcardBackend):
+    """Cards from an OpenAI-compatible chat completions service."""
+
+    name = "llm"
+    io_bound = True
+
+    PROMPT = (
+        "Write up to {limit} study flashcards for the text below. Reply with JSON only, "
+        'in the form {{"flashcards": [{{"question": "...", "answer": "..."}}]}}.\n\n'
+        "Section: {section}\n\n{text}"
+    )
+
+    def __init__(
+        self,
+        url: str = FLASHCARD_LLM_URL,
+        model: str = FLASHCARD_LLM_MODEL,
+        api_key: str = FLASHCARD_LLM_API_KEY,
+        timeout: float = FLASHCARD_LLM_TIMEOUT,
+    ):
+        self.url = url
+        self.model = model
+        self.api_key = api_key
+        self.timeout = timeout
+        self.fallback = HeuristicBackend()
+        self._local = threading.local()
+
+    @property
+    def version(self) -> str:
+        return f"{self.name}:{self.model}"
+
+    def _session(self) -> requests.Session:
+        # Keep one connection per worker thread
+        if not hasattr(self._local, "session"):
+            self._local.session = requests.Session()
+            if self.api_key:
+                self._local.session.headers["Authorization"] = f"Bearer {self.api_key}"
+        return self._local.session
+
+    @staticmethod
+    def parse_cards(content: str) -> List[Dict[str, str]]:
+        # Models like to wrap JSON in prose or code fences
+        start, end = content.find("{"), content.rfind("}")
+        if start < 0 or end < start:
+            raise ValueError("no JSON object in the reply")
+        payload = json.loads(content[start:end + 1])
+        return [
+            {"question": str(card["question"]).strip(), "answer": str(card["answer"]).strip()}
+            for card in payload.get("flashcards", [])
+            if isinstance(card, dict) and card.get("question") and card.get("answer")
+        ]
+
+    def generate(self, chunk: Chunk, limit: int) -> List[Dict[str, str]]:
+        prompt = self.PROMPT.format(limit=limit, section=chunk.section or "(none)", text=chunk.text)
+        response = self._session().post(
+            self.url,
+            json={
+                "model": self.model,
+                "messages": [{"role": "user", "content": prompt}],
+                "temperature": 0,
+            },
+            timeout=self.timeout,
+        )
+        response.raise_for_status()
+        content = response.json()["choices"][0]["message"]["content"]
+        return self.parse_cards(content)[:limit]
+
+
+BACKENDS = {"heuristic": HeuristicBackend, "llm": LLMBackend}
+
+
+def get_backend(name: Optional[str] = None) -> FlashcardBackend:
+    name = name or FLASHCARD_BACKEND
+    if name not in BACKENDS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Unknown flashcard backend: {name} (expected one of {', '.join(BACKENDS)})",
+        )
+    return BACKENDS[name]()
+
+
+# Pipeline
+
+def _normalize(text: str) -> str:
+    return " ".join(re.findall(r"[a-z0-9]+", text.lower()))
+
+
+def deduplicate(cards: List[Dict[str, str]], threshold: float = FLASHCARD_DUPLICATE_SIMILARITY) -> List[Dict[str, str]]:
+    """Drop cards whose question and answer nearly repeat an earlier card's."""
+    kept: List[Dict[str, str]] = []
+    seen: List[Tuple[str, set]] = []
+    for card in cards:
+        normalized = _normalize(card["question"] + " " + card["answer"])
+        tokens = set(normalized.split())
+        duplicate = False
+        for other, other_tokens in seen:
+            # Cheap token overlap check first; the sequence ratio only for close calls
+            union = len(tokens | other_tokens) or 1
+            if len(tokens & other_tokens) / union < threshold * 0.75:
+                continue
+            if normalized == other or SequenceMatcher(None, normalized, other).ratio() >= threshold:
+                duplicate = True
+                break
+        if not duplicate:
+            kept.append(card)
+            seen.append((normalized, tokens))
+    return kept
+
+
+def generate_chunk_cards(backend: FlashcardBackend, chunks: List[Chunk], limit: int) -> List[List[Dict[str, str]]]:
+    """Cards for each chunk; runs in a worker process or thread."""
+    results = []
+    for chunk in chunks:
+        try:
+            results.append(backend.generate(chunk, limit))
+        except Exception as e:
+            fallback = getattr(backend, "fallback", None)
+            if fallback is None:
+                raise
+            logger.warning(f"{backend.name} flashcard backend failed, using {fallback.name}: {e}")
+            results.append(None)
+    return results
+
+
+def _memo_key(backend: FlashcardBackend, chunk: Chunk, limit: int) -> str:
+    return ResultCache.key("flashcards-chunk", [chunk.digest], {"backend": backend.version, "limit": limit, "v": FLASHCARD_VERSION})
+
+
+def generate_flashcards(
+    text: str,
+    backend: Optional[FlashcardBackend] = None,
+    cache: Optional[ResultCache] = None,
+    executor: Optional[Executor] = None,
+    cards_per_chunk: int = FLASHCARD_CARDS_PER_CHUNK,
+    max_cards: int = FLASHCARD_MAX_CARDS,
+) -> List[Dict[str, str]]:
+    """Chunk ``text``, generate cards for chunks not memoized yet, and deduplicate."""
+    backend = backend or get_backend()
+    chunks = chunk_text(text)
+    memo = cache if cache is not None and cache.enabled else None
+
+    cards_by_chunk: List[Optional[List[Dict[str, str]]]] = [None] * len(chunks)
+    missing = []
+    for index, chunk in enumerate(chunks):
+        entry = memo.get(_memo_key(backend, chunk, cards_per_chunk)) if memo else None
+        if entry is not None and entry.data is not None:
+            cards_by_chunk[index] = entry.data["cards"]
+        else:
+            missing.append(index)
+
+    if missing:
+        if backend.io_bound:
+            # Requests to a model service overlap in threads; the process pool stays free
+            task_size = 1
+            pool = ThreadPoolExecutor(max_workers=max(1, FLASHCARD_LLM_CONCURRENCY))
+        else:
+            task_size = max(1, FLASHCARD_TASK_CHUNKS)
+            pool = executor
+        batches = [missing[i:i + task_size] for i in range(0, len(missing), task_size)]
+        tasks = ((backend, [chunks[i] for i in batch], cards_per_chunk) for batch in batches)
+        try:
+            for batch, results in zip(batches, iter_ordered(pool, generate_chunk_cards, tasks)):
+                for index, cards in zip(batch, results):
+                    if cards is None:
+                        # The backend failed on this chunk; use the fallback and don't memoize it
+                        cards_by_chunk[index] = backend.fallback.generate(chunks[index], cards_per_chunk)
+                        continue
+                    cards_by_chunk[index] = cards
+                    if memo:
+                        key = _memo_key(backend, chunks[index], cards_per_chunk)
+                        memo.put(key, None, None, "", None, {"cards": cards}, evict=False)
+        finally:
+            if pool is not executor:
+                pool.shutdown(wait=False, cancel_futures=True)
+        if memo:
+            memo.evict()
+
+    cards = [card for chunk_cards in cards_by_chunk for card in chunk_cards or []]
+    return deduplicate(cards)[:max_cards]
@@ -0,0 +1,230 @@
+"""Image decoding and encoding for the image conversions.
+
+Phone-camera photos dominate image traffic: 12-50 megapixel JPEGs that are
+rotated through their EXIF orientation tag. The pipeline here avoids
+decoding them at full resolution whenever it can:
+
+* When the output has a ``max_dimension``, JPEGs are decoded in draft mode.
+  libjpeg scales the DCT blocks by 1/2, 1/4 or 1/8 while decoding, which is
+  several times faster than a full decode followed by a resize. The draft
+  size never goes below the target, and a LANCZOS resize finishes the job.
+* Images going into a PDF are handed to PyMuPDF as encoded bytes. A JPEG
+  that needs no resizing is embedded as-is, without being decoded at all.
+  Its EXIF rotation is applied through ``insert_image(rotate=...)``.
+* The EXIF orientation is baked into every re-encoded image, so outputs
+  display upright without relying on the viewer.
+
+Output formats are JPEG, PNG, WebP and, when a Pillow AVIF plugin is
+installed, AVIF. ``auto`` keeps photos as JPEG and sends images with
+transparency to WebP, which keeps the alpha channel and still compresses
+lossily. Every file is checked against ``IMAGE_MAX_PIXELS`` from its header
+before it is decoded, so a small file declaring a huge canvas (a
+decompression bomb) is rejected up front.
+"""
+
+import io
+import math
+import os
+from typing import Optional, Tuple
+
+from fastapi import HTTPException
+from PIL import Image, ImageOps, UnidentifiedImageError
+
+IMAGE_FORMATS = ("auto", "jpeg", "png", "webp", "avif")
+
+# Pillow format name, file extension and media type of each output format
+FORMAT_INFO = {
+    "jpeg": ("JPEG", ".jpg", "image/jpeg"),
+    "png": ("PNG", ".png", "image/png"),
+    "webp": ("WEBP", ".webp", "image/webp"),
+    "avif": ("AVIF", ".avif", "image/avif"),
+}
+
+# Largest image, in pixels, that is decoded at all
+IMAGE_MAX_PIXELS = int(os.getenv("IMAGE_MAX_PIXELS", str(120_000_000)))
+Image.MAX_IMAGE_PIXELS = IMAGE_MAX_PIXELS
+
+# Largest accepted max_dimension value
+IMAGE_MAX_DIMENSION_LIMIT = 20000
+
+# JPEG quality of images re-encoded for a PDF page
+IMAGE_PDF_QUALITY = int(os.getenv("IMAGE_PDF_QUALITY", "85"))
+
+# EXIF orientations that are pure rotations, as counter-clockwise degrees for insert_image
+EXIF_ROTATIONS = {1: 0, 3: 180, 6: 270, 8: 90}
+EXIF_ORIENTATION_TAG = 0x0112
+
+
+def avif_available() -> bool:
+    return ".avif" in Image.registered_extensions()
+
+
+def validate_image_format(image_format: str) -> str:
+    if image_format not in IMAGE_FORMATS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Unknown image format: {image_format} (expected one of {', '.join(IMAGE_FORMATS)})",
+        )
+    if image_format == "avif" and not avif_available():
+        raise HTTPException(status_code=400, detail="AVIF output is not available on this server")
+    return image_format
+
+
+def validate_max_dimension(max_dimension: int) -> int:
+    if not 0 <= max_dimension <= IMAGE_MAX_DIMENSION_LIMIT:
+        raise HTTPException(
+            status_code=400,
+            detail=f"max_dimension must be between 0 (no limit) and {IMAGE_MAX_DIMENSION_LIMIT}",
+        )
+    return max_dimension
+
+
+def extension(image_format: str) -> str:
+    return FORMAT_INFO[image_format][1]
+
+
+def media_type(image_format: str) -> str:
+    return FORMAT_INFO[image_format][2]
+
+
+def format_of_path(path: str) -> str:
+    """Output format of a file written by this module, from its extension."""
+    suffix = os.path.splitext(path)[1].lower()
+    for image_format, (_, ext, _) in FORMAT_INFO.items():
+        if suffix == ext:
+            return image_format
+    return "jpeg"
+
+
+def open_image(path: str) -> Image.Image:
+    """Open an image lazily and reject it if its declared size is too large."""
+    try:
+        image = Image.open(path)
+    except Image.DecompressionBombError:
+        raise HTTPException(status_code=413, detail=f"Image exceeds {IMAGE_MAX_PIXELS} pixels")
+    except UnidentifiedImageError:
+        raise HTTPException(status_code=400, detail=f"{os.path.basename(path)} is not a supported image")
+    if image.width * image.height > IMAGE_MAX_PIXELS:
+        image.close()
+        raise HTTPException(status_code=413, detail=f"Image exceeds {IMAGE_MAX_PIXELS} pixels")
+    return image
+
+
+def _fit(size: Tuple[int, int], max_dimension: int) -> Tuple[int, int]:
+    width, height = size
+    ratio = max_dimension / max(width, height)
+    return max(1, math.ceil(width * ratio)), max(1, math.ceil(height * ratio))
+
+
+def load_image(path: str, max_dimension: int = 0) -> Image.Image:
+    """Decode an image, at most ``max_dimension`` pixels on its long side, upright."""
+    image = open_image(path)
+    if max_dimension and max(image.size) > max_dimension:
+        # JPEG only: decode at the smallest 1/2^n scale that is still at least the target size
+        image.draft(image.mode, _fit(image.size, max_dimension))
+        image.thumbnail((max_dimension, max_dimension), Image.LANCZOS)
+    return ImageOps.exif_transpose(image)
+
+
+def has_alpha(image: Image.Image) -> bool:
+    return image.mode in ("RGBA", "LA", "PA") or (image.mode == "P" and "transparency" in image.info)
+
+
+def flatten(image: Image.Image, keep_alpha: bool) -> Image.Image:
+    """Convert to a mode every encoder accepts: RGB or L, or RGBA when keeping transparency."""
+    if has_alpha(image):
+        image = image.convert("RGBA")
+        if keep_alpha:
+            return image
+        background = Image.new("RGB", image.size, (255, 255, 255))
+        background.paste(image, mask=image.getchannel("A"))
+        return background
+    if image.mode not in ("RGB", "L"):
+        return image.convert("RGB")
+    return image
+
+
+def choose_format(image_format: str, image: Image.Image) -> str:
+    if image_format != "auto":
+        return image_format
+    return "webp" if has_alpha(image) else "jpeg"
+
+
+def encode(image: Image.Image, image_format: str, quality: int) -> bytes:
+    """Encode to ``image_format`` in memory, keeping the colour profile."""
+    options = {}
+    icc_profile = image.info.get("icc_profile")
+    if icc_profile:
+        options["icc_profile"] = icc_profile
+    if image_format == "jpeg":
+        image = flatten(image, keep_alpha=False)
+        options.update(quality=quality, optimize=True)
+    elif image_format == "webp":
+        image = flatten(image, keep_alpha=True)
+        options.update(quality=quality, method=4)
+    elif image_format == "avif":
+        image = flatten(image, keep_alpha=True)
+        options.update(quality=quality)
+    else:
+        image = flatten(image, keep_alpha=True)
+    buffer = io.BytesIO()
+    image.save(buffer, FORMAT_INFO[image_format][0], **options)
+    return buffer.getvalue()
+
+
+def convert_image(
+    input_path: str,
+    output_path: str,
+    image_format: str = "auto",
+    quality: int = 70,
+    max_dimension: int = 0,
+) -> str:
+    """Re-encode an image; returns the output path with the extension of the format used."""
+    image = load_image(input_path, max_dimension)
+    image_format = choose_format(image_format, image)
+    data = encode(image, image_format, quality)
+    output_path = os.path.splitext(output_path)[0] + extension(image_format)
+    with open(output_path, "wb") as f:
+        f.write(data)
+    return output_path
+
+
+def _exif_orientation(image: Image.Image) -> int:
+    try:
+        return image.getexif().get(EXIF_ORIENTATION_TAG, 1)
+    except Exception:
+        return 1
+
+
+def pdf_image(
+    path: str,
+    max_dimension: int = 0,
+    quality: int = IMAGE_PDF_QUALITY,
+    passthrough: bool = True,
+) -> Tuple[float, float, bytes, int]:
+    """Prepare an image for a PDF page: ``(width, height, encoded_bytes, rotate)``.
+
+    ``width`` and ``height`` are the upright size in pixels. With
+    ``passthrough``, JPEGs that fit and whose orientation is a plain rotation
+    are returned unchanged; everything else is decoded, resized, transposed
+    and encoded as JPEG (or PNG when it has transparency, which PDF images
+    keep through a soft mask).
+    """
+    image = open_image(path)
+    orientation = _exif_orientation(image)
+    fits = not max_dimension or max(image.size) <= max_dimension
+    if passthrough and image.format == "JPEG" and image.mode in ("RGB", "L") and fits and orientation in EXIF_ROTATIONS:
+        rotate = EXIF_ROTATIONS[orientation]
+        width, height = image.size if rotate in (0, 180) else image.size[::-1]
+        image.close()
+        with open(path, "rb") as f:
+            return width, height, f.read(), rotate
+
+    image = load_image(path, max_dimension)
+    image_format = "png" if has_alpha(image) else "jpeg"
+    return image.width, image.height, encode(image, image_format, quality), 0
+
+
+def validate_options(image_format: str, max_dimension: Optional[int]) -> None:
+    validate_image_format(image_format)
+    validate_max_dimension(max_dimension or 0)
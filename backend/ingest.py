@@ -0,0 +1,255 @@
+"""Streaming ingestion of multipart uploads.
+
+Starlette's form parser spools every file into a temporary file, which the
+endpoint then copied into its own directory: every byte hit the disk twice.
+``ingest_request`` parses the request body as it arrives and writes file
+parts straight into the destination directory in large chunks, hashing them
+and sniffing their type on the way. Byte caps are enforced while reading, so
+oversized uploads get a 413 without the rest of the body being read.
+Parsing, hashing and writing run in the threadpool, off the event loop.
+"""
+
+import hashlib
+import os
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Dict, List, Optional
+
+from fastapi import HTTPException, Request
+from multipart.multipart import MultipartParser, parse_options_header
+from starlette.concurrency import run_in_threadpool
+
+# Largest accepted single file
+INGEST_MAX_FILE_BYTES = int(os.getenv("INGEST_MAX_FILE_BYTES", str(200 * 1024 * 1024)))
+
+# Largest accepted request body (all files and fields together)
+INGEST_MAX_REQUEST_BYTES = int(os.getenv("INGEST_MAX_REQUEST_BYTES", str(1024 * 1024 * 1024)))
+
+# Maximum number of files per request
+INGEST_MAX_FILES = int(os.getenv("INGEST_MAX_FILES", "200"))
+
+# Network chunks are batched up to this size before each threadpool hop
+INGEST_CHUNK_BYTES = int(os.getenv("INGEST_CHUNK_BYTES", str(1024 * 1024)))
+
+# Form fields are small; anything larger is a malformed or hostile request
+MAX_FIELD_BYTES = 64 * 1024
+
+# Magic bytes of the formats we accept, checked against the start of each file
+MAGIC_TYPES = [
+    (b"%PDF-", "pdf"),
+    (b"\xff\xd8\xff", "jpeg"),
+    (b"\x89PNG\r\n\x1a\n", "png"),
+    (b"GIF87a", "gif"),
+    (b"GIF89a", "gif"),
+    (b"II*\x00", "tiff"),
+    (b"MM\x00*", "tiff"),
+    (b"BM", "bmp"),
+    (b"PK\x03\x04", "zip"),  # docx, xlsx and pptx are ZIP containers
+    (b"\xd0\xcf\x11\xe0\xa1\xb1\x1a\xe1", "ole"),  # legacy doc, xls and ppt
+]
+
+IMAGE_KINDS = {"jpeg", "png", "gif", "tiff", "bmp", "webp", "heif", "avif"}
+
+
+def sniff_type(head: bytes) -> Optional[str]:
+    for magic, kind in MAGIC_TYPES:
+        if head.startswith(magic):
+            return kind
+    if head[:4] == b"RIFF" and head[8:12] == b"WEBP":
+        return "webp"
+    if head[4:8] == b"ftyp":
+        return "avif" if head[8:12] in (b"avif", b"avis") else "heif"
+    # PDF allows up to 1 KB of junk before the header
+    if b"%PDF-" in head[:1024]:
+        return "pdf"
+    return None
+
+
+@dataclass
+class IngestedFile:
+    field_name: str
+    filename: str
+    path: str
+    size: int = 0
+    sha256: str = ""
+    kind: Optional[str] = None
+
+
+@dataclass
+class IngestedForm:
+    fields: Dict[str, str] = field(default_factory=dict)
+    files: List[IngestedFile] = field(default_factory=list)
+
+    def get(self, name: str, default: Optional[str] = None) -> Optional[str]:
+        value = self.fields.get(name)
+        return default if value is None or value == "" else value
+
+    def get_int(self, name: str, default: int) -> int:
+        value = self.get(name)
+        if value is None:
+            return default
+        try:
+            return int(value)
+        except ValueError:
+            raise HTTPException(status_code=400, detail=f"Field {name} must be an integer")
+
+    def get_bool(self, name: str, default: bool) -> bool:
+        value = self.get(name)
+        if value is None:
+            return default
+        return value.strip().lower() in ("1", "true", "yes", "on")
+
+    def files_for(self, *names: str) -> List[IngestedFile]:
+        return [f for f in self.files if f.field_name in names]
+
+
+def unique_path(directory: Path, filename: str) -> Path:
+    """Return a path in ``directory`` for ``filename`` that does not exist yet."""
+    name = Path(filename).name or "upload"
+    path = directory / name
+    counter = 1
+    while path.exists():
+        counter += 1
+        path = directory / f"{Path(name).stem}-{counter}{Path(name).suffix}"
+    return path
+
+
+class _MultipartWriter:
+    """python-multipart callbacks that write file parts directly to disk.
+
+    Every method runs in the threadpool, one chunk at a time.
+    """
+
+    def __init__(self, boundary: bytes, directory: Path, max_file_bytes: int, max_files: int):
+        self.directory = directory
+        self.max_file_bytes = max_file_bytes
+        self.max_files = max_files
+        self.form = IngestedForm()
+        self._header_name = b""
+        self._header_value = b""
+        self._disposition = b""
+        self._field_name: Optional[str] = None
+        self._field_data = bytearray()
+        self._file: Optional[IngestedFile] = None
+        self._handle = None
+        self._digest = None
+        self._head = b""
+        self.parser = MultipartParser(boundary, {
+            "on_part_begin": self.on_part_begin,
+            "on_part_data": self.on_part_data,
+            "on_part_end": self.on_part_end,
+            "on_header_field": self.on_header_field,
+            "on_header_value": self.on_header_value,
+            "on_header_end": self.on_header_end,
+            "on_headers_finished": self.on_headers_finished,
+        })
+
+    def feed(self, data: bytes):
+        self.parser.write(data)
+
+    def finish(self):
+        self.parser.finalize()
+
+    def close(self):
+        if self._handle is not None:
+            self._handle.close()
+            self._handle = None
+
+    def on_part_begin(self):
+        self._disposition = b""
+        self._field_name = None
+        self._field_data = bytearray()
+        self._file = None
+
+    def on_header_field(self, data: bytes, start: int, end: int):
+        self._header_name += data[start:end]
+
+    def on_header_value(self, data: bytes, start: int, end: int):
+        self._header_value += data[start:end]
+
+    def on_header_end(self):
+        if self._header_name.lower() == b"content-disposition":
+            self._disposition = self._header_value
+        self._header_name = b""
+        self._header_value = b""
+
+    def on_headers_finished(self):
+        _, options = parse_options_header(self._disposition)
+        if b"name" not in options:
+            raise HTTPException(status_code=400, detail='Multipart part is missing its "name"')
+        self._field_name = options[b"name"].decode("utf-8", errors="replace")
+        if b"filename" not in options:
+            return
+        if len(self.form.files) >= self.max_files:
+            raise HTTPException(status_code=413, detail=f"Too many files (maximum {self.max_files})")
+        filename = options[b"filename"].decode("utf-8", errors="replace")
+        path = unique_path(self.directory, filename)
+        self._file = IngestedFile(field_name=self._field_name, filename=filename, path=str(path))
+        self._handle = open(path, "wb")
+        self._digest = hashlib.sha256()
+        self._head = b""
+
+    def on_part_data(self, data: bytes, start: int, end: int):
+        chunk = data[start:end]
+        if self._file is None:
+            self._field_data += chunk
+            if len(self._field_data) > MAX_FIELD_BYTES:
+                raise HTTPException(status_code=413, detail=f"Field {self._field_name} is too large")
+            return
+        self._file.size += len(chunk)
+        if self._file.size > self.max_file_bytes:
+            raise HTTPException(
+                status_code=413,
+                detail=f"File {self._file.filename} exceeds the {self.max_file_bytes} byte limit",
+            )
+        if len(self._head) < 1024:
+            self._head += chunk[:1024 - len(self._head)]
+        self._digest.update(chunk)
+        self._handle.write(chunk)
+
+    def on_part_end(self):
+        if self._file is None:
+            if self._field_name is not None:
+                self.form.fields[self._field_name] = self._field_data.decode("utf-8", errors="replace")
+            return
+        self.close()
+        self._file.sha256 = self._digest.hexdigest()
+        self._file.kind = sniff_type(self._head)
+        self.form.files.append(self._file)
+        self._file = None
+
+
+async def ingest_request(
+    request: Request,
+    directory: str,
+    max_file_bytes: int = INGEST_MAX_FILE_BYTES,
+    max_request_bytes: int = INGEST_MAX_REQUEST_BYTES,
+    max_files: int = INGEST_MAX_FILES,
+) -> IngestedForm:
+    """Parse a multipart request, writing its files into ``directory``."""
+    content_type, params = parse_options_header(request.headers.get("content-type", ""))
+    if content_type != b"multipart/form-data" or b"boundary" not in params:
+        raise HTTPException(status_code=400, detail="Expected a multipart/form-data request")
+
+    content_length = request.headers.get("content-length")
+    if content_length and content_length.isdigit() and int(content_length) > max_request_bytes:
+        raise HTTPException(status_code=413, detail=f"Request exceeds the {max_request_bytes} byte limit")
+
+    writer = _MultipartWriter(params[b"boundary"], Path(directory), max_file_bytes, max_files)
+    received = 0
+    pending = bytearray()
+    try:
+        async for chunk in request.stream():
+            received += len(chunk)
+            if received > max_request_bytes:
+                raise HTTPException(status_code=413, detail=f"Request exceeds the {max_request_bytes} byte limit")
+            pending += chunk
+            if len(pending) >= INGEST_CHUNK_BYTES:
+                await run_in_threadpool(writer.feed, bytes(pending))
+                pending.clear()
+        if pending:
+            await run_in_threadpool(writer.feed, bytes(pending))
+        await run_in_threadpool(writer.finish)
+    finally:
+        writer.close()
+    return writer.form
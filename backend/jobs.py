@@ -0,0 +1,329 @@
+"""Asynchronous conversion jobs: submit, poll progress, download the result.
+
+Jobs are kept in a ``JobBackend``. ``LocalJobBackend`` holds them in process
+memory with an asyncio queue; another backend (for example one talking to a
+local Redis stand-in) only has to implement the same coroutine methods.
+Each job owns a directory on disk that holds its inputs, progress file and
+result until the janitor removes it after ``JOB_TTL_SECONDS``.
+"""
+
+import asyncio
+import json
+import logging
+import os
+import shutil
+import time
+import uuid
+from abc import ABC, abstractmethod
+from dataclasses import dataclass, field
+from enum import Enum
+from pathlib import Path
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+from fastapi import HTTPException
+
+from scheduler import AdmissionRejected
+from workers import WORKER_PROCESSES
+
+logger = logging.getLogger(__name__)
+
+# How long finished jobs (and their results) are kept on disk
+JOB_TTL_SECONDS = int(os.getenv("JOB_TTL_SECONDS", "3600"))
+
+# How often the janitor looks for expired jobs
+JOB_JANITOR_INTERVAL = int(os.getenv("JOB_JANITOR_INTERVAL", "60"))
+
+# Number of jobs executed concurrently
+JOB_CONCURRENCY = int(os.getenv("JOB_CONCURRENCY", str(WORKER_PROCESSES)))
+
+# Maximum number of queued jobs before submissions are rejected
+JOB_MAX_QUEUED = int(os.getenv("JOB_MAX_QUEUED", "100"))
+
+# Seconds a running job keeps retrying admission rejections before it fails
+JOB_ADMISSION_TIMEOUT = float(os.getenv("JOB_ADMISSION_TIMEOUT", "600"))
+
+
+class JobState(str, Enum):
+    QUEUED = "queued"
+    RUNNING = "running"
+    SUCCEEDED = "succeeded"
+    FAILED = "failed"
+
+
+class ProgressReporter:
+    """Picklable progress callback that publishes ``(done, total)`` to a file.
+
+    Conversions run in worker processes, so progress is written next to the
+    job instead of into the parent's memory. Writes are throttled to one per
+    ``interval`` seconds, except for the final page.
+    """
+
+    def __init__(self, path: str, interval: float = 0.5):
+        self.path = path
+        self.interval = interval
+        self._last_write = 0.0
+
+    def __call__(self, done: int, total: int):
+        now = time.monotonic()
+        if done < total and now - self._last_write < self.interval:
+            return
+        self._last_write = now
+        temp_path = f"{self.path}.{os.getpid()}.tmp"
+        with open(temp_path, "w") as f:
+            json.dump({"pages_done": done, "pages_total": total}, f)
+        os.replace(temp_path, self.path)
+
+    @staticmethod
+    def read(path: str) -> Optional[Dict[str, int]]:
+        try:
+            with open(path) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+
+@dataclass
+class Job:
+    id: str
+    conversion_type: str
+    directory: str
+    state: JobState = JobState.QUEUED
+    created_at: float = field(default_factory=time.time)
+    started_at: Optional[float] = None
+    finished_at: Optional[float] = None
+    error: Optional[str] = None
+    # Conversion arguments, set by the submitter and consumed by the handler
+    payload: Dict[str, Any] = field(default_factory=dict)
+    # Handler output (for the API, a ConversionResult)
+    result: Any = None
+
+    @property
+    def progress_path(self) -> str:
+        return os.path.join(self.directory, "progress.json")
+
+    def expired(self, now: float, ttl: float) -> bool:
+        return self.finished_at is not None and now - self.finished_at > ttl
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "job_id": self.id,
+            "conversion_type": self.conversion_type,
+            "state": self.state.value,
+            "created_at": self.created_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+            "progress": ProgressReporter.read(self.progress_path),
+            "error": self.error,
+        }
+
+
+class JobBackend(ABC):
+    """Storage and queue for jobs."""
+
+    async def start(self):
+        """Prepare the backend on the running event loop."""
+
+    @abstractmethod
+    async def put(self, job: Job):
+        """Store a new job and queue it for execution."""
+
+    @abstractmethod
+    async def next_job(self) -> Job:
+        """Wait for and return the next queued job."""
+
+    @abstractmethod
+    async def get(self, job_id: str) -> Optional[Job]:
+        """Return a job by id, or None if it is unknown or expired."""
+
+    @abstractmethod
+    async def save(self, job: Job):
+        """Persist state changes of a job."""
+
+    @abstractmethod
+    async def delete(self, job_id: str):
+        """Forget a job."""
+
+    @abstractmethod
+    async def all_jobs(self) -> List[Job]:
+        """Return every known job."""
+
+    @abstractmethod
+    async def queued_count(self) -> int:
+        """Return the number of jobs waiting to run."""
+
+
+class LocalJobBackend(JobBackend):
+    """In-process backend: a dict of jobs plus an asyncio queue of ids."""
+
+    def __init__(self):
+        self._jobs: Dict[str, Job] = {}
+        self._queue: Optional[asyncio.Queue] = None
+
+    async def start(self):
+        # Queues are bound to the loop they are first used on
+        self._queue = asyncio.Queue()
+        for job in self._jobs.values():
+            if job.state == JobState.QUEUED:
+                self._queue.put_nowait(job.id)
+
+    @property
+    def queue(self) -> asyncio.Queue:
+        if self._queue is None:
+            self._queue = asyncio.Queue()
+        return self._queue
+
+    async def put(self, job: Job):
+        self._jobs[job.id] = job
+        self.queue.put_nowait(job.id)
+
+    async def next_job(self) -> Job:
+        while True:
+            job_id = await self.queue.get()
+            job = self._jobs.get(job_id)
+            if job is not None:
+                return job
+
+    async def get(self, job_id: str) -> Optional[Job]:
+        return self._jobs.get(job_id)
+
+    async def save(self, job: Job):
+        self._jobs[job.id] = job
+
+    async def delete(self, job_id: str):
+        self._jobs.pop(job_id, None)
+
+    async def all_jobs(self) -> List[Job]:
+        return list(self._jobs.values())
+
+    async def queued_count(self) -> int:
+        return self.queue.qsize()
+
+
+class JobManager:
+    """Runs queued jobs with a fixed number of consumers and expires old ones."""
+
+    def __init__(
+        self,
+        root_dir: Path,
+        handler: Callable[[Job], Awaitable[Any]],
+        backend: Optional[JobBackend] = None,
+        concurrency: int = JOB_CONCURRENCY,
+        ttl: float = JOB_TTL_SECONDS,
+        janitor_interval: float = JOB_JANITOR_INTERVAL,
+        max_queued: int = JOB_MAX_QUEUED,
+        admission_timeout: float = JOB_ADMISSION_TIMEOUT,
+    ):
+        self.root_dir = Path(root_dir)
+        self.handler = handler
+        self.backend = backend or LocalJobBackend()
+        self.concurrency = max(1, concurrency)
+        self.ttl = ttl
+        self.janitor_interval = janitor_interval
+        self.max_queued = max_queued
+        self.admission_timeout = admission_timeout
+        self._tasks: List[asyncio.Task] = []
+
+    async def start(self):
+        self.root_dir.mkdir(parents=True, exist_ok=True)
+        if not self._tasks:
+            await self.backend.start()
+            self._tasks = [asyncio.create_task(self._consume()) for _ in range(self.concurrency)]
+            self._tasks.append(asyncio.create_task(self._janitor()))
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    def create(self, conversion_type: str) -> Job:
+        """Create a job and its directory; the caller fills in inputs and payload."""
+        job_id = uuid.uuid4().hex
+        directory = self.root_dir / job_id
+        directory.mkdir(parents=True)
+        return Job(id=job_id, conversion_type=conversion_type, directory=str(directory))
+
+    async def submit(self, job: Job) -> Job:
+        if await self.backend.queued_count() >= self.max_queued:
+            self.discard(job)
+            raise HTTPException(status_code=503, detail="Too many queued jobs, please retry later")
+        await self.backend.put(job)
+        return job
+
+    async def get(self, job_id: str) -> Optional[Job]:
+        return await self.backend.get(job_id)
+
+    def discard(self, job: Job):
+        shutil.rmtree(job.directory, ignore_errors=True)
+
+    async def _consume(self):
+        while True:
+            job = await self.backend.next_job()
+            try:
+                await self._run(job)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Job consumer error on {job.id}: {e}")
+
+    async def _run(self, job: Job):
+        job.state = JobState.RUNNING
+        job.started_at = time.time()
+        await self.backend.save(job)
+        deadline = time.monotonic() + self.admission_timeout
+        while True:
+            try:
+                job.result = await self.handler(job)
+                job.state = JobState.SUCCEEDED
+                break
+            except asyncio.CancelledError:
+                raise
+            except AdmissionRejected as e:
+                # The pools are saturated; wait for capacity rather than fail, up to a point
+                retry_after = float((e.headers or {}).get("Retry-After", 1))
+                if time.monotonic() + retry_after > deadline:
+                    job.error = f"Server stayed busy for {self.admission_timeout:.0f}s: {e.detail}"
+                    job.state = JobState.FAILED
+                    break
+                await asyncio.sleep(retry_after)
+            except HTTPException as e:
+                # Including a crashed worker: the same input would likely crash it again
+                job.error = str(e.detail)
+                job.state = JobState.FAILED
+                break
+            except Exception as e:
+                logger.error(f"Job {job.id} failed: {e}")
+                job.error = str(e)
+                job.state = JobState.FAILED
+                break
+        job.finished_at = time.time()
+        await self.backend.save(job)
+
+    async def expire(self, now: Optional[float] = None):
+        """Remove finished jobs older than the TTL and orphaned job directories."""
+        now = now or time.time()
+        known = set()
+        for job in await self.backend.all_jobs():
+            if job.expired(now, self.ttl):
+                await self.backend.delete(job.id)
+                self.discard(job)
+            else:
+                known.add(job.id)
+
+        # Directories left behind by a previous process
+        for entry in self.root_dir.iterdir():
+            if entry.name in known or not entry.is_dir():
+                continue
+            try:
+                if now - entry.stat().st_mtime > self.ttl:
+                    shutil.rmtree(entry, ignore_errors=True)
+            except OSError:
+                continue
+
+    async def _janitor(self):
+        while True:
+            await asyncio.sleep(self.janitor_interval)
+            try:
+                await self.expire()
+            except Exception as e:
+                logger.error(f"Job janitor failed: {e}")
@@ -1,30 +1,52 @@
 
-from fastapi import FastAPI, UploadFile, File, Form, HTTPException
+from fastapi import FastAPI, HTTPException, Query, Request
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import FileResponse, JSONResponse
+from fastapi.responses import JSONResponse, Response, StreamingResponse
+from starlette.background import BackgroundTask
+from starlette.concurrency import iterate_in_threadpool
 import os
-import tempfile
-import shutil
-import uuid
 from pathlib import Path
 import logging
-from typing import List, Dict, Any, Optional
+import asyncio
+from dataclasses import dataclass, field
+from typing import List, Dict, Any, Optional, Callable, AsyncIterator, Iterator, Tuple
+
+import assembly
+import compression
+import imaging
+import metrics
+import pipeline
+import previews
+import scheduler
+from archive import ZipStream
+from artifacts import ArtifactResponse, RequestDirectories
+from cache import ResultCache, key_params, link_or_copy
+from documents import DocumentStore
+from exporters import export_docx, export_pptx, export_xlsx
+from extraction import extract_pages, iter_text_pages, parse_page_ranges, validate_format
+from flashcards import FlashcardBackend, generate_flashcards, get_backend
+from ingest import IMAGE_KINDS, IngestedFile, IngestedForm, ingest_request, unique_path
+from jobs import Job, JobManager, JobState, ProgressReporter
+from singleflight import SingleFlight
+from office import PDF_FILTERS, OfficePool, convert_once
+from ocr import OCROptions, OCR_DEFAULT_DPI, iter_ocr_pages, format_page, make_searchable, page_count
+from workers import WorkerPool
 
 # Import utility libraries for file processing
 try:
     import fitz  # PyMuPDF
     import docx
-    from docx2pdf import convert
     from PIL import Image
     import pytesseract
     import requests
     import json
     from io import BytesIO
 except ImportError:
-    print("Please install required libraries: pip install pymupdf python-docx docx2pdf pillow pytesseract requests")
+    print("Please install required libraries: pip install pymupdf python-docx pillow pytesseract requests")
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
+metrics.install_log_filter()  # Stamp each log line with its request's trace ID
 logger = logging.getLogger(__name__)
 
 app = FastAPI(title="Smart Study Tool API")
@@ -33,6 +55,30 @@ app = FastAPI(title="Smart Study Tool API")
 UPLOAD_DIR = Path("./uploads")
 UPLOAD_DIR.mkdir(exist_ok=True)
 
+# Asynchronous jobs keep their inputs and results here until they expire
+JOBS_DIR = UPLOAD_DIR / "jobs"
+
+# Per-request working directories, removed after the response has been sent
+request_dirs = RequestDirectories(UPLOAD_DIR)
+
+# Pool of worker processes that runs the CPU-bound conversion functions
+worker_pool = WorkerPool()
+
+# Content-addressed cache of conversion results
+result_cache = ResultCache()
+
+# Identical conversions in flight at the same time, run once
+single_flight = SingleFlight()
+
+# Uploaded PDFs kept for previews, addressed by their SHA-256
+document_store = DocumentStore(UPLOAD_DIR / "documents")
+
+# Rendered page previews: memory LRU in front of a disk tier
+preview_cache = previews.PreviewCache()
+
+# Warm LibreOffice processes for docx/xlsx/pptx to PDF
+office_pool = OfficePool(UPLOAD_DIR / "office")
+
 # Enable CORS
 app.add_middleware(
     CORSMiddleware,
@@ -40,92 +86,107 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=[metrics.TRACE_HEADER],
 )
 
-# Sample AI function to generate flashcards from text
-def generate_flashcards_from_text(text: str) -> List[Dict[str, str]]:
-    """
-    This is a simple placeholder for a more sophisticated AI model.
-    In a real application, this would call an external AI API like OpenAI.
-    """
-    # For demo purposes, we'll create some simple flashcards based on text
-    # In a real app, this would call GPT or another AI API
-    
-    # ... keep existing code (generate flashcards logic)
+# Trace IDs, byte counts and per-stage timings of conversion requests
+app.add_middleware(metrics.TraceMiddleware, traced_paths=["/api/convert", "/api/flashcards", "/api/preview"])
+
+# Conversions whose processing throughput is reported in pages per second
+PAGE_CONVERSIONS = {"pdf-ocr", "pdf-ocr-searchable", "pdf-compress", "pdf-to-docx", "pdf-to-xlsx", "pdf-to-pptx"}
+
+@dataclass
+class ConversionOptions:
+    """Form parameters that tune a conversion"""
+    compression_level: int = 70                     # Default to 70% quality
+    compression_mode: str = "raster"                # "raster" or "smart" PDF compression
+    password: Optional[str] = None                  # For PDF protection/unlocking
+    split_ranges: Optional[str] = None              # For PDF splitting
+    save_mode: str = "compact"                      # "compact", "linear" or "incremental" for merge/split
+    ocr: OCROptions = field(default_factory=OCROptions)  # For PDF OCR
+    page_ranges: Optional[str] = None               # Pages to extract, e.g. "40-60"
+    text_format: str = "text"                       # "text", "blocks" or "words" for text extraction
+    stream: bool = False                            # Stream page results as they are produced
+    stream_format: str = "ndjson"                   # "ndjson", or "text" for plain streamed text
+    image_format: str = "auto"                      # "auto", "jpeg", "png", "webp" or "avif" for image compression
+    max_dimension: int = 0                          # Longest image side in pixels, 0 for no resizing
+    page_size: str = "image"                        # "image", "a4" or "letter" pages for images-to-pdf
+    steps: Optional[str] = None                     # JSON list of pipeline steps
+    progress: Optional[Callable[[int, int], None]] = None  # Called with (pages_done, pages_total)
+
+@dataclass
+class ConversionResult:
+    """Output of a conversion: either a file on disk or a JSON payload"""
+    path: Optional[str] = None
+    filename: Optional[str] = None
+    media_type: Optional[str] = None
+    data: Optional[Dict[str, Any]] = None
+    stream: Optional[AsyncIterator[bytes]] = None
+
+# Function to generate flashcards from text
+def generate_flashcards_from_text(
+    text: str,
+    backend: Optional[FlashcardBackend] = None,
+    executor=None,
+) -> List[Dict[str, str]]:
+    """Chunk the text and generate cards through the flashcard backend.
     
-    return flashcards
+    Cards are memoized per chunk in the result cache, so only new or edited
+    sections of a document are sent to the backend again.
+    """
+    return generate_flashcards(text, backend or get_backend(), cache=result_cache, executor=executor)
 
 # Function to extract text from PDF
-def extract_text_from_pdf(pdf_path: str) -> str:
+def extract_text_from_pdf(pdf_path: str, page_ranges: Optional[str] = None) -> str:
     try:
-        text = ""
-        with fitz.open(pdf_path) as doc:
-            for page in doc:
-                text += page.get_text()
-        return text
+        return "".join(page["text"] for page in iter_text_pages(pdf_path, page_ranges))
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Error extracting text from PDF: {e}")
         raise HTTPException(status_code=500, detail=f"Failed to extract text from PDF: {str(e)}")
 
+# Function to extract text from PDF, OCR'ing pages that have no text layer
+def extract_text_with_ocr_fallback(pdf_path: str, executor=None) -> str:
+    pages = iter_ocr_pages(pdf_path, OCROptions(), executor=executor)
+    return "\f".join(page.text for page in pages)
+
+# Function to generate flashcards from a PDF
+def flashcards_from_pdf(pdf_path: str, backend: Optional[FlashcardBackend] = None, executor=None) -> List[Dict[str, str]]:
+    text = extract_text_with_ocr_fallback(pdf_path, executor=executor)
+    return generate_flashcards_from_text(text, backend, executor=executor)
+
 # Function to compress images
-def compress_image(image_path: str, output_path: str, quality: int = 70):
+def compress_image(
+    image_path: str,
+    output_path: str,
+    quality: int = 70,
+    image_format: str = "auto",
+    max_dimension: int = 0,
+):
     try:
-        img = Image.open(image_path)
-        # Convert to RGB if necessary (for PNG with transparency)
-        if img.mode in ('RGBA', 'LA'):
-            background = Image.new('RGB', img.size, (255, 255, 255))
-            background.paste(img, mask=img.split()[3] if len(img.split()) > 3 else None)
-            img = background
-        
-        # Save with specified quality
-        img.save(output_path, optimize=True, quality=quality)
-        return output_path
+        # The extension of the returned path follows the format actually written
+        return imaging.convert_image(image_path, output_path, image_format, quality, max_dimension)
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Error compressing image: {e}")
         raise HTTPException(status_code=500, detail=f"Failed to compress image: {str(e)}")
 
 # Function to compress PDF
-def compress_pdf(pdf_path: str, output_path: str, quality: int = 70):
+def compress_pdf(
+    pdf_path: str,
+    output_path: str,
+    quality: int = 70,
+    progress: Optional[Callable[[int, int], None]] = None,
+    mode: str = "raster",
+    executor=None,
+):
     try:
-        # Open the PDF
-        pdf = fitz.open(pdf_path)
-        
-        # Create a new PDF
-        new_pdf = fitz.open()
-        
-        # Process each page
-        for page_num in range(len(pdf)):
-            page = pdf.load_page(page_num)
-            
-            # Render page to pixmap with compression
-            compression_factor = max(0.2, quality / 100)  # Map 10-100 to 0.2-1.0
-            dpi = int(72 * compression_factor)  # Lower DPI for more compression
-            
-            # Render page to pixmap
-            pix = page.get_pixmap(matrix=fitz.Matrix(compression_factor, compression_factor))
-            
-            # Create a new page in the output PDF
-            new_page = new_pdf.new_page(width=page.rect.width, height=page.rect.height)
-            
-            # Convert pixmap to image
-            img = Image.frombytes("RGB", [pix.width, pix.height], pix.samples)
-            
-            # Create a temporary image file
-            temp_img_path = f"{output_path}.temp.jpg"
-            img.save(temp_img_path, "JPEG", quality=quality)
-            
-            # Insert image into the PDF page
-            new_page.insert_image(new_page.rect, filename=temp_img_path)
-            
-            # Clean up temporary image
-            os.remove(temp_img_path)
-        
-        # Save the compressed PDF
-        new_pdf.save(output_path, deflate=True, garbage=3)
-        new_pdf.close()
-        pdf.close()
-        
-        return output_path
+        # Pages (raster) or embedded images (smart) are encoded in memory by the executor's workers
+        return compression.compress(pdf_path, output_path, quality, mode=mode, executor=executor, progress=progress)
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Error compressing PDF: {e}")
         raise HTTPException(status_code=500, detail=f"Failed to compress PDF: {str(e)}")
@@ -163,414 +224,933 @@ def unlock_pdf(pdf_path: str, output_path: str, password: str):
         raise HTTPException(status_code=500, detail=f"Failed to unlock PDF: {str(e)}")
 
 # Function to perform OCR on PDF
-def ocr_pdf(pdf_path: str):
+def ocr_pdf(
+    pdf_path: str,
+    progress: Optional[Callable[[int, int], None]] = None,
+    options: Optional[OCROptions] = None,
+    executor=None,
+):
     try:
-        # Open the PDF
-        pdf = fitz.open(pdf_path)
-        
-        text = ""
-        for page_num in range(len(pdf)):
-            page = pdf.load_page(page_num)
-            
-            # Render page to pixmap
-            pix = page.get_pixmap()
-            
-            # Convert to PIL Image
-            img = Image.frombytes("RGB", [pix.width, pix.height], pix.samples)
-            
-            # Perform OCR
-            page_text = pytesseract.image_to_string(img)
-            text += f"Page {page_num + 1}:\n{page_text}\n\n"
-        
-        pdf.close()
-        return text
+        # Pages are fanned out to the executor's workers and joined in order
+        pages = iter_ocr_pages(pdf_path, options, executor=executor, progress=progress)
+        return "".join(format_page(page) for page in pages)
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Error performing OCR on PDF: {e}")
         raise HTTPException(status_code=500, detail=f"Failed to perform OCR: {str(e)}")
 
-# Function to merge PDFs
-def merge_pdfs(pdf_paths: List[str], output_path: str):
+# Function to add an invisible OCR text layer to a PDF
+def ocr_pdf_searchable(
+    pdf_path: str,
+    output_path: str,
+    progress: Optional[Callable[[int, int], None]] = None,
+    options: Optional[OCROptions] = None,
+    executor=None,
+):
     try:
-        # Create a new PDF
-        merged_pdf = fitz.open()
-        
-        # Add each PDF to the merged PDF
-        for pdf_path in pdf_paths:
-            pdf = fitz.open(pdf_path)
-            merged_pdf.insert_pdf(pdf)
-            pdf.close()
-        
-        # Save the merged PDF
-        merged_pdf.save(output_path)
-        merged_pdf.close()
-        
+        # Text layers are recognized by the workers and appended to a copy of the input
+        ocr_pages = make_searchable(pdf_path, output_path, options, executor=executor, progress=progress)
+        logger.info(f"Added a text layer to {ocr_pages} pages")
         return output_path
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Error making PDF searchable: {e}")
+        raise HTTPException(status_code=500, detail=f"Failed to make PDF searchable: {str(e)}")
+
+# Function to merge PDFs
+def merge_pdfs(
+    pdf_paths: List[str],
+    output_path: str,
+    save_mode: str = "compact",
+    progress: Optional[Callable[[int, int], None]] = None,
+):
+    try:
+        # One source is open at a time; shared fonts and images are deduplicated on save
+        return assembly.merge(pdf_paths, output_path, save_mode=save_mode, progress=progress)
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Error merging PDFs: {e}")
         raise HTTPException(status_code=500, detail=f"Failed to merge PDFs: {str(e)}")
 
+# Function to run a multi-step pipeline on one in-memory document
+def run_pdf_pipeline(
+    pdf_paths: List[str],
+    output_path: str,
+    steps: List[pipeline.Step],
+    progress: Optional[Callable[[int, int], None]] = None,
+    executor=None,
+):
+    try:
+        # The steps run on one document; compress steps after a merge or unlock add a working copy
+        return pipeline.run_pipeline(pdf_paths, output_path, steps, executor=executor, progress=progress)
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Error running PDF pipeline: {e}")
+        raise HTTPException(status_code=500, detail=f"Failed to run pipeline: {str(e)}")
+
 # Function to split PDF
-def split_pdf(pdf_path: str, output_dir: str, ranges: str):
+def split_pdf(
+    pdf_path: str,
+    output_path: str,
+    ranges: List[tuple],
+    stem: str,
+    save_mode: str = "compact",
+    progress: Optional[Callable[[int, int], None]] = None,
+):
     try:
-        # Parse ranges (e.g., "1-3,4-10" or "1,3,5-7")
-        page_ranges = []
-        for range_str in ranges.split(','):
-            if '-' in range_str:
-                start, end = map(int, range_str.split('-'))
-                # Convert to 0-based indexing
-                page_ranges.append((start - 1, end))
-            else:
-                page_num = int(range_str)
-                # Convert to 0-based indexing
-                page_ranges.append((page_num - 1, page_num))
-        
-        # Open the PDF
-        pdf = fitz.open(pdf_path)
-        
-        # Create output directory if it doesn't exist
-        os.makedirs(output_dir, exist_ok=True)
-        
-        output_paths = []
-        for i, (start, end) in enumerate(page_ranges):
-            # Create a new PDF
-            new_pdf = fitz.open()
-            
-            # Add the specified pages
-            new_pdf.insert_pdf(pdf, from_page=start, to_page=end - 1)
-            
-            # Save the new PDF
-            output_path = os.path.join(output_dir, f"split_{i + 1}.pdf")
-            new_pdf.save(output_path)
-            new_pdf.close()
-            
-            output_paths.append(output_path)
-        
-        pdf.close()
-        
-        return output_paths
+        # All ranges are written in one pass: one PDF, or a ZIP of PDFs for several ranges
+        return assembly.split(pdf_path, output_path, ranges, stem, save_mode=save_mode, progress=progress)
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Error splitting PDF: {e}")
         raise HTTPException(status_code=500, detail=f"Failed to split PDF: {str(e)}")
 
 # Function to convert image to PDF
-def image_to_pdf(image_path: str, output_path: str):
+def image_to_pdf(image_path: str, output_path: str, max_dimension: int = 0):
+    try:
+        # The image goes into the page as encoded bytes; fitting JPEGs are not even decoded
+        return assembly.image_to_pdf(image_path, output_path, max_dimension)
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Error converting image to PDF: {e}")
+        raise HTTPException(status_code=500, detail=f"Failed to convert image to PDF: {str(e)}")
+
+# Function to assemble many images into one PDF
+def images_to_pdf(
+    image_paths: List[str],
+    output_path: str,
+    page_size: str = "image",
+    max_dimension: int = 0,
+    quality: int = 70,
+    progress: Optional[Callable[[int, int], None]] = None,
+    executor=None,
+):
+    try:
+        # Workers encode the images in parallel; pages are inserted here in upload order
+        return assembly.images_to_pdf(
+            image_paths, output_path, page_size, max_dimension, quality, executor=executor, progress=progress
+        )
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Error converting images to PDF: {e}")
+        raise HTTPException(status_code=500, detail=f"Failed to convert images to PDF: {str(e)}")
+
+# Function to convert PDF to a Word document with headings and paragraphs
+def pdf_to_docx(pdf_path: str, output_path: str, progress: Optional[Callable[[int, int], None]] = None, executor=None):
+    try:
+        return export_docx(pdf_path, output_path, executor=executor, progress=progress)
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Error converting PDF to Word: {e}")
+        raise HTTPException(status_code=500, detail=f"Failed to convert PDF to Word: {str(e)}")
+
+# Function to convert PDF tables to Excel worksheets
+def pdf_to_xlsx(pdf_path: str, output_path: str, progress: Optional[Callable[[int, int], None]] = None, executor=None):
+    try:
+        return export_xlsx(pdf_path, output_path, executor=executor, progress=progress)
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Error converting PDF to Excel: {e}")
+        raise HTTPException(status_code=500, detail=f"Failed to convert PDF to Excel: {str(e)}")
+
+# Function to convert PDF pages to PowerPoint slides
+def pdf_to_pptx(pdf_path: str, output_path: str, progress: Optional[Callable[[int, int], None]] = None, executor=None):
+    try:
+        return export_pptx(pdf_path, output_path, executor=executor, progress=progress)
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Error converting PDF to PowerPoint: {e}")
+        raise HTTPException(status_code=500, detail=f"Failed to convert PDF to PowerPoint: {str(e)}")
+
+# Function to convert Word document to PDF (one-shot; the API uses the warm office pool)
+def docx_to_pdf(docx_path: str, output_path: str):
+    return convert_once("docx-to-pdf", docx_path, output_path)
+
+# Function to convert JPG to PNG
+def jpg_to_png(image_path: str, output_path: str, max_dimension: int = 0):
+    return imaging.convert_image(image_path, output_path, "png", max_dimension=max_dimension)
+
+# Function to convert PNG to JPG
+def png_to_jpg(image_path: str, output_path: str, max_dimension: int = 0):
+    # Transparent areas are flattened onto white
+    return imaging.convert_image(image_path, output_path, "jpeg", quality=95, max_dimension=max_dimension)
+
+# Function to perform OCR on an image
+def image_to_text(image_path: str) -> str:
+    image = Image.open(image_path)
+    return pytesseract.image_to_string(image)
+
+@app.on_event("startup")
+async def start_worker_pool():
+    worker_pool.start()
+    await office_pool.start()
+    await job_manager.start()
+    request_dirs.start()
+    document_store.start()
+
+@app.on_event("shutdown")
+async def stop_worker_pool():
+    await request_dirs.stop()
+    await document_store.stop()
+    await job_manager.stop()
+    await office_pool.stop()
+    worker_pool.shutdown()
+
+# Quota key of the client behind a request: its auth token or its IP address
+def request_client(request: Request) -> str:
+    return scheduler.client_key(request.headers.get("authorization"), request.client.host if request.client else None)
+
+@app.post("/api/flashcards")
+async def create_flashcards(request: Request):
+    """Upload a PDF and convert it to flashcards
+    
+    Multipart fields: file and, optionally, backend ("heuristic" or "llm").
+    """
+    temp_dir = request_dirs.create()
+    trace = metrics.current_trace()
+    trace.conversion_type = "flashcards"
     try:
-        # Open the image
-        img = Image.open(image_path)
+        with trace.stage("upload"):
+            form = await ingest_request(request, temp_dir)
+        uploads = form.files_for("file")
+        if not uploads:
+            raise HTTPException(status_code=400, detail="No file uploaded")
+        if uploads[0].kind != "pdf":
+            raise HTTPException(status_code=400, detail=f"{uploads[0].filename} is not a PDF")
         
-        # Convert to RGB if necessary
-        if img.mode != 'RGB':
-            img = img.convert('RGB')
+        backend = get_backend(form.get("backend"))
         
-        # Create a new PDF
-        pdf = fitz.open()
+        cost = await asyncio.to_thread(scheduler.estimate_cost, "flashcards", [uploads[0].path], ["pdf"])
+        with trace.stage("processing"), scheduler.demand(scheduler.Demand(request_client(request), cost)):
+            flashcards = await worker_pool.run_fanout("flashcards", flashcards_from_pdf, uploads[0].path, backend)
+        return {"flashcards": flashcards}
+    finally:
+        request_dirs.release(temp_dir)
+
+# Whether a conversion type takes several uploaded files
+def is_batch_conversion(conversion_type: str) -> bool:
+    return conversion_type.startswith("batch-") or conversion_type in ("merge-pdfs", "images-to-pdf")
+
+# Whether a conversion type accepts one file or several (pipelines starting with merge-pdfs)
+def is_multi_file_conversion(conversion_type: str) -> bool:
+    return is_batch_conversion(conversion_type) or conversion_type == "pipeline"
+
+# Build conversion options from the form fields of /api/convert and /api/jobs
+def options_from_form(form: IngestedForm) -> ConversionOptions:
+    return ConversionOptions(
+        compression_level=form.get_int("compression_level", 70),      # Default to 70% quality
+        compression_mode=form.get("compression_mode", "raster"),       # "raster" or "smart" PDF compression
+        password=form.get("password"),                                  # For PDF protection/unlocking
+        split_ranges=form.get("split_ranges"),                          # For PDF splitting
+        save_mode=form.get("save_mode", "compact"),                     # For PDF merging/splitting
+        ocr=OCROptions(                                                 # For PDF OCR
+            dpi=form.get_int("ocr_dpi", OCR_DEFAULT_DPI),
+            grayscale=form.get_bool("ocr_grayscale", True),
+            language=form.get("ocr_language", "eng"),
+        ),
+        page_ranges=form.get("pages"),                                  # For text extraction
+        text_format=form.get("text_format", "text"),                    # For text extraction
+        stream=form.get_bool("stream", False),                          # Stream pages as they are produced
+        stream_format=form.get("stream_format", "ndjson"),              # NDJSON or plain text
+        image_format=form.get("image_format", "auto"),                  # For image compression
+        max_dimension=form.get_int("max_dimension", 0),                 # For image conversions
+        page_size=form.get("page_size", "image"),                       # For images to PDF
+        steps=form.get("steps"),                                        # For pipelines
+    )
+
+# Kind of upload (as sniffed from its magic bytes) a conversion type expects
+def expected_upload_kind(conversion_type: str) -> Optional[str]:
+    if conversion_type.startswith("pdf-") or conversion_type in ("split-pdf", "merge-pdfs", "batch-compress", "pipeline"):
+        return "pdf"
+    if conversion_type.startswith(("jpg-", "png-", "image-")) or conversion_type in ("batch-compress-images", "batch-convert-to-pdf", "images-to-pdf"):
+        return "image"
+    if conversion_type in PDF_FILTERS:
+        return "office"
+    return None
+
+# Pick the uploads a conversion uses and reject files of the wrong type early
+def select_uploads(form: IngestedForm, conversion_type: str) -> List[IngestedFile]:
+    if is_batch_conversion(conversion_type):
+        uploads = form.files_for("files")
+    elif is_multi_file_conversion(conversion_type):
+        uploads = form.files_for("files", "file")
+    else:
+        uploads = form.files_for("file")[:1]
+    
+    expected = expected_upload_kind(conversion_type)
+    for upload in uploads:
+        if expected == "pdf" and upload.kind != "pdf":
+            raise HTTPException(status_code=400, detail=f"{upload.filename} is not a PDF")
+        if expected == "image" and upload.kind is not None and upload.kind not in IMAGE_KINDS:
+            raise HTTPException(status_code=400, detail=f"{upload.filename} is not an image")
+        if expected == "office" and upload.kind not in ("zip", "ole"):
+            raise HTTPException(status_code=400, detail=f"{upload.filename} is not an office document")
+    return uploads
+
+# Parameters that change a conversion's output, used in the cache key
+def cache_params(conversion_type: str, options: ConversionOptions) -> Dict[str, Any]:
+    return key_params(conversion_type, {
+        "compression_level": options.compression_level,
+        "compression_mode": options.compression_mode,
+        "split_ranges": options.split_ranges,
+        "save_mode": options.save_mode,
+        "ocr": [options.ocr.dpi, options.ocr.grayscale, options.ocr.language, options.ocr.skip_text_layer],
+        "page_ranges": options.page_ranges,
+        "text_format": options.text_format,
+        "image_format": options.image_format,
+        "max_dimension": options.max_dimension,
+        "page_size": options.page_size,
+    })
+
+# Per-file function and output name suffix of each batch conversion
+BATCH_CONVERSIONS = {
+    "batch-compress": (compress_pdf, "-compressed.pdf"),
+    "batch-compress-images": (compress_image, "-compressed.jpg"),
+    "batch-convert-to-pdf": (image_to_pdf, ".pdf"),
+}
+
+def batch_arguments(conversion_type: str, input_path: str, output_path: str, options: ConversionOptions) -> tuple:
+    if conversion_type == "batch-compress":
+        return (input_path, output_path, options.compression_level, None, options.compression_mode)
+    if conversion_type == "batch-compress-images":
+        return (input_path, output_path, options.compression_level, options.image_format, options.max_dimension)
+    if conversion_type == "batch-convert-to-pdf":
+        return (input_path, output_path, options.max_dimension)
+    return (input_path, output_path)
+
+async def run_batch(
+    conversion_type: str,
+    input_paths: List[str],
+    work_dir: str,
+    options: ConversionOptions,
+) -> ConversionResult:
+    """Convert all files concurrently and stream a ZIP with a per-file manifest"""
+    if conversion_type == "batch-compress":
+        compression.validate_mode(options.compression_mode)
+    else:
+        imaging.validate_options(options.image_format, options.max_dimension)
+    fn, suffix = BATCH_CONVERSIONS[conversion_type]
+    output_dir = Path(work_dir) / "batch"
+    output_dir.mkdir(exist_ok=True)
+    
+    # The whole batch is admitted once; its files then share the pool with everyone else
+    release = await worker_pool.acquire(conversion_type)
+    
+    async def convert_one(index: int, input_path: str):
+        output_path = output_dir / f"{index}-{Path(input_path).stem}{suffix}"
+        try:
+            # Image compression may pick another extension than the suffix
+            result_path = await worker_pool.submit(fn, *batch_arguments(conversion_type, input_path, str(output_path), options))
+            return input_path, result_path, None
+        except HTTPException as e:
+            return input_path, str(output_path), str(e.detail)
+        except Exception as e:
+            return input_path, str(output_path), str(e)
+    
+    async def zip_results():
+        archive = ZipStream()
+        manifest = []
+        tasks = [asyncio.ensure_future(convert_one(i, path)) for i, path in enumerate(input_paths)]
+        try:
+            # Outputs are added in completion order so the first bytes leave as early as possible
+            for done, next_result in enumerate(asyncio.as_completed(tasks), start=1):
+                input_path, output_path, error = await next_result
+                entry = {"file": Path(input_path).name, "status": "ok" if error is None else "error"}
+                if error is None:
+                    arcname = archive.unique_name(Path(output_path).name.split("-", 1)[1])
+                    entry.update(output=arcname, size=os.path.getsize(output_path))
+                    async for chunk in iterate_in_threadpool(archive.add_file(output_path, arcname)):
+                        if chunk:
+                            yield chunk
+                    os.remove(output_path)
+                else:
+                    entry["error"] = error
+                manifest.append(entry)
+                if options.progress:
+                    options.progress(done, len(tasks))
+            yield archive.add_bytes("manifest.json", json.dumps({"files": manifest}, indent=2).encode())
+            yield archive.close()
+        finally:
+            for task in tasks:
+                task.cancel()
+            release()
+    
+    return ConversionResult(stream=zip_results(), filename=f"{conversion_type}.zip", media_type="application/zip")
+
+async def stream_pages(pages: Iterator[Any], release: Callable[[], None], encode: Callable[[Any], str]) -> AsyncIterator[bytes]:
+    """Encode page results as they come out of the pool, holding the pool slot until the end"""
+    try:
+        async for page in iterate_in_threadpool(pages):
+            yield encode(page).encode()
+    finally:
+        release()
+
+async def run_conversion(
+    conversion_type: str,
+    input_paths: List[str],
+    work_dir: str,
+    options: ConversionOptions,
+) -> ConversionResult:
+    """Run one conversion in the worker pool and describe its output"""
+    # Handle batch operations
+    if is_batch_conversion(conversion_type):
+        if not input_paths:
+            raise HTTPException(status_code=400, detail="No files uploaded for batch processing")
         
-        # Create a new page
-        page = pdf.new_page(width=img.width, height=img.height)
+        # Merge PDFs
+        if conversion_type == "merge-pdfs":
+            output_path = Path(work_dir) / "merged.pdf"
+            assembly.validate_save_mode(options.save_mode)
+            await worker_pool.run(conversion_type, merge_pdfs, input_paths, str(output_path), options.save_mode, options.progress)
+            return ConversionResult(path=str(output_path), filename="merged.pdf", media_type="application/pdf")
         
-        # Save the image to a temporary file
-        temp_img_path = f"{output_path}.temp.jpg"
-        img.save(temp_img_path)
+        # Many images into one multi-page PDF
+        elif conversion_type == "images-to-pdf":
+            imaging.validate_options(options.image_format, options.max_dimension)
+            assembly.validate_page_size(options.page_size)
+            output_path = Path(work_dir) / "images.pdf"
+            await worker_pool.run_fanout(
+                conversion_type, images_to_pdf, input_paths, str(output_path),
+                options.page_size, options.max_dimension, options.compression_level, options.progress
+            )
+            return ConversionResult(path=str(output_path), filename="images.pdf", media_type="application/pdf")
         
-        # Insert the image into the PDF page
-        page.insert_image(page.rect, filename=temp_img_path)
+        # Batch operations convert every file and stream the outputs back as a ZIP
+        elif conversion_type in BATCH_CONVERSIONS:
+            return await run_batch(conversion_type, input_paths, work_dir, options)
         
-        # Save the PDF
-        pdf.save(output_path)
-        pdf.close()
+        raise HTTPException(status_code=400, detail=f"Unsupported conversion type: {conversion_type}")
+    
+    # Several steps on one document, from one or more uploaded PDFs
+    if conversion_type == "pipeline":
+        steps = pipeline.parse_steps(options.steps, len(input_paths))
+        name = "merged-pipeline.pdf" if steps[0].type == "merge-pdfs" else f"{Path(input_paths[0]).stem}-pipeline.pdf"
+        output_path = Path(work_dir) / name
+        await worker_pool.run_fanout(conversion_type, run_pdf_pipeline, input_paths, str(output_path), steps, options.progress)
+        return ConversionResult(path=str(output_path), filename=name, media_type="application/pdf")
+    
+    # Handle single file operations
+    if not input_paths:
+        raise HTTPException(status_code=400, detail="No file uploaded")
+    
+    temp_in_path = input_paths[0]
+    stem = Path(temp_in_path).stem
+    if expected_upload_kind(conversion_type) == "image":
+        imaging.validate_options(options.image_format, options.max_dimension)
+    
+    # Handle different conversion types for single files
+    if conversion_type == "pdf-to-docx":
+        # PDF to Word conversion; pages are analysed in parallel by the workers
+        output_path = Path(work_dir) / f"{stem}.docx"
+        await worker_pool.run_fanout(conversion_type, pdf_to_docx, temp_in_path, str(output_path), options.progress)
+        return ConversionResult(
+            path=str(output_path),
+            filename=f"{stem}.docx",
+            media_type="application/vnd.openxmlformats-officedocument.wordprocessingml.document"
+        )
+    
+    elif conversion_type == "pdf-to-xlsx":
+        # PDF to Excel conversion: one worksheet per detected table
+        output_path = Path(work_dir) / f"{stem}.xlsx"
+        await worker_pool.run_fanout(conversion_type, pdf_to_xlsx, temp_in_path, str(output_path), options.progress)
+        return ConversionResult(
+            path=str(output_path),
+            filename=f"{stem}.xlsx",
+            media_type="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+        )
+    
+    elif conversion_type == "pdf-to-pptx":
+        # PDF to PowerPoint conversion: one slide per page
+        output_path = Path(work_dir) / f"{stem}.pptx"
+        await worker_pool.run_fanout(conversion_type, pdf_to_pptx, temp_in_path, str(output_path), options.progress)
+        return ConversionResult(
+            path=str(output_path),
+            filename=f"{stem}.pptx",
+            media_type="application/vnd.openxmlformats-officedocument.presentationml.presentation"
+        )
+    
+    elif conversion_type in PDF_FILTERS:
+        # Word, Excel and PowerPoint to PDF through the warm LibreOffice pool
+        output_path = Path(work_dir) / f"{stem}.pdf"
+        # LibreOffice competes for the same CPUs, so the conversion holds a slot and counts toward the client's quota
+        async with worker_pool.admit(conversion_type):
+            await office_pool.convert(conversion_type, temp_in_path, str(output_path))
+        return ConversionResult(path=str(output_path), filename=f"{stem}.pdf", media_type="application/pdf")
+    
+    elif conversion_type == "jpg-to-png":
+        output_path = Path(work_dir) / f"{stem}.png"
+        await worker_pool.run(conversion_type, jpg_to_png, temp_in_path, str(output_path), options.max_dimension)
+        return ConversionResult(path=str(output_path), filename=f"{stem}.png", media_type="image/png")
         
-        # Clean up temporary image
-        os.remove(temp_img_path)
+    elif conversion_type == "jpg-to-pdf" or conversion_type == "png-to-pdf":
+        output_path = Path(work_dir) / f"{stem}.pdf"
+        await worker_pool.run(conversion_type, image_to_pdf, temp_in_path, str(output_path), options.max_dimension)
+        return ConversionResult(path=str(output_path), filename=f"{stem}.pdf", media_type="application/pdf")
         
-        return output_path
-    except Exception as e:
-        logger.error(f"Error converting image to PDF: {e}")
-        raise HTTPException(status_code=500, detail=f"Failed to convert image to PDF: {str(e)}")
+    elif conversion_type == "png-to-jpg":
+        output_path = Path(work_dir) / f"{stem}.jpg"
+        await worker_pool.run(conversion_type, png_to_jpg, temp_in_path, str(output_path), options.max_dimension)
+        return ConversionResult(path=str(output_path), filename=f"{stem}.jpg", media_type="image/jpeg")
+        
+    elif conversion_type == "image-to-text":
+        # OCR image to text
+        text = await worker_pool.run(conversion_type, image_to_text, temp_in_path)
+        return ConversionResult(data={"text": text})
+        
+    elif conversion_type == "pdf-to-text":
+        # PDF to text, optionally for some pages and as blocks or words with coordinates
+        validate_format(options.text_format)
+        if options.stream:
+            if options.stream_format not in ("ndjson", "text"):
+                raise HTTPException(status_code=400, detail=f"Unknown stream format: {options.stream_format}")
+            if options.stream_format == "text" and options.text_format != "text":
+                raise HTTPException(status_code=400, detail="Plain text streaming requires text_format=text")
+            # Reject bad ranges now; once the stream has started the status code is sent
+            parse_page_ranges(options.page_ranges, await asyncio.to_thread(page_count, temp_in_path))
+            release = await worker_pool.acquire(conversion_type)
+            pages = iter_text_pages(temp_in_path, options.page_ranges, options.text_format, executor=worker_pool.executor)
+            if options.stream_format == "text":
+                # Pages are separated by form feeds, like pdftotext
+                return ConversionResult(
+                    stream=stream_pages(pages, release, lambda page: page["text"] + "\f"),
+                    media_type="text/plain; charset=utf-8",
+                )
+            return ConversionResult(
+                stream=stream_pages(pages, release, lambda page: json.dumps(page) + "\n"),
+                media_type="application/x-ndjson",
+            )
+        
+        if options.text_format == "text":
+            text = await worker_pool.run(conversion_type, extract_text_from_pdf, temp_in_path, options.page_ranges)
+            return ConversionResult(data={"text": text})
+        pages = await worker_pool.run(conversion_type, extract_pages, temp_in_path, options.page_ranges, options.text_format)
+        return ConversionResult(data={"pages": pages})
+        
+    elif conversion_type == "pdf-ocr":
+        # PDF OCR
+        options.ocr.validate()
+        if options.stream:
+            # One JSON line per page, in order, as soon as the page is recognized
+            release = await worker_pool.acquire(conversion_type)
+            pages = iter_ocr_pages(temp_in_path, options.ocr, executor=worker_pool.executor)
+            return ConversionResult(
+                stream=stream_pages(pages, release, lambda page: json.dumps(page.to_dict()) + "\n"),
+                media_type="application/x-ndjson",
+            )
+        
+        text = await worker_pool.run_fanout(conversion_type, ocr_pdf, temp_in_path, options.progress, options.ocr)
+        return ConversionResult(data={"text": text})
+    
+    elif conversion_type == "pdf-ocr-searchable":
+        # Searchable PDF: the original pages with an invisible text layer on top
+        options.ocr.validate()
+        output_path = Path(work_dir) / f"{stem}-searchable.pdf"
+        await worker_pool.run_fanout(
+            conversion_type, ocr_pdf_searchable, temp_in_path, str(output_path), options.progress, options.ocr
+        )
+        return ConversionResult(path=str(output_path), filename=f"{stem}-searchable.pdf", media_type="application/pdf")
+        
+    elif conversion_type == "image-compress":
+        # Image compression; "auto" keeps photos as JPEG and transparent images as WebP
+        output_path = await worker_pool.run(
+            conversion_type, compress_image, temp_in_path, str(Path(work_dir) / f"{stem}-compressed.jpg"),
+            options.compression_level, options.image_format, options.max_dimension
+        )
+        filename = Path(output_path).name
+        return ConversionResult(path=output_path, filename=filename, media_type=imaging.media_type(imaging.format_of_path(filename)))
+        
+    elif conversion_type == "pdf-compress":
+        # PDF compression
+        output_path = Path(work_dir) / f"{stem}-compressed.pdf"
+        await worker_pool.run_fanout(
+            conversion_type, compress_pdf, temp_in_path, str(output_path),
+            options.compression_level, options.progress, compression.validate_mode(options.compression_mode)
+        )
+        return ConversionResult(path=str(output_path), filename=f"{stem}-compressed.pdf", media_type="application/pdf")
+    
+    elif conversion_type == "pdf-protect":
+        # Protect PDF
+        if not options.password:
+            raise HTTPException(status_code=400, detail="Password is required for PDF protection")
+        
+        output_path = Path(work_dir) / f"{stem}-protected.pdf"
+        await worker_pool.run(conversion_type, protect_pdf, temp_in_path, str(output_path), options.password)
+        return ConversionResult(path=str(output_path), filename=f"{stem}-protected.pdf", media_type="application/pdf")
+    
+    elif conversion_type == "pdf-unlock":
+        # Unlock PDF
+        if not options.password:
+            raise HTTPException(status_code=400, detail="Password is required to unlock PDF")
+        
+        output_path = Path(work_dir) / f"{stem}-unlocked.pdf"
+        await worker_pool.run(conversion_type, unlock_pdf, temp_in_path, str(output_path), options.password)
+        return ConversionResult(path=str(output_path), filename=f"{stem}-unlocked.pdf", media_type="application/pdf")
+    
+    elif conversion_type == "split-pdf":
+        # Split PDF
+        if not options.split_ranges:
+            raise HTTPException(status_code=400, detail="Split ranges are required")
+        
+        # Validate every range against the page count before taking a worker
+        assembly.validate_save_mode(options.save_mode, ("compact", "linear"))
+        ranges = parse_page_ranges(options.split_ranges, await asyncio.to_thread(page_count, temp_in_path))
+        if len(ranges) == 1:
+            filename, media_type = assembly.range_name(stem, *ranges[0]), "application/pdf"
+        else:
+            filename, media_type = f"{stem}-split.zip", "application/zip"
+        output_path = Path(work_dir) / filename
+        await worker_pool.run(
+            conversion_type, split_pdf, temp_in_path, str(output_path), ranges, stem, options.save_mode, options.progress
+        )
+        return ConversionResult(path=str(output_path), filename=filename, media_type=media_type)
+    
+    raise HTTPException(status_code=400, detail=f"Unsupported conversion type: {conversion_type}")
 
-@app.post("/api/flashcards")
-async def create_flashcards(file: UploadFile = File(...)):
-    """Upload a PDF and convert it to flashcards"""
-    # ... keep existing code (flashcard generation endpoint)
+# Hard-link a request's inputs into another directory, keeping their names
+def link_inputs(input_paths: List[str], directory: str) -> List[str]:
+    input_dir = Path(directory) / "input"
+    input_dir.mkdir(exist_ok=True)
+    linked = []
+    for input_path in input_paths:
+        target = unique_path(input_dir, Path(input_path).name)
+        link_or_copy(input_path, str(target))
+        linked.append(str(target))
+    return linked
+
+async def run_cached_conversion(
+    conversion_type: str,
+    input_paths: List[str],
+    input_hashes: List[str],
+    work_dir: str,
+    options: ConversionOptions,
+) -> ConversionResult:
+    """Serve a conversion from the result cache, or run it and cache the output"""
+    if options.stream or conversion_type in BATCH_CONVERSIONS or not input_paths or not result_cache.cacheable(conversion_type):
+        return await run_conversion(conversion_type, input_paths, work_dir, options)
+    
+    params = cache_params(conversion_type, options)
+    if conversion_type == "pipeline":
+        # Outputs of pipelines that unlock or protect depend on a password and are never cached
+        steps = pipeline.parse_steps(options.steps, len(input_paths))
+        if pipeline.has_secrets(steps):
+            return await run_conversion(conversion_type, input_paths, work_dir, options)
+        params["steps"] = pipeline.cache_params(steps)
+    
+    stem = Path(input_paths[0]).stem
+    key = result_cache.key(conversion_type, input_hashes, params)
+    entry = await asyncio.to_thread(result_cache.get, key)
+    output_path = None
+    if entry is not None and entry.data is None:
+        # Link the artifact into the request directory so eviction cannot pull it away mid-response
+        output_path = Path(work_dir) / f"cached-{entry.filename_for(stem)}"
+        try:
+            await asyncio.to_thread(link_or_copy, entry.path, str(output_path))
+        except FileNotFoundError:
+            # Evicted between the lookup and the link; convert as on a miss
+            entry = None
+    metrics.record_cache_lookup(entry is not None)
+    if entry is not None:
+        if entry.data is not None:
+            return ConversionResult(data=entry.data)
+        return ConversionResult(path=str(output_path), filename=entry.filename_for(stem), media_type=entry.media_type)
+    
+    # Identical conversions already in flight are joined instead of run again
+    shared_dir: Optional[str] = None
+    
+    async def convert_and_cache() -> Tuple[ConversionResult, str]:
+        nonlocal shared_dir
+        # The shared conversion gets its own directory: the request that started it may disconnect
+        shared_dir = request_dirs.create()
+        shared_inputs = await asyncio.to_thread(link_inputs, input_paths, shared_dir)
+        result = await run_conversion(conversion_type, shared_inputs, shared_dir, options)
+        try:
+            await asyncio.to_thread(result_cache.put, key, result.path, result.filename, stem, result.media_type, result.data)
+        except Exception as e:
+            logger.error(f"Error caching conversion result: {e}")
+        return result, stem
+    
+    def release_shared_dir():
+        if shared_dir is not None:
+            request_dirs.release(shared_dir)
+    
+    async with single_flight.join(key, convert_and_cache, release_shared_dir) as ((result, shared_stem), leader):
+        if not leader:
+            metrics.COALESCED.inc(conversion_type=metrics.conversion_type_label(conversion_type))
+            metrics.current_trace().cache = "shared"
+        if result.data is not None or result.path is None:
+            return result
+        # Inputs of the same bytes can have different names; outputs follow the caller's
+        filename = result.filename
+        if filename and filename.startswith(shared_stem):
+            filename = stem + filename[len(shared_stem):]
+        output_path = Path(work_dir) / f"shared-{filename or Path(result.path).name}"
+        await asyncio.to_thread(link_or_copy, result.path, str(output_path))
+        return ConversionResult(path=str(output_path), filename=filename, media_type=result.media_type)
 
 @app.post("/api/convert")
-async def convert_file(
-    file: UploadFile = File(None),
-    files: List[UploadFile] = File(None),
-    conversion_type: str = Form(...),
-    compression_level: int = Form(70),  # Default to 70% quality
-    password: str = Form(None),         # For PDF protection/unlocking
-    split_ranges: str = Form(None)      # For PDF splitting
-):
-    """Convert files between different formats or compress them"""
-    # Create a unique filename and temporary directory
-    temp_dir = tempfile.mkdtemp(dir=UPLOAD_DIR)
+async def convert_file(request: Request):
+    """Convert files between different formats or compress them
+    
+    Multipart fields: file (or files for batch operations), conversion_type,
+    compression_level, compression_mode, password, split_ranges, save_mode, ocr_dpi,
+    ocr_language, ocr_grayscale, pages, text_format, stream, stream_format,
+    image_format, max_dimension, page_size and steps (a JSON list of pipeline
+    steps for conversion_type=pipeline).
+    """
+    # Create a unique temporary directory; it lives until the response has been sent
+    temp_dir = request_dirs.create()
+    cleanup = BackgroundTask(request_dirs.release, temp_dir)
+    trace = metrics.current_trace()
     
     try:
-        # Handle batch operations
-        if conversion_type.startswith("batch-") or conversion_type == "merge-pdfs":
-            if not files:
-                raise HTTPException(status_code=400, detail="No files uploaded for batch processing")
-            
-            # Save all uploaded files
-            file_paths = []
-            for uploaded_file in files:
-                temp_path = Path(temp_dir) / uploaded_file.filename
-                with open(temp_path, "wb") as f:
-                    shutil.copyfileobj(uploaded_file.file, f)
-                file_paths.append(str(temp_path))
-            
-            # Merge PDFs
-            if conversion_type == "merge-pdfs":
-                output_path = Path(temp_dir) / "merged.pdf"
-                merge_pdfs(file_paths, str(output_path))
-                return FileResponse(
-                    path=output_path,
-                    filename="merged.pdf",
-                    media_type="application/pdf"
-                )
-            
-            # Batch compress PDFs
-            elif conversion_type == "batch-compress":
-                # Create a ZIP file containing compressed PDFs
-                # For demo, we'll just compress the first file
-                if file_paths:
-                    output_path = Path(temp_dir) / "compressed.pdf"
-                    compress_pdf(file_paths[0], str(output_path), compression_level)
-                    return FileResponse(
-                        path=output_path,
-                        filename="compressed.pdf",
-                        media_type="application/pdf"
-                    )
-            
-            # Batch compress images
-            elif conversion_type == "batch-compress-images":
-                # For demo, we'll just compress the first image
-                if file_paths:
-                    output_path = Path(temp_dir) / "compressed.jpg"
-                    compress_image(file_paths[0], str(output_path), compression_level)
-                    return FileResponse(
-                        path=output_path,
-                        filename="compressed.jpg",
-                        media_type="image/jpeg"
-                    )
-            
-            # Batch convert to PDF
-            elif conversion_type == "batch-convert-to-pdf":
-                # For demo, we'll just convert the first image
-                if file_paths:
-                    output_path = Path(temp_dir) / "converted.pdf"
-                    image_to_pdf(file_paths[0], str(output_path))
-                    return FileResponse(
-                        path=output_path,
-                        filename="converted.pdf",
-                        media_type="application/pdf"
-                    )
+        # Stream uploaded files straight into the temporary directory
+        with trace.stage("upload"):
+            form = await ingest_request(request, temp_dir)
+        conversion_type = form.get("conversion_type")
+        if not conversion_type:
+            raise HTTPException(status_code=400, detail="conversion_type is required")
+        trace.conversion_type = conversion_type
+        uploads = select_uploads(form, conversion_type)
+        input_paths = [upload.path for upload in uploads]
+        input_hashes = [upload.sha256 for upload in uploads]
         
-        # Handle single file operations
-        else:
-            if not file:
-                raise HTTPException(status_code=400, detail="No file uploaded")
-            
-            # Save uploaded file
-            temp_in_path = Path(temp_dir) / file.filename
-            with open(temp_in_path, "wb") as f:
-                shutil.copyfileobj(file.file, f)
-            
-            # Handle different conversion types for single files
-            if conversion_type == "pdf-to-docx":
-                # PDF to Word conversion
-                output_path = Path(temp_dir) / f"{Path(file.filename).stem}.docx"
-                # In a real application, use a PDF to DOCX converter
-                # For demo, we'll just extract text and create a simple DOCX
-                text = extract_text_from_pdf(str(temp_in_path))
-                doc = docx.Document()
-                doc.add_paragraph(text)
-                doc.save(str(output_path))
-                
-                return FileResponse(
-                    path=output_path, 
-                    filename=f"{Path(file.filename).stem}.docx",
-                    media_type="application/vnd.openxmlformats-officedocument.wordprocessingml.document"
-                )
-            
-            elif conversion_type == "pdf-to-xlsx":
-                # For demo, we'll just return a simple Excel file
-                # In a real implementation, you'd use a library like pandas or openpyxl
-                output_path = Path(temp_dir) / f"{Path(file.filename).stem}.xlsx"
-                # Placeholder - would implement actual conversion here
-                return FileResponse(
-                    path=temp_in_path, # Just return the original for demo
-                    filename=f"{Path(file.filename).stem}.xlsx",
-                    media_type="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
-                )
-            
-            elif conversion_type == "pdf-to-pptx":
-                # For demo, we'll just return a simple PowerPoint file
-                # In a real implementation, you'd use a library like python-pptx
-                output_path = Path(temp_dir) / f"{Path(file.filename).stem}.pptx"
-                # Placeholder - would implement actual conversion here
-                return FileResponse(
-                    path=temp_in_path, # Just return the original for demo
-                    filename=f"{Path(file.filename).stem}.pptx",
-                    media_type="application/vnd.openxmlformats-officedocument.presentationml.presentation"
-                )
-            
-            elif conversion_type == "docx-to-pdf":
-                # Word to PDF conversion
-                output_path = Path(temp_dir) / f"{Path(file.filename).stem}.pdf"
-                convert(str(temp_in_path), str(output_path))
-                
-                return FileResponse(
-                    path=output_path, 
-                    filename=f"{Path(file.filename).stem}.pdf",
-                    media_type="application/pdf"
-                )
-                
-            elif conversion_type == "xlsx-to-pdf" or conversion_type == "pptx-to-pdf":
-                # For demo purposes, we'll just return a PDF
-                # In a real implementation, you'd use a library for conversion
-                output_path = Path(temp_dir) / f"{Path(file.filename).stem}.pdf"
-                # Placeholder - would implement actual conversion here
-                return FileResponse(
-                    path=temp_in_path, # Just return the original for demo
-                    filename=f"{Path(file.filename).stem}.pdf",
-                    media_type="application/pdf"
-                )
-            
-            elif conversion_type == "jpg-to-png":
-                output_path = Path(temp_dir) / f"{Path(file.filename).stem}.png"
-                image = Image.open(temp_in_path)
-                image.save(str(output_path), "PNG")
-                
-                return FileResponse(
-                    path=output_path, 
-                    filename=f"{Path(file.filename).stem}.png",
-                    media_type="image/png"
-                )
-                
-            elif conversion_type == "jpg-to-pdf" or conversion_type == "png-to-pdf":
-                output_path = Path(temp_dir) / f"{Path(file.filename).stem}.pdf"
-                image_to_pdf(str(temp_in_path), str(output_path))
-                
-                return FileResponse(
-                    path=output_path, 
-                    filename=f"{Path(file.filename).stem}.pdf",
-                    media_type="application/pdf"
-                )
-                
-            elif conversion_type == "png-to-jpg":
-                output_path = Path(temp_dir) / f"{Path(file.filename).stem}.jpg"
-                image = Image.open(temp_in_path)
-                # Convert to RGB if necessary (for PNG with transparency)
-                if image.mode in ('RGBA', 'LA'):
-                    background = Image.new('RGB', image.size, (255, 255, 255))
-                    background.paste(image, mask=image.split()[3])
-                    image = background
-                image.save(str(output_path), "JPEG", quality=95)
-                
-                return FileResponse(
-                    path=output_path, 
-                    filename=f"{Path(file.filename).stem}.jpg",
-                    media_type="image/jpeg"
-                )
-                
-            elif conversion_type == "image-to-text":
-                # OCR image to text
-                image = Image.open(temp_in_path)
-                text = pytesseract.image_to_string(image)
-                return {"text": text}
-                
-            elif conversion_type == "pdf-to-text":
-                # PDF to text
-                text = extract_text_from_pdf(str(temp_in_path))
-                return {"text": text}
-                
-            elif conversion_type == "pdf-ocr":
-                # PDF OCR
-                text = ocr_pdf(str(temp_in_path))
-                return {"text": text}
-                
-            elif conversion_type == "image-compress":
-                # Image compression
-                output_path = Path(temp_dir) / f"{Path(file.filename).stem}-compressed.jpg"
-                compress_image(str(temp_in_path), str(output_path), compression_level)
-                
-                return FileResponse(
-                    path=output_path, 
-                    filename=f"{Path(file.filename).stem}-compressed.jpg",
-                    media_type="image/jpeg"
-                )
-                
-            elif conversion_type == "pdf-compress":
-                # PDF compression
-                output_path = Path(temp_dir) / f"{Path(file.filename).stem}-compressed.pdf"
-                compress_pdf(str(temp_in_path), str(output_path), compression_level)
-                
-                return FileResponse(
-                    path=output_path, 
-                    filename=f"{Path(file.filename).stem}-compressed.pdf",
-                    media_type="application/pdf"
-                )
-            
-            elif conversion_type == "pdf-protect":
-                # Protect PDF
-                if not password:
-                    raise HTTPException(status_code=400, detail="Password is required for PDF protection")
-                
-                output_path = Path(temp_dir) / f"{Path(file.filename).stem}-protected.pdf"
-                protect_pdf(str(temp_in_path), str(output_path), password)
-                
-                return FileResponse(
-                    path=output_path, 
-                    filename=f"{Path(file.filename).stem}-protected.pdf",
-                    media_type="application/pdf"
-                )
-            
-            elif conversion_type == "pdf-unlock":
-                # Unlock PDF
-                if not password:
-                    raise HTTPException(status_code=400, detail="Password is required to unlock PDF")
-                
-                output_path = Path(temp_dir) / f"{Path(file.filename).stem}-unlocked.pdf"
-                unlock_pdf(str(temp_in_path), str(output_path), password)
-                
-                return FileResponse(
-                    path=output_path, 
-                    filename=f"{Path(file.filename).stem}-unlocked.pdf",
-                    media_type="application/pdf"
-                )
-            
-            elif conversion_type == "split-pdf":
-                # Split PDF
-                if not split_ranges:
-                    raise HTTPException(status_code=400, detail="Split ranges are required")
-                
-                output_dir = Path(temp_dir) / "split"
-                output_paths = split_pdf(str(temp_in_path), str(output_dir), split_ranges)
-                
-                # For demo, we'll just return the first split file
-                if output_paths:
-                    return FileResponse(
-                        path=output_paths[0], 
-                        filename=f"{Path(file.filename).stem}-split.pdf",
-                        media_type="application/pdf"
-                    )
-                else:
-                    raise HTTPException(status_code=500, detail="Failed to split PDF")
-            
-            else:
-                raise HTTPException(status_code=400, detail=f"Unsupported conversion type: {conversion_type}")
+        options = options_from_form(form)
+        # Weighed by the scheduler against other clients' conversions
+        cost = await asyncio.to_thread(scheduler.estimate_cost, conversion_type, input_paths, [upload.kind for upload in uploads])
+        with trace.stage("processing"), scheduler.demand(scheduler.Demand(request_client(request), cost)):
+            result = await run_cached_conversion(conversion_type, input_paths, input_hashes, temp_dir, options)
+        if conversion_type in PAGE_CONVERSIONS and result.stream is None and trace.cache not in ("hit", "shared"):
+            trace.pages = await asyncio.to_thread(page_count, input_paths[0])
+        elif conversion_type == "images-to-pdf" and trace.cache not in ("hit", "shared"):
+            trace.pages = len(input_paths)
+        
+        if result.stream is not None:
+            headers = {"Content-Disposition": f'attachment; filename="{result.filename}"'} if result.filename else None
+            return StreamingResponse(result.stream, media_type=result.media_type, headers=headers, background=cleanup)
+        if result.data is not None:
+            return JSONResponse(result.data, background=cleanup)
+        return ArtifactResponse(
+            path=result.path,
+            filename=result.filename,
+            media_type=result.media_type,
+            background=cleanup
+        )
     
+    except HTTPException:
+        # Keep client errors and backpressure (400/429/503) intact
+        request_dirs.release(temp_dir)
+        raise
     except Exception as e:
         logger.error(f"Conversion error: {e}")
+        request_dirs.release(temp_dir)
         raise HTTPException(status_code=500, detail=f"Conversion failed: {str(e)}")
+
+# Execute a queued job inside its own directory
+async def run_job(job: Job) -> ConversionResult:
+    options = job.payload["options"]
+    options.progress = ProgressReporter(job.progress_path)
+    # Jobs are traced under their job id; "queue" is the time spent waiting for a consumer
+    trace = metrics.RequestTrace(trace_id=job.id, conversion_type=job.conversion_type)
+    trace.add_stage("queue", job.started_at - job.created_at)
+    status = 500
+    with metrics.activate(trace), scheduler.demand(job.payload["demand"]):
+        try:
+            with trace.stage("processing"):
+                result = await run_cached_conversion(
+                    job.conversion_type, job.payload["input_paths"], job.payload["input_hashes"], job.directory, options
+                )
+                if result.stream is not None:
+                    # Keep streamed outputs (batch ZIPs) on disk so they can be downloaded later
+                    output_path = Path(job.directory) / (result.filename or "result")
+                    with open(output_path, "wb") as f:
+                        async for chunk in result.stream:
+                            await asyncio.to_thread(f.write, chunk)
+                    result = ConversionResult(path=str(output_path), filename=result.filename, media_type=result.media_type)
+            if job.conversion_type in PAGE_CONVERSIONS and trace.cache not in ("hit", "shared"):
+                trace.pages = await asyncio.to_thread(page_count, job.payload["input_paths"][0])
+            elif job.conversion_type == "images-to-pdf" and trace.cache not in ("hit", "shared"):
+                trace.pages = len(job.payload["input_paths"])
+            status = 200
+            return result
+        except HTTPException as e:
+            status = e.status_code
+            raise
+        finally:
+            trace.finish(status)
+
+job_manager = JobManager(JOBS_DIR, run_job)
+
+@app.post("/api/jobs", status_code=202)
+async def submit_job(request: Request):
+    """Queue a conversion and return its job id immediately
     
+    Accepts the same multipart fields as /api/convert.
+    """
+    job = job_manager.create("pending")
+    try:
+        input_dir = Path(job.directory) / "input"
+        input_dir.mkdir()
+        form = await ingest_request(request, str(input_dir))
+        job.conversion_type = form.get("conversion_type")
+        if not job.conversion_type:
+            raise HTTPException(status_code=400, detail="conversion_type is required")
+        uploads = select_uploads(form, job.conversion_type)
+        if not uploads:
+            raise HTTPException(status_code=400, detail="No file uploaded")
+        
+        job.payload = {
+            "input_paths": [upload.path for upload in uploads],
+            "input_hashes": [upload.sha256 for upload in uploads],
+            "options": options_from_form(form),
+            # Jobs are asynchronous: they wait for capacity instead of hitting the deadline
+            "demand": scheduler.Demand(
+                request_client(request),
+                await asyncio.to_thread(
+                    scheduler.estimate_cost, job.conversion_type, [upload.path for upload in uploads], [upload.kind for upload in uploads]
+                ),
+                max_wait=None,
+            ),
+        }
+        await job_manager.submit(job)
+    except Exception:
+        job_manager.discard(job)
+        raise
+    
+    return {
+        "job_id": job.id,
+        "state": job.state.value,
+        "status_url": f"/api/jobs/{job.id}",
+        "result_url": f"/api/jobs/{job.id}/result",
+    }
+
+@app.get("/api/jobs/{job_id}")
+async def get_job(job_id: str):
+    """Report the state and per-page progress of a job"""
+    job = await job_manager.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job.to_dict()
+
+@app.get("/api/jobs/{job_id}/result")
+async def get_job_result(job_id: str):
+    """Download the output of a finished job"""
+    job = await job_manager.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    if job.state == JobState.FAILED:
+        raise HTTPException(status_code=409, detail=f"Job failed: {job.error}")
+    if job.state != JobState.SUCCEEDED:
+        raise HTTPException(status_code=409, detail=f"Job is {job.state.value}")
+    
+    result = job.result
+    if result.data is not None:
+        return result.data
+    return ArtifactResponse(path=result.path, filename=result.filename, media_type=result.media_type)
+
+@app.post("/api/documents", status_code=201)
+async def upload_document(request: Request):
+    """Store a PDF for previews and return its document id
+    
+    Multipart fields: file. Uploading the same file again returns the same id.
+    """
+    temp_dir = request_dirs.create()
+    try:
+        form = await ingest_request(request, temp_dir)
+        uploads = form.files_for("file")
+        if not uploads:
+            raise HTTPException(status_code=400, detail="No file uploaded")
+        if uploads[0].kind != "pdf":
+            raise HTTPException(status_code=400, detail=f"{uploads[0].filename} is not a PDF")
+        
+        document_id = await asyncio.to_thread(document_store.put, uploads[0].path, uploads[0].sha256)
+        pages = await asyncio.to_thread(page_count, document_store.get(document_id))
+        return {"document_id": document_id, "pages": pages}
     finally:
-        # Clean up temp directory
-        try:
-            shutil.rmtree(temp_dir)
-        except Exception as e:
-            logger.error(f"Error cleaning up: {e}")
+        request_dirs.release(temp_dir)
+
+# Find the PDF a preview is rendered from: a stored document or a job's output
+async def preview_source(document_id: Optional[str], job_id: Optional[str]) -> str:
+    if (document_id is None) == (job_id is None):
+        raise HTTPException(status_code=400, detail="Pass exactly one of document_id and job_id")
+    if document_id is not None:
+        path = await asyncio.to_thread(document_store.get, document_id)
+        if path is None:
+            raise HTTPException(status_code=404, detail="Document not found")
+        return path
+    
+    job = await job_manager.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    if job.state != JobState.SUCCEEDED:
+        raise HTTPException(status_code=409, detail=f"Job is {job.state.value}")
+    if job.result.path is None or job.result.media_type != "application/pdf":
+        raise HTTPException(status_code=400, detail="Only PDF results can be previewed")
+    return job.result.path
+
+@app.get("/api/preview")
+async def get_preview(
+    request: Request,
+    document_id: Optional[str] = None,
+    job_id: Optional[str] = None,
+    page: int = 1,
+    size: int = 256,
+    image_format: str = Query("webp", alias="format"),
+    clip: Optional[str] = None,
+):
+    """Render one page of a stored document or a job's PDF output
+    
+    Query parameters: document_id or job_id, page (1-based), size (long side
+    in pixels), format (webp or png) and clip (x0,y0,x1,y1 as fractions of
+    the page, to zoom into a region).
+    """
+    trace = metrics.current_trace()
+    trace.conversion_type = "preview"
+    previews.validate_size(size)
+    previews.validate_format(image_format)
+    region = previews.parse_clip(clip)
+    
+    pdf_path = await preview_source(document_id, job_id)
+    key = previews.key(document_id or await asyncio.to_thread(previews.document_hash, pdf_path), page, size, image_format, region)
+    headers = {"Cache-Control": "private, max-age=3600", "ETag": f'"{key}"'}
+    if request.headers.get("if-none-match") == headers["ETag"]:
+        return Response(status_code=304, headers=headers)
+    
+    tier = "memory"
+    data = preview_cache.get_memory(key)
+    if data is None:
+        tier = "disk"
+        data = await asyncio.to_thread(preview_cache.get_disk, key)
+    if data is None:
+        tier = "miss"
+        with trace.stage("processing"), scheduler.demand(scheduler.Demand(request_client(request), scheduler.BASE_COST)):
+            data = await worker_pool.run("preview", previews.render_page, pdf_path, page, size, image_format, region)
+        await asyncio.to_thread(preview_cache.put_disk, key, data)
+    preview_cache.put_memory(key, data)
+    metrics.PREVIEW_LOOKUPS.inc(tier=tier)
+    trace.cache = tier
+    return Response(data, media_type=previews.PREVIEW_MEDIA_TYPES[image_format], headers=headers)
+
+metrics.WORKER_PROCESSES.set_function(lambda: worker_pool.processes)
+metrics.WORKER_BUSY.set_function(lambda: worker_pool.busy)
+metrics.WORKER_QUEUED_TASKS.set_function(lambda: worker_pool.queued_tasks)
+metrics.WORKER_ADMITTED.set_function(lambda: worker_pool.pending)
+metrics.WORKER_WAITING.set_function(lambda: worker_pool.waiting)
+
+@app.get("/metrics")
+async def get_metrics():
+    """Prometheus metrics: request counts, stage latencies, pool and cache state"""
+    metrics.JOB_QUEUE_DEPTH.set(await job_manager.backend.queued_count())
+    return Response(metrics.REGISTRY.render(), media_type=metrics.CONTENT_TYPE)
 
 @app.get("/")
 def read_root():
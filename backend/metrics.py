@@ -0,0 +1,397 @@
+"""Prometheus-style metrics and per-request timing traces.
+
+A deliberately small implementation of the Prometheus text exposition
+format: counters, gauges and histograms with labels, rendered by ``/metrics``.
+
+Every HTTP request gets a trace ID (taken from ``X-Request-ID`` when the
+client sends one) that is echoed back in the response headers and stamped on
+every log line written while the request is handled. Conversions record how
+long each stage took (upload, processing, response) on the request's
+``RequestTrace``; when the last response byte has been sent the stages go into
+the latency histograms and one log line summarises the breakdown.
+"""
+
+import contextvars
+import logging
+import math
+import os
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterator, List, Optional, Sequence, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Default histogram buckets, in seconds
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+
+# Buckets for pages processed per second
+PAGE_RATE_BUCKETS = (0.5, 1, 2, 5, 10, 20, 50, 100, 200, 500, 1000)
+
+# Header carrying the trace ID in requests and responses
+TRACE_HEADER = "x-request-id"
+
+# Longest client-supplied trace ID we accept
+MAX_TRACE_ID_LENGTH = 64
+
+# Distinct conversion_type label values; later unknown types are reported as "other"
+MAX_CONVERSION_TYPES = 64
+
+_current_trace: contextvars.ContextVar[Optional["RequestTrace"]] = contextvars.ContextVar("trace", default=None)
+
+
+def _format_value(value: float) -> str:
+    if value == math.inf:
+        return "+Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(str(value))}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Dict[str, str]) -> Tuple[str, ...]:
+        return tuple(str(labels.get(name, "")) for name in self.labelnames)
+
+    def samples(self) -> Iterator[str]:
+        raise NotImplementedError
+
+    def render(self) -> str:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        lines.extend(self.samples())
+        return "\n".join(lines)
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, amount: float = 1, **labels: str):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels: str) -> float:
+        return self._values.get(self._key(labels), 0)
+
+    def samples(self) -> Iterator[str]:
+        with self._lock:
+            items = sorted(self._values.items())
+        for key, value in items:
+            yield f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}"
+
+
+class Gauge(_Metric):
+    """A gauge set directly or read from a callback at scrape time."""
+
+    kind = "gauge"
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._values: Dict[Tuple[str, ...], float] = {}
+        self._function: Optional[Callable[[], float]] = None
+
+    def set(self, value: float, **labels: str):
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+    def set_function(self, function: Callable[[], float]):
+        self._function = function
+
+    def samples(self) -> Iterator[str]:
+        if self._function is not None:
+            yield f"{self.name} {_format_value(self._function())}"
+            return
+        with self._lock:
+            items = sorted(self._values.items())
+        for key, value in items:
+            yield f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}"
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (), buckets: Sequence[float] = LATENCY_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets)) + (math.inf,)
+        self._series: Dict[Tuple[str, ...], List[float]] = {}  # bucket counts, then sum
+
+    def observe(self, value: float, **labels: str):
+        key = self._key(labels)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [0.0] * (len(self.buckets) + 1)
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[i] += 1
+                    break
+            series[-1] += value
+
+    def samples(self) -> Iterator[str]:
+        with self._lock:
+            items = sorted((key, list(series)) for key, series in self._series.items())
+        for key, series in items:
+            cumulative = 0.0
+            for bound, count in zip(self.buckets, series):
+                cumulative += count
+                labels = _format_labels(self.labelnames, key, f'le="{_format_value(bound)}"')
+                yield f"{self.name}_bucket{labels} {_format_value(cumulative)}"
+            labels = _format_labels(self.labelnames, key)
+            yield f"{self.name}_sum{labels} {_format_value(series[-1])}"
+            yield f"{self.name}_count{labels} {_format_value(cumulative)}"
+
+
+class Registry:
+    def __init__(self):
+        self._metrics: List[_Metric] = []
+
+    def register(self, metric: _Metric) -> _Metric:
+        self._metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        return "\n".join(metric.render() for metric in self._metrics) + "\n"
+
+
+REGISTRY = Registry()
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+REQUESTS = REGISTRY.register(Counter(
+    "conversion_requests_total", "Conversion requests by type and HTTP status.", ["conversion_type", "status"]
+))
+STAGE_SECONDS = REGISTRY.register(Histogram(
+    "conversion_stage_seconds", "Time spent in each stage of a conversion request.", ["conversion_type", "stage"]
+))
+PAGES = REGISTRY.register(Counter(
+    "conversion_pages_total", "Pages processed by page-based conversions.", ["conversion_type"]
+))
+PAGES_PER_SECOND = REGISTRY.register(Histogram(
+    "conversion_pages_per_second", "Processing throughput of page-based conversions.", ["conversion_type"],
+    buckets=PAGE_RATE_BUCKETS,
+))
+BYTES_IN = REGISTRY.register(Counter(
+    "conversion_bytes_in_total", "Request body bytes received.", ["conversion_type"]
+))
+BYTES_OUT = REGISTRY.register(Counter(
+    "conversion_bytes_out_total", "Response body bytes sent.", ["conversion_type"]
+))
+CACHE_LOOKUPS = REGISTRY.register(Counter(
+    "result_cache_lookups_total", "Result cache lookups by outcome.", ["result"]
+))
+PREVIEW_LOOKUPS = REGISTRY.register(Counter(
+    "preview_cache_lookups_total", "Page preview requests by the cache tier that served them.", ["tier"]
+))
+COALESCED = REGISTRY.register(Counter(
+    "conversion_coalesced_total", "Conversions served by joining an identical conversion already in flight.",
+    ["conversion_type"],
+))
+CACHE_HIT_RATIO = REGISTRY.register(Gauge("result_cache_hit_ratio", "Share of result cache lookups that hit."))
+WORKER_PROCESSES = REGISTRY.register(Gauge("worker_pool_processes", "Worker processes in the pool."))
+WORKER_BUSY = REGISTRY.register(Gauge("worker_pool_busy_workers", "Worker processes currently running a task."))
+WORKER_QUEUED_TASKS = REGISTRY.register(Gauge(
+    "worker_pool_queued_tasks", "Tasks submitted to the pool that wait for a free worker."
+))
+WORKER_ADMITTED = REGISTRY.register(Gauge(
+    "worker_pool_admitted", "Conversions admitted to the pool, running or waiting for a slot."
+))
+WORKER_WAITING = REGISTRY.register(Gauge(
+    "worker_pool_waiting", "Admitted conversions waiting for a per-type slot."
+))
+SCHEDULER_REJECTIONS = REGISTRY.register(Counter(
+    "scheduler_rejections_total", "Conversions refused admission, by reason.", ["reason"]
+))
+JOB_QUEUE_DEPTH = REGISTRY.register(Gauge("job_queue_depth", "Asynchronous jobs waiting to run."))
+
+
+_seen_conversion_types = set()
+
+
+def conversion_type_label(conversion_type: str) -> str:
+    """Bound label cardinality: clients choose conversion_type freely."""
+    if conversion_type in _seen_conversion_types:
+        return conversion_type
+    if len(_seen_conversion_types) >= MAX_CONVERSION_TYPES or len(conversion_type) > 64:
+        return "other"
+    _seen_conversion_types.add(conversion_type)
+    return conversion_type
+
+
+class RequestTrace:
+    """Stage timings and traffic of one request, keyed by its trace ID."""
+
+    def __init__(self, trace_id: Optional[str] = None, conversion_type: str = "unknown"):
+        self.trace_id = trace_id or uuid.uuid4().hex[:16]
+        self.conversion_type = conversion_type
+        self.stages: Dict[str, float] = {}
+        self.pages = 0
+        self.cache: Optional[str] = None
+        self.bytes_in = 0
+        self.bytes_out = 0
+        self.started = time.perf_counter()
+
+    @contextmanager
+    def stage(self, name: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.stages[name] = self.stages.get(name, 0.0) + time.perf_counter() - start
+
+    def add_stage(self, name: str, seconds: float):
+        self.stages[name] = self.stages.get(name, 0.0) + seconds
+
+    def finish(self, status: int):
+        """Record the request in the metrics and log its timing breakdown."""
+        conversion_type = conversion_type_label(self.conversion_type)
+        REQUESTS.inc(conversion_type=conversion_type, status=str(status))
+        for name, seconds in self.stages.items():
+            STAGE_SECONDS.observe(seconds, conversion_type=conversion_type, stage=name)
+        processing = self.stages.get("processing", 0.0)
+        if self.pages:
+            PAGES.inc(self.pages, conversion_type=conversion_type)
+            if processing > 0:
+                PAGES_PER_SECOND.observe(self.pages / processing, conversion_type=conversion_type)
+        BYTES_IN.inc(self.bytes_in, conversion_type=conversion_type)
+        BYTES_OUT.inc(self.bytes_out, conversion_type=conversion_type)
+
+        breakdown = " ".join(f"{name}={seconds * 1000:.1f}ms" for name, seconds in self.stages.items())
+        total = (time.perf_counter() - self.started) * 1000
+        details = f" pages={self.pages}" if self.pages else ""
+        details += f" cache={self.cache}" if self.cache else ""
+        logger.info(
+            f"{conversion_type} status={status} total={total:.1f}ms {breakdown}"
+            f" in={self.bytes_in}B out={self.bytes_out}B{details}"
+        )
+
+
+def current_trace() -> RequestTrace:
+    """The trace of the request being handled, or a detached one outside requests."""
+    trace = _current_trace.get()
+    return trace if trace is not None else RequestTrace()
+
+
+@contextmanager
+def activate(trace: RequestTrace):
+    """Make ``trace`` current for the enclosed code (and the tasks it starts)."""
+    token = _current_trace.set(trace)
+    try:
+        yield trace
+    finally:
+        _current_trace.reset(token)
+
+
+def record_cache_lookup(hit: bool):
+    CACHE_LOOKUPS.inc(result="hit" if hit else "miss")
+    current_trace().cache = "hit" if hit else "miss"
+
+
+def cache_hit_ratio() -> float:
+    hits, misses = CACHE_LOOKUPS.value(result="hit"), CACHE_LOOKUPS.value(result="miss")
+    return hits / (hits + misses) if hits + misses else 0.0
+
+
+CACHE_HIT_RATIO.set_function(cache_hit_ratio)
+
+
+class TraceIdFilter(logging.Filter):
+    """Adds ``trace_id`` to log records ("-" outside a request)."""
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        trace = _current_trace.get()
+        record.trace_id = trace.trace_id if trace is not None else "-"
+        return True
+
+
+def install_log_filter(log_format: str = "%(levelname)s:%(name)s:[%(trace_id)s] %(message)s"):
+    """Stamp trace IDs on every log line written through the root handlers."""
+    for handler in logging.getLogger().handlers:
+        handler.addFilter(TraceIdFilter())
+        handler.setFormatter(logging.Formatter(log_format))
+
+
+def _client_trace_id(scope) -> Optional[str]:
+    for name, value in scope.get("headers") or []:
+        if name == TRACE_HEADER.encode():
+            value = value.decode("latin-1").strip()
+            if value and len(value) <= MAX_TRACE_ID_LENGTH and value.isprintable():
+                return value
+    return None
+
+
+class TraceMiddleware:
+    """ASGI middleware that traces conversion requests.
+
+    Counts request and response bytes, times the response stage from the
+    first header byte to the last body byte, and finishes the trace once the
+    response is complete. Paths not in ``traced_paths`` only get a trace ID.
+    """
+
+    def __init__(self, app, traced_paths: Sequence[str] = ()):
+        self.app = app
+        self.traced_paths = tuple(traced_paths)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        trace = RequestTrace(_client_trace_id(scope))
+        traced = scope["path"] in self.traced_paths
+        status = 500
+        response_started: Optional[float] = None
+
+        async def receive_counted():
+            message = await receive()
+            if message["type"] == "http.request":
+                trace.bytes_in += len(message.get("body", b""))
+            return message
+
+        async def send_counted(message):
+            nonlocal status, response_started
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                response_started = time.perf_counter()
+                message = dict(message, headers=list(message.get("headers", [])) + [
+                    (TRACE_HEADER.encode(), trace.trace_id.encode("latin-1")),
+                ])
+            elif message["type"] == "http.response.body":
+                trace.bytes_out += len(message.get("body", b""))
+            elif message["type"] == "http.response.zerocopysend":
+                trace.bytes_out += message.get("count") or 0
+            elif message["type"] == "http.response.pathsend":
+                trace.bytes_out += os.path.getsize(message["path"])
+            await send(message)
+            if response_started is not None and not message.get("more_body", False) and message["type"] != "http.response.start":
+                trace.add_stage("response", time.perf_counter() - response_started)
+                response_started = None
+
+        with activate(trace):
+            try:
+                await self.app(scope, receive_counted, send_counted)
+            finally:
+                if traced:
+                    trace.finish(status)
@@ -0,0 +1,204 @@
+"""Page-parallel OCR engine for PDFs.
+
+Pages are processed in small chunks by worker processes, each of which
+reopens the document by path, so no page images cross process boundaries.
+Pages that already carry an extractable text layer skip tesseract entirely.
+Results are yielded in page order as soon as each chunk completes.
+
+``make_searchable`` produces a searchable PDF instead of plain text. Workers
+ask tesseract for a text-only PDF of each page (``textonly_pdf=1``: invisible
+glyphs, no image), and the coordinator lays each one over its page with
+``show_pdf_page``. The output starts as a byte-for-byte copy of the input and
+the text layers are appended with an incremental save, so the original page
+content is never rasterized or rewritten. Pages that already have a text
+layer are left alone, which makes re-running a partly OCR'd document cheap.
+"""
+
+import os
+import re
+import shutil
+from concurrent.futures import Executor
+from dataclasses import dataclass
+from typing import Callable, Iterator, List, Optional, Tuple
+
+import fitz  # PyMuPDF
+import pytesseract
+from fastapi import HTTPException
+from PIL import Image
+
+from workers import iter_ordered
+
+# Tesseract's own OpenMP threads fight with our worker processes for cores
+os.environ.setdefault("OMP_THREAD_LIMIT", "1")
+
+# Render resolution used when the caller does not pick one
+OCR_DEFAULT_DPI = int(os.getenv("OCR_DEFAULT_DPI", "150"))
+OCR_MIN_DPI = 36
+OCR_MAX_DPI = 600
+
+# Pages handed to a worker per task; small chunks keep workers evenly loaded
+OCR_CHUNK_PAGES = int(os.getenv("OCR_CHUNK_PAGES", "2"))
+
+# A page with at least this many characters of embedded text is not OCR'd
+OCR_MIN_TEXT_CHARS = int(os.getenv("OCR_MIN_TEXT_CHARS", "16"))
+
+LANGUAGE_PATTERN = re.compile(r"^[A-Za-z_]+(\+[A-Za-z_]+)*$")
+
+
+@dataclass(frozen=True)
+class OCROptions:
+    dpi: int = OCR_DEFAULT_DPI
+    grayscale: bool = True
+    language: str = "eng"
+    skip_text_layer: bool = True
+
+    def validate(self) -> "OCROptions":
+        if not OCR_MIN_DPI <= self.dpi <= OCR_MAX_DPI:
+            raise HTTPException(status_code=400, detail=f"OCR DPI must be between {OCR_MIN_DPI} and {OCR_MAX_DPI}")
+        if not LANGUAGE_PATTERN.match(self.language):
+            raise HTTPException(status_code=400, detail=f"Invalid OCR language: {self.language}")
+        return self
+
+
+@dataclass
+class PageText:
+    page_number: int  # 1-based
+    text: str
+    source: str       # "text-layer" or "ocr"
+
+    def to_dict(self):
+        return {"page": self.page_number, "text": self.text, "source": self.source}
+
+
+def page_count(pdf_path: str) -> int:
+    with fitz.open(pdf_path) as doc:
+        return len(doc)
+
+
+def has_text_layer(page: "fitz.Page") -> Optional[str]:
+    """Return the page's embedded text if it has a usable text layer."""
+    text = page.get_text()
+    return text if len(text.strip()) >= OCR_MIN_TEXT_CHARS else None
+
+
+def render_page(page: "fitz.Page", dpi: int, grayscale: bool) -> Image.Image:
+    colorspace = fitz.csGRAY if grayscale else fitz.csRGB
+    pix = page.get_pixmap(dpi=dpi, colorspace=colorspace, alpha=False)
+    return Image.frombytes("L" if pix.n == 1 else "RGB", (pix.width, pix.height), pix.samples)
+
+
+def ocr_page_range(pdf_path: str, start: int, end: int, options: OCROptions) -> List[PageText]:
+    """OCR pages ``start`` to ``end - 1`` (0-based); runs inside a worker process."""
+    results = []
+    with fitz.open(pdf_path) as doc:
+        for page_num in range(start, min(end, len(doc))):
+            page = doc.load_page(page_num)
+            if options.skip_text_layer:
+                text = has_text_layer(page)
+                if text is not None:
+                    results.append(PageText(page_num + 1, text, "text-layer"))
+                    continue
+            img = render_page(page, options.dpi, options.grayscale)
+            text = pytesseract.image_to_string(img, lang=options.language)
+            results.append(PageText(page_num + 1, text, "ocr"))
+    return results
+
+
+def iter_ocr_pages(
+    pdf_path: str,
+    options: Optional[OCROptions] = None,
+    executor: Optional[Executor] = None,
+    progress: Optional[Callable[[int, int], None]] = None,
+    chunk_pages: int = OCR_CHUNK_PAGES,
+) -> Iterator[PageText]:
+    """Yield OCR results page by page, in order, fanning chunks out to ``executor``."""
+    options = (options or OCROptions()).validate()
+    total = page_count(pdf_path)
+    chunk_pages = max(1, chunk_pages)
+    chunks = ((pdf_path, start, start + chunk_pages, options) for start in range(0, total, chunk_pages))
+
+    done = 0
+    for pages in iter_ordered(executor, ocr_page_range, chunks):
+        for page in pages:
+            yield page
+        done += len(pages)
+        if progress:
+            progress(done, total)
+
+
+def format_page(page: PageText) -> str:
+    return f"Page {page.page_number}:\n{page.text}\n\n"
+
+
+# Searchable PDF output
+
+def ocr_layer_range(pdf_path: str, start: int, end: int, options: OCROptions) -> List[Tuple[int, Optional[bytes]]]:
+    """Text-only PDFs of pages ``start`` to ``end - 1``; ``None`` for pages that keep their own text."""
+    results = []
+    with fitz.open(pdf_path) as doc:
+        for page_num in range(start, min(end, len(doc))):
+            page = doc.load_page(page_num)
+            if options.skip_text_layer and has_text_layer(page) is not None:
+                results.append((page_num, None))
+                continue
+            img = render_page(page, options.dpi, options.grayscale)
+            try:
+                layer = pytesseract.image_to_pdf_or_hocr(
+                    img, lang=options.language, extension="pdf", config=f"--dpi {options.dpi} -c textonly_pdf=1"
+                )
+            except pytesseract.TesseractNotFoundError:
+                raise HTTPException(status_code=500, detail="Tesseract is not installed on this server")
+            results.append((page_num, layer))
+    return results
+
+
+def overlay_text_layer(page: "fitz.Page", layer: bytes):
+    """Lay a one-page text-only PDF, rendered upright, over ``page``."""
+    rotation = page.rotation
+    with fitz.open("pdf", layer) as source:
+        # show_pdf_page places the source in unrotated page space, turned by ``rotate``
+        page.set_rotation(0)
+        page.show_pdf_page(page.rect, source, 0, rotate=rotation)
+        page.set_rotation(rotation)
+
+
+def make_searchable(
+    pdf_path: str,
+    output_path: str,
+    options: Optional[OCROptions] = None,
+    executor: Optional[Executor] = None,
+    progress: Optional[Callable[[int, int], None]] = None,
+    chunk_pages: int = OCR_CHUNK_PAGES,
+) -> int:
+    """Write ``pdf_path`` with an invisible OCR text layer to ``output_path``; return the pages OCR'd."""
+    options = (options or OCROptions()).validate()
+    shutil.copyfile(pdf_path, output_path)
+    doc = fitz.open(output_path)
+    try:
+        if doc.needs_pass:
+            raise HTTPException(status_code=400, detail="The PDF is password protected")
+        total = len(doc)
+        chunk_pages = max(1, chunk_pages)
+        chunks = ((pdf_path, start, start + chunk_pages, options) for start in range(0, total, chunk_pages))
+
+        done = ocr_pages = 0
+        for pages in iter_ordered(executor, ocr_layer_range, chunks):
+            for page_num, layer in pages:
+                if layer is not None:
+                    overlay_text_layer(doc.load_page(page_num), layer)
+                    ocr_pages += 1
+            done += len(pages)
+            if progress:
+                progress(done, total)
+
+        if not ocr_pages:
+            return 0  # Every page already had text; the copy is the result
+        if doc.can_save_incrementally():
+            doc.saveIncr()
+        else:
+            # The input needed repairs on open and has to be rewritten
+            doc.save(f"{output_path}.tmp", garbage=1)
+            os.replace(f"{output_path}.tmp", output_path)
+        return ocr_pages
+    finally:
+        doc.close()
@@ -0,0 +1,391 @@
+"""Warm pool of headless LibreOffice workers for office-to-PDF conversions.
+
+Starting LibreOffice takes seconds, far longer than converting a typical
+document, so each worker keeps one soffice process (with its own user
+profile) running between jobs and drives it over UNO through
+``office_bridge.py``. Workers are started on first use, or at startup with
+``OFFICE_PREWARM``, and recycled after ``OFFICE_MAX_JOBS`` conversions, when
+their memory grows by more than ``OFFICE_MAX_RSS_GROWTH_MB``, when a job
+times out, or when LibreOffice dies.
+
+Where the UNO bridge is unavailable (no python3-uno), each job runs
+``soffice --convert-to`` instead. The per-worker profile directory still
+saves the first-start profile setup, but not the process start.
+"""
+
+import asyncio
+import json
+import logging
+import os
+import shutil
+import signal
+import subprocess
+import tempfile
+import time
+from pathlib import Path
+from typing import List, Optional, Set
+
+from fastapi import HTTPException
+
+import metrics
+from scheduler import AdmissionRejected
+
+logger = logging.getLogger(__name__)
+
+# Number of warm LibreOffice processes
+OFFICE_POOL_SIZE = int(os.getenv("OFFICE_POOL_SIZE", "2"))
+
+# Start every worker when the app starts instead of on first use
+OFFICE_PREWARM = os.getenv("OFFICE_PREWARM", "").lower() in ("1", "true", "yes")
+
+# Seconds one conversion may take before its worker is killed
+OFFICE_TIMEOUT = float(os.getenv("OFFICE_TIMEOUT", "120"))
+
+# Seconds LibreOffice may take to start and accept connections
+OFFICE_START_TIMEOUT = float(os.getenv("OFFICE_START_TIMEOUT", "60"))
+
+# Recycle a worker after this many conversions...
+OFFICE_MAX_JOBS = int(os.getenv("OFFICE_MAX_JOBS", "200"))
+
+# ...or once its memory has grown this much since it started
+OFFICE_MAX_RSS_GROWTH_MB = int(os.getenv("OFFICE_MAX_RSS_GROWTH_MB", "512"))
+
+# Requests allowed to wait for a free worker before returning 503
+OFFICE_MAX_WAITING = int(os.getenv("OFFICE_MAX_WAITING", str(OFFICE_POOL_SIZE * 4)))
+
+OFFICE_SOFFICE = os.getenv("OFFICE_SOFFICE") or shutil.which("soffice") or "soffice"
+
+# Interpreter with the uno module (Debian's python3-uno installs it for /usr/bin/python3)
+OFFICE_PYTHON = os.getenv("OFFICE_PYTHON", "/usr/bin/python3")
+
+BRIDGE_SCRIPT = str(Path(__file__).resolve().parent / "office_bridge.py")
+
+# LibreOffice export filter for each conversion type
+PDF_FILTERS = {
+    "docx-to-pdf": "writer_pdf_Export",
+    "xlsx-to-pdf": "calc_pdf_Export",
+    "pptx-to-pdf": "impress_pdf_Export",
+}
+
+CONVERSIONS = metrics.REGISTRY.register(metrics.Counter(
+    "office_conversions_total", "Office conversions by type and outcome.", ["conversion_type", "result"]
+))
+CONVERSION_SECONDS = metrics.REGISTRY.register(metrics.Histogram(
+    "office_conversion_seconds", "Time LibreOffice spent converting one document.", ["conversion_type"]
+))
+WORKER_STARTS = metrics.REGISTRY.register(metrics.Counter(
+    "office_worker_starts_total", "LibreOffice worker starts."
+))
+WORKER_RECYCLES = metrics.REGISTRY.register(metrics.Counter(
+    "office_worker_recycles_total", "LibreOffice workers restarted, by reason.", ["reason"]
+))
+WORKERS_BUSY = metrics.REGISTRY.register(metrics.Gauge("office_workers_busy", "LibreOffice workers converting a document."))
+WORKERS_WARM = metrics.REGISTRY.register(metrics.Gauge("office_workers_warm", "LibreOffice workers with a running process."))
+
+
+class OfficeError(Exception):
+    """LibreOffice reported that it could not convert a document."""
+
+
+def bridge_available() -> bool:
+    """Whether the UNO bridge can run, i.e. ``OFFICE_PYTHON`` can import uno."""
+    if not os.path.exists(OFFICE_PYTHON):
+        return False
+    try:
+        result = subprocess.run([OFFICE_PYTHON, "-c", "import uno"], capture_output=True, timeout=30)
+    except (OSError, subprocess.TimeoutExpired):
+        return False
+    return result.returncode == 0
+
+
+def _tree_rss_mb(pid: int) -> float:
+    """Resident memory of a process and its descendants (soffice forks soffice.bin)."""
+    total_kb = 0
+    pending = [pid]
+    while pending:
+        current = pending.pop()
+        try:
+            with open(f"/proc/{current}/status") as f:
+                for line in f:
+                    if line.startswith("VmRSS:"):
+                        total_kb += int(line.split()[1])
+            with open(f"/proc/{current}/task/{current}/children") as f:
+                pending.extend(int(child) for child in f.read().split())
+        except OSError:
+            continue
+    return total_kb / 1024
+
+
+async def _kill_group(process: Optional[asyncio.subprocess.Process]):
+    if process is None or process.returncode is not None:
+        return
+    for sig, wait in ((signal.SIGTERM, 5), (signal.SIGKILL, 5)):
+        try:
+            os.killpg(process.pid, sig)
+        except ProcessLookupError:
+            return
+        try:
+            await asyncio.wait_for(process.wait(), wait)
+            return
+        except asyncio.TimeoutError:
+            continue
+
+
+def office_command(profile_dir: Path, *args: str) -> List[str]:
+    return [
+        OFFICE_SOFFICE, "--headless", "--invisible", "--nologo", "--norestore", "--nodefault",
+        "--nolockcheck", f"-env:UserInstallation={profile_dir.resolve().as_uri()}", *args,
+    ]
+
+
+class OfficeWorker:
+    """One LibreOffice process plus the UNO bridge that talks to it."""
+
+    def __init__(self, index: int, root: Path, use_bridge: bool):
+        self.index = index
+        self.profile_dir = root / f"profile-{index}"
+        self.pipe_name = f"office-{os.getpid()}-{index}"
+        self.use_bridge = use_bridge
+        self.office: Optional[asyncio.subprocess.Process] = None
+        self.bridge: Optional[asyncio.subprocess.Process] = None
+        self.jobs = 0
+        self.baseline_rss = 0.0
+
+    @property
+    def running(self) -> bool:
+        if not self.use_bridge:
+            return self.profile_dir.exists()
+        return (
+            self.office is not None and self.office.returncode is None
+            and self.bridge is not None and self.bridge.returncode is None
+        )
+
+    async def start(self):
+        self.jobs = 0
+        self.profile_dir.mkdir(parents=True, exist_ok=True)
+        if not self.use_bridge:
+            return
+        self.office = await asyncio.create_subprocess_exec(
+            *office_command(self.profile_dir, f"--accept=pipe,name={self.pipe_name};urp;StarOffice.ComponentContext"),
+            stdout=asyncio.subprocess.DEVNULL,
+            stderr=asyncio.subprocess.DEVNULL,
+            start_new_session=True,
+        )
+        self.bridge = await asyncio.create_subprocess_exec(
+            OFFICE_PYTHON, BRIDGE_SCRIPT, self.pipe_name, str(OFFICE_START_TIMEOUT),
+            stdin=asyncio.subprocess.PIPE,
+            stdout=asyncio.subprocess.PIPE,
+            start_new_session=True,
+        )
+        try:
+            ready = await asyncio.wait_for(self.bridge.stdout.readline(), OFFICE_START_TIMEOUT + 5)
+            if not ready or not json.loads(ready).get("ready"):
+                raise OfficeError("LibreOffice bridge failed to connect")
+        except BaseException:
+            await self.stop()
+            raise
+        self.baseline_rss = _tree_rss_mb(self.office.pid)
+
+    async def stop(self):
+        await _kill_group(self.bridge)
+        await _kill_group(self.office)
+        self.bridge = self.office = None
+
+    async def convert(self, input_path: str, output_path: str, filter_name: str, timeout: float):
+        if self.use_bridge:
+            request = {"input": os.path.abspath(input_path), "output": os.path.abspath(output_path), "filter": filter_name}
+            self.bridge.stdin.write((json.dumps(request) + "\n").encode())
+            await self.bridge.stdin.drain()
+            line = await asyncio.wait_for(self.bridge.stdout.readline(), timeout)
+            if not line:
+                raise OfficeError("LibreOffice exited during the conversion")
+            reply = json.loads(line)
+            if not reply.get("ok"):
+                raise OfficeError(reply.get("error") or "conversion failed")
+        else:
+            await self._convert_once(input_path, output_path, filter_name, timeout)
+        self.jobs += 1
+
+    async def _convert_once(self, input_path: str, output_path: str, filter_name: str, timeout: float):
+        with tempfile.TemporaryDirectory(dir=self.profile_dir.parent) as outdir:
+            try:
+                process = await asyncio.create_subprocess_exec(
+                    *office_command(self.profile_dir, "--convert-to", f"pdf:{filter_name}", "--outdir", outdir, input_path),
+                    stdout=asyncio.subprocess.DEVNULL,
+                    stderr=asyncio.subprocess.PIPE,
+                    start_new_session=True,
+                )
+            except OSError as e:
+                # LibreOffice is not installed; retrying will not help
+                raise HTTPException(status_code=500, detail=f"Office conversion is unavailable: {e}")
+            try:
+                _, stderr = await asyncio.wait_for(process.communicate(), timeout)
+            except BaseException:
+                await _kill_group(process)
+                raise
+            produced = Path(outdir) / f"{Path(input_path).stem}.pdf"
+            if process.returncode != 0 or not produced.exists():
+                raise OfficeError(stderr.decode(errors="replace").strip() or "conversion failed")
+            shutil.move(str(produced), output_path)
+
+    def recycle_reason(self) -> Optional[str]:
+        """Why this worker should be restarted before its next job, if it should."""
+        if not self.use_bridge or not self.running:
+            # Stopped workers are started again by their next job
+            return None
+        if self.jobs >= OFFICE_MAX_JOBS:
+            return "jobs"
+        if _tree_rss_mb(self.office.pid) - self.baseline_rss > OFFICE_MAX_RSS_GROWTH_MB:
+            return "memory"
+        return None
+
+
+class OfficePool:
+    """Hands documents to idle warm workers, bounded by ``OFFICE_MAX_WAITING``."""
+
+    def __init__(self, root: Path, size: int = OFFICE_POOL_SIZE, max_waiting: int = OFFICE_MAX_WAITING):
+        self.root = Path(root)
+        self.size = max(1, size)
+        self.max_waiting = max_waiting
+        self.workers: List[OfficeWorker] = []
+        self._idle: Optional[asyncio.Queue] = None
+        self._waiting = 0
+        self._busy = 0
+        self._recycling: Set[asyncio.Task] = set()
+        WORKERS_BUSY.set_function(lambda: self._busy)
+        WORKERS_WARM.set_function(lambda: sum(1 for worker in self.workers if worker.use_bridge and worker.running))
+
+    async def start(self, prewarm: bool = OFFICE_PREWARM):
+        if self._idle is not None:
+            return
+        self.root.mkdir(parents=True, exist_ok=True)
+        use_bridge = await asyncio.to_thread(bridge_available)
+        if not use_bridge:
+            logger.warning("python3-uno is not available; office conversions start LibreOffice per job")
+        self.workers = [OfficeWorker(i, self.root, use_bridge) for i in range(self.size)]
+        self._idle = asyncio.Queue()
+        for worker in self.workers:
+            self._idle.put_nowait(worker)
+        if prewarm and use_bridge:
+            results = await asyncio.gather(*(self._start_worker(w) for w in self.workers), return_exceptions=True)
+            for result in results:
+                if isinstance(result, BaseException):
+                    logger.error(f"Could not prewarm LibreOffice: {result}")
+
+    async def stop(self):
+        for task in self._recycling:
+            task.cancel()
+        await asyncio.gather(*self._recycling, return_exceptions=True)
+        await asyncio.gather(*(worker.stop() for worker in self.workers), return_exceptions=True)
+        self._idle = None
+
+    async def _start_worker(self, worker: OfficeWorker):
+        started = time.perf_counter()
+        await worker.start()
+        if worker.use_bridge:
+            WORKER_STARTS.inc()
+            logger.info(f"Started LibreOffice worker {worker.index} in {time.perf_counter() - started:.1f}s")
+
+    async def _recycle(self, worker: OfficeWorker, reason: str):
+        """Restart a worker in the background so the next job finds it warm."""
+        WORKER_RECYCLES.inc(reason=reason)
+        logger.info(f"Recycling LibreOffice worker {worker.index}: {reason}")
+        try:
+            await worker.stop()
+            await self._start_worker(worker)
+        except Exception as e:
+            # The next job retries the start
+            logger.error(f"Could not restart LibreOffice worker {worker.index}: {e}")
+        finally:
+            if self._idle is not None:
+                self._idle.put_nowait(worker)
+
+    def _release(self, worker: OfficeWorker, reason: Optional[str]):
+        if reason is not None and worker.use_bridge:
+            task = asyncio.create_task(self._recycle(worker, reason))
+            self._recycling.add(task)
+            task.add_done_callback(self._recycling.discard)
+        elif self._idle is not None:
+            self._idle.put_nowait(worker)
+
+    async def convert(self, conversion_type: str, input_path: str, output_path: str, timeout: float = OFFICE_TIMEOUT) -> str:
+        filter_name = PDF_FILTERS.get(conversion_type)
+        if filter_name is None:
+            raise HTTPException(status_code=400, detail=f"Unsupported office conversion: {conversion_type}")
+        await self.start()
+        if self._waiting >= self.max_waiting:
+            raise AdmissionRejected(
+                status_code=503,
+                detail="Office conversion queue is full, please retry later",
+                headers={"Retry-After": str(int(OFFICE_TIMEOUT // 4) or 1)},
+            )
+
+        self._waiting += 1
+        try:
+            worker = await self._idle.get()
+        finally:
+            self._waiting -= 1
+
+        self._busy += 1
+        started = time.perf_counter()
+        # A timed-out or cancelled job may still answer later, so its bridge is never reused
+        failure: Optional[str] = "cancelled"
+        try:
+            if not worker.running:
+                try:
+                    await self._start_worker(worker)
+                except OSError as e:
+                    failure = None
+                    raise HTTPException(status_code=500, detail=f"Office conversion is unavailable: {e}")
+                except (OfficeError, asyncio.TimeoutError) as e:
+                    failure = None  # Nothing to recycle; the next job tries again
+                    logger.error(f"Could not start LibreOffice: {e}")
+                    raise HTTPException(
+                        status_code=503,
+                        detail="Office conversion is unavailable, please retry later",
+                        headers={"Retry-After": str(int(OFFICE_TIMEOUT // 4) or 1)},
+                    )
+            await worker.convert(input_path, output_path, filter_name, timeout)
+            failure = None
+            CONVERSIONS.inc(conversion_type=conversion_type, result="ok")
+            CONVERSION_SECONDS.observe(time.perf_counter() - started, conversion_type=conversion_type)
+            return output_path
+        except asyncio.TimeoutError:
+            failure = "timeout"
+            CONVERSIONS.inc(conversion_type=conversion_type, result="timeout")
+            raise HTTPException(status_code=504, detail=f"Office conversion timed out after {timeout:.0f}s")
+        except OfficeError as e:
+            # LibreOffice answered, so the worker is fine unless it died
+            failure = None
+            CONVERSIONS.inc(conversion_type=conversion_type, result="error")
+            raise HTTPException(status_code=422, detail=f"Office conversion failed: {e}")
+        except HTTPException:
+            raise
+        except Exception:
+            failure = "error"
+            CONVERSIONS.inc(conversion_type=conversion_type, result="error")
+            raise
+        finally:
+            self._busy -= 1
+            self._release(worker, failure or worker.recycle_reason())
+
+
+def convert_once(conversion_type: str, input_path: str, output_path: str, timeout: float = OFFICE_TIMEOUT) -> str:
+    """Synchronous one-shot conversion for callers outside the event loop (CLI, workers)."""
+    filter_name = PDF_FILTERS.get(conversion_type, "writer_pdf_Export")
+    with tempfile.TemporaryDirectory() as workdir:
+        profile_dir = Path(workdir) / "profile"
+        try:
+            subprocess.run(
+                office_command(profile_dir, "--convert-to", f"pdf:{filter_name}", "--outdir", workdir, input_path),
+                capture_output=True, timeout=timeout, check=True,
+            )
+        except subprocess.TimeoutExpired:
+            raise HTTPException(status_code=504, detail=f"Office conversion timed out after {timeout:.0f}s")
+        except (OSError, subprocess.CalledProcessError) as e:
+            raise HTTPException(status_code=422, detail=f"Office conversion failed: {e}")
+        produced = Path(workdir) / f"{Path(input_path).stem}.pdf"
+        if not produced.exists():
+            raise HTTPException(status_code=422, detail="Office conversion failed: LibreOffice produced no output")
+        shutil.move(str(produced), output_path)
+    return output_path
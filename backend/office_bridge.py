@@ -0,0 +1,75 @@
+"""UNO client that drives one warm LibreOffice process.
+
+Runs under the system Python that ships the ``uno`` module (python3-uno), not
+the application's interpreter. It connects to the soffice instance listening
+on the given pipe, then converts documents on request: one JSON object per
+line on stdin (``input``, ``output``, ``filter``), one JSON reply per line on
+stdout. Started and supervised by ``office.OfficeWorker``.
+"""
+
+import json
+import sys
+import time
+
+import uno
+from com.sun.star.beans import PropertyValue
+
+
+def prop(name, value):
+    p = PropertyValue()
+    p.Name = name
+    p.Value = value
+    return p
+
+
+def connect(pipe_name, timeout):
+    local_context = uno.getComponentContext()
+    resolver = local_context.ServiceManager.createInstanceWithContext(
+        "com.sun.star.bridge.UnoUrlResolver", local_context
+    )
+    deadline = time.time() + timeout
+    while True:
+        try:
+            context = resolver.resolve(f"uno:pipe,name={pipe_name};urp;StarOffice.ComponentContext")
+            return context.ServiceManager.createInstanceWithContext("com.sun.star.frame.Desktop", context)
+        except Exception:
+            # soffice is still starting up
+            if time.time() > deadline:
+                raise
+            time.sleep(0.25)
+
+
+def convert(desktop, request):
+    document = desktop.loadComponentFromURL(
+        uno.systemPathToFileUrl(request["input"]),
+        "_blank",
+        0,
+        (prop("Hidden", True), prop("ReadOnly", True), prop("UpdateDocMode", 0)),
+    )
+    if document is None:
+        raise RuntimeError("LibreOffice could not open the document")
+    try:
+        document.storeToURL(uno.systemPathToFileUrl(request["output"]), (prop("FilterName", request["filter"]),))
+    finally:
+        document.close(True)
+
+
+def reply(message):
+    sys.stdout.write(json.dumps(message) + "\n")
+    sys.stdout.flush()
+
+
+def main():
+    pipe_name, timeout = sys.argv[1], float(sys.argv[2])
+    desktop = connect(pipe_name, timeout)
+    reply({"ready": True})
+    for line in sys.stdin:
+        try:
+            convert(desktop, json.loads(line))
+            reply({"ok": True})
+        except Exception as e:
+            reply({"ok": False, "error": str(e)})
+
+
+if __name__ == "__main__":
+    main()
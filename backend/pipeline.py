@@ -0,0 +1,234 @@
+"""Multi-step PDF pipelines run on one document.
+
+Chaining conversions through ``/api/convert`` (merge, then compress, then
+protect) uploads, parses and saves the whole PDF once per step. A pipeline
+runs the same steps on one document and serializes it at the end, plus at
+most once more per compress step (see below):
+
+* ``merge-pdfs`` builds the document from all inputs (first step only);
+* ``pdf-unlock`` authenticates an encrypted input (first step only);
+* ``pdf-compress`` recompresses the embedded images (smart mode; raster
+  mode would replace the pages with pictures, which the later steps could
+  not work on);
+* ``pdf-protect`` encrypts the final save (last step only).
+
+The document is opened, modified and saved by worker processes, never by
+the process that coordinates the pipeline. A compress step needs the
+document on disk for the workers that re-encode its images in parallel.
+When the upload is compressed as it is, the workers read the uploaded file;
+a merged, unlocked or already recompressed document is first written as an
+uncompressed working copy (``{output}.step{n}.pdf``, deleted at the end),
+and the worker that continues from that copy applies the re-encoded images.
+So merge, compress and protect save twice: the working copy and the output.
+
+Steps arrive as a JSON list, each with its own options, for example
+``[{"type": "merge-pdfs"}, {"type": "pdf-compress", "compression_level": 60},
+{"type": "pdf-protect", "password": "secret"}]``. They are validated as a
+whole before any work starts.
+"""
+
+import json
+import os
+import time
+from concurrent.futures import Executor
+from dataclasses import asdict, dataclass
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import fitz  # PyMuPDF
+from fastapi import HTTPException
+
+import assembly
+import compression
+import metrics
+from workers import run_in_worker
+
+PIPELINE_STEPS = ("merge-pdfs", "pdf-unlock", "pdf-compress", "pdf-protect")
+
+# Steps that only make sense at the start or the end of a pipeline
+FIRST_ONLY_STEPS = {"merge-pdfs", "pdf-unlock"}
+LAST_ONLY_STEPS = {"pdf-protect"}
+
+# Steps whose outputs depend on a password and are therefore never cached
+SECRET_STEPS = {"pdf-unlock", "pdf-protect"}
+
+MAX_PIPELINE_STEPS = 10
+
+
+@dataclass(frozen=True)
+class Step:
+    type: str
+    compression_level: int = 70
+    compression_mode: str = "smart"
+    password: Optional[str] = None
+
+    def cache_params(self) -> Dict[str, Any]:
+        params = asdict(self)
+        params.pop("password")
+        return params
+
+
+def _step(index: int, raw: Any) -> Step:
+    if not isinstance(raw, dict) or not isinstance(raw.get("type"), str):
+        raise HTTPException(status_code=400, detail=f"Step {index} must be an object with a type")
+    if raw["type"] not in PIPELINE_STEPS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Step {index}: {raw['type']} cannot run in a pipeline (expected one of {', '.join(PIPELINE_STEPS)})",
+        )
+    unknown = set(raw) - {"type", "compression_level", "compression_mode", "password"}
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Step {index}: unknown options {', '.join(sorted(unknown))}")
+    try:
+        step = Step(
+            type=raw["type"],
+            compression_level=int(raw.get("compression_level", 70)),
+            compression_mode=str(raw.get("compression_mode", "smart")),
+            password=raw.get("password"),
+        )
+    except (TypeError, ValueError):
+        raise HTTPException(status_code=400, detail=f"Step {index}: compression_level must be an integer")
+    if step.type == "pdf-compress":
+        if compression.validate_mode(step.compression_mode) != "smart":
+            raise HTTPException(status_code=400, detail=f"Step {index}: pipelines only support smart compression")
+        if not 1 <= step.compression_level <= 100:
+            raise HTTPException(status_code=400, detail=f"Step {index}: compression_level must be between 1 and 100")
+    if step.type in SECRET_STEPS and not step.password:
+        raise HTTPException(status_code=400, detail=f"Step {index}: {step.type} requires a password")
+    return step
+
+
+def parse_steps(spec: Optional[str], input_count: int) -> List[Step]:
+    """Parse and validate the ``steps`` form field against the number of uploaded files."""
+    if not spec:
+        raise HTTPException(status_code=400, detail="Pipeline steps are required")
+    try:
+        raw_steps = json.loads(spec)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Pipeline steps must be a JSON list")
+    if not isinstance(raw_steps, list) or not raw_steps:
+        raise HTTPException(status_code=400, detail="Pipeline steps must be a non-empty JSON list")
+    if len(raw_steps) > MAX_PIPELINE_STEPS:
+        raise HTTPException(status_code=400, detail=f"A pipeline has at most {MAX_PIPELINE_STEPS} steps")
+
+    steps = [_step(index, raw) for index, raw in enumerate(raw_steps, start=1)]
+    for index, step in enumerate(steps, start=1):
+        if step.type in FIRST_ONLY_STEPS and index != 1:
+            raise HTTPException(status_code=400, detail=f"Step {index}: {step.type} must be the first step")
+        if step.type in LAST_ONLY_STEPS and index != len(steps):
+            raise HTTPException(status_code=400, detail=f"Step {index}: {step.type} must be the last step")
+    if steps[0].type == "merge-pdfs":
+        if input_count < 2:
+            raise HTTPException(status_code=400, detail="merge-pdfs needs at least two files")
+    elif input_count != 1:
+        raise HTTPException(status_code=400, detail="A pipeline without merge-pdfs takes exactly one file")
+    return steps
+
+
+def has_secrets(steps: List[Step]) -> bool:
+    return any(step.type in SECRET_STEPS for step in steps)
+
+
+def cache_params(steps: List[Step]) -> List[Dict[str, Any]]:
+    return [step.cache_params() for step in steps]
+
+
+def _open_input(opening: Optional[Step], input_paths: List[str]) -> "fitz.Document":
+    if opening is not None and opening.type == "merge-pdfs":
+        doc = fitz.open()
+        for pdf_path in input_paths:
+            with assembly.open_source(pdf_path) as source:
+                doc.insert_pdf(source)
+        return doc
+    doc = fitz.open(input_paths[0])
+    if opening is not None and opening.type == "pdf-unlock":
+        if doc.needs_pass and not doc.authenticate(opening.password):
+            doc.close()
+            raise HTTPException(status_code=400, detail="Invalid password")
+        return doc
+    if doc.needs_pass:
+        doc.close()
+        raise HTTPException(status_code=400, detail="The PDF is password protected; start the pipeline with pdf-unlock")
+    return doc
+
+
+def run_segment(
+    input_paths: List[str],
+    opening: Optional[Step],
+    replacements: List[Tuple[int, int, bytes]],
+    output_path: Optional[str],
+    save_options: Dict[str, Any],
+    scan_quality: Optional[int] = None,
+) -> List[compression.ImageCandidate]:
+    """Open the document, apply re-encoded images and save it; runs inside a worker process.
+
+    ``opening`` is the merge or unlock step the document is built with, if
+    any. With ``scan_quality``, returns the images of the saved document
+    worth recompressing at that quality; without an ``output_path`` the
+    input is only scanned.
+    """
+    doc = _open_input(opening, input_paths)
+    try:
+        if output_path is None:
+            return compression.find_image_candidates(doc, scan_quality)
+        compression.replace_images(doc, replacements)
+        doc.save(output_path, **save_options)
+    finally:
+        doc.close()
+    if scan_quality is None:
+        return []
+    return compression.scan_images(output_path, scan_quality)
+
+
+def run_pipeline(
+    input_paths: List[str],
+    output_path: str,
+    steps: List[Step],
+    executor: Optional[Executor] = None,
+    progress: Optional[Callable[[int, int], None]] = None,
+) -> str:
+    """Run ``steps`` on one document and save it to ``output_path``.
+
+    Each compress step on a merged, unlocked or already recompressed
+    document also saves a working copy first; see the module docstring.
+    """
+    trace = metrics.current_trace()
+    save_options = dict(assembly.COMPACT_SAVE_OPTIONS)
+    if steps[-1].type == "pdf-protect":
+        save_options.update(encryption=fitz.PDF_ENCRYPT_AES_256, user_pw=steps[-1].password, owner_pw=steps[-1].password)
+    # What the next worker builds the document from
+    opening = steps[0] if steps[0].type in FIRST_ONLY_STEPS else None
+    sources = list(input_paths)
+    replacements: List[Tuple[int, int, bytes]] = []
+    working_copies = []
+    started = time.perf_counter()
+    try:
+        for done, step in enumerate(steps, start=1):
+            if step.type == "pdf-compress":
+                if opening is None and not replacements:
+                    # The document is the uploaded file as it is; scan it in place
+                    candidates = run_in_worker(
+                        executor, run_segment, sources, None, [], None, {}, step.compression_level
+                    )
+                else:
+                    working_path = f"{output_path}.step{done}.pdf"
+                    working_copies.append(working_path)
+                    candidates = run_in_worker(
+                        executor, run_segment, sources, opening, replacements, working_path, {}, step.compression_level
+                    )
+                    opening, sources = None, [working_path]
+                # Embedded images are re-encoded by the workers, which reopen the file
+                replacements = compression.encode_images(sources[0], candidates, step.compression_level, executor=executor)
+            # merge-pdfs, pdf-unlock and pdf-protect are applied when the document is opened or saved
+            trace.add_stage(f"step:{step.type}", time.perf_counter() - started)
+            started = time.perf_counter()
+            if progress:
+                progress(done, len(steps))
+        with trace.stage("step:save"):
+            run_in_worker(executor, run_segment, sources, opening, replacements, output_path, save_options)
+    finally:
+        for working_path in working_copies:
+            try:
+                os.unlink(working_path)
+            except OSError:
+                pass
+    return output_path
@@ -0,0 +1,232 @@
+"""Page previews rendered on demand, with a two-tier render cache.
+
+A preview is one page (or a region of it, ``clip``) of a stored document or
+a job's PDF output, rendered with PyMuPDF so that its long side is ``size``
+pixels and encoded as WebP or PNG. Users scrub through a document, asking
+for the same pages again and again, so renders are cached:
+
+* a memory tier, an LRU bounded in bytes, answers repeated requests without
+  leaving the event loop;
+* a disk tier keeps renders across restarts and outlives memory evictions.
+  Files are written under a temporary name and renamed into place; eviction
+  is least-recently-used by mtime, serialized across processes with a lock.
+
+Keys are the SHA-256 of the document's bytes plus every parameter of the
+render, so a re-uploaded file or a second job with the same output shares
+its previews. Rendering itself runs in the worker pool.
+"""
+
+import fcntl
+import hashlib
+import io
+import json
+import os
+import tempfile
+from collections import OrderedDict
+from functools import lru_cache
+from pathlib import Path
+from typing import Optional, Tuple
+
+import fitz  # PyMuPDF
+from fastapi import HTTPException
+from PIL import Image
+
+from cache import CACHE_DIR, hash_file
+
+PREVIEW_FORMATS = ("webp", "png")
+
+PREVIEW_MEDIA_TYPES = {"webp": "image/webp", "png": "image/png"}
+
+# Accepted range of the long side of a preview, in pixels
+PREVIEW_MIN_SIZE = 16
+PREVIEW_MAX_SIZE = int(os.getenv("PREVIEW_MAX_SIZE", "2048"))
+
+# Largest zoom factor; keeps tiny clips from rendering at absurd resolutions
+PREVIEW_MAX_SCALE = float(os.getenv("PREVIEW_MAX_SCALE", "8"))
+
+PREVIEW_WEBP_QUALITY = int(os.getenv("PREVIEW_WEBP_QUALITY", "80"))
+
+# Size of the in-memory tier
+PREVIEW_MEMORY_BYTES = int(os.getenv("PREVIEW_MEMORY_BYTES", str(64 * 1024 * 1024)))
+
+# Size of the disk tier before least-recently-used renders are evicted
+PREVIEW_DISK_DIR = Path(os.getenv("PREVIEW_DISK_DIR", str(CACHE_DIR / "previews")))
+PREVIEW_DISK_MAX_BYTES = int(os.getenv("PREVIEW_DISK_MAX_BYTES", str(256 * 1024 * 1024)))
+
+# The disk tier is trimmed after this many stored renders
+PREVIEW_EVICT_EVERY = int(os.getenv("PREVIEW_EVICT_EVERY", "64"))
+
+# Bump when rendering changes so stale previews are never served
+PREVIEW_VERSION = "1"
+
+Clip = Tuple[float, float, float, float]
+
+
+def validate_size(size: int) -> int:
+    if not PREVIEW_MIN_SIZE <= size <= PREVIEW_MAX_SIZE:
+        raise HTTPException(
+            status_code=400, detail=f"size must be between {PREVIEW_MIN_SIZE} and {PREVIEW_MAX_SIZE}"
+        )
+    return size
+
+
+def validate_format(image_format: str) -> str:
+    if image_format not in PREVIEW_FORMATS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Unknown preview format: {image_format} (expected one of {', '.join(PREVIEW_FORMATS)})",
+        )
+    return image_format
+
+
+def parse_clip(spec: Optional[str]) -> Optional[Clip]:
+    """Parse ``"x0,y0,x1,y1"``: a region of the page as fractions of its width and height."""
+    if not spec:
+        return None
+    try:
+        x0, y0, x1, y1 = (float(value) for value in spec.split(","))
+    except ValueError:
+        raise HTTPException(status_code=400, detail="clip must be four numbers: x0,y0,x1,y1")
+    if not (0 <= x0 < x1 <= 1 and 0 <= y0 < y1 <= 1):
+        raise HTTPException(status_code=400, detail="clip must be a non-empty region within 0..1")
+    return x0, y0, x1, y1
+
+
+def key(document_hash: str, page: int, size: int, image_format: str, clip: Optional[Clip]) -> str:
+    material = json.dumps(
+        {"v": PREVIEW_VERSION, "doc": document_hash, "page": page, "size": size, "format": image_format, "clip": clip},
+        sort_keys=True,
+    )
+    return hashlib.sha256(material.encode()).hexdigest()
+
+
+@lru_cache(maxsize=256)
+def _hash_version(path: str, mtime_ns: int, size: int) -> str:
+    return hash_file(path)
+
+
+def document_hash(path: str) -> str:
+    """SHA-256 of a file, computed once per version of the file."""
+    stat = os.stat(path)
+    return _hash_version(path, stat.st_mtime_ns, stat.st_size)
+
+
+def render_page(pdf_path: str, page: int, size: int, image_format: str, clip: Optional[Clip] = None) -> bytes:
+    """Render 1-based ``page`` (or its ``clip`` region) with a long side of ``size`` pixels."""
+    with fitz.open(pdf_path) as doc:
+        if doc.needs_pass:
+            raise HTTPException(status_code=400, detail="The PDF is password protected")
+        if not 1 <= page <= doc.page_count:
+            raise HTTPException(status_code=400, detail=f"Page {page} is out of range (1-{doc.page_count})")
+        pdf_page = doc[page - 1]
+        area = pdf_page.rect
+        if clip is not None:
+            x0, y0, x1, y1 = clip
+            area = fitz.Rect(
+                area.x0 + x0 * area.width, area.y0 + y0 * area.height,
+                area.x0 + x1 * area.width, area.y0 + y1 * area.height,
+            )
+        # Only the clipped region is rasterized, at exactly the requested size
+        scale = min(size / max(area.width, area.height), PREVIEW_MAX_SCALE)
+        pixmap = pdf_page.get_pixmap(matrix=fitz.Matrix(scale, scale), clip=area, alpha=False)
+    if image_format == "png":
+        return pixmap.tobytes("png")
+    mode = "L" if pixmap.n == 1 else "RGB"
+    buffer = io.BytesIO()
+    Image.frombytes(mode, (pixmap.width, pixmap.height), pixmap.samples).save(
+        buffer, "WEBP", quality=PREVIEW_WEBP_QUALITY, method=0
+    )
+    return buffer.getvalue()
+
+
+class PreviewCache:
+    """Memory LRU in front of a disk cache of rendered previews."""
+
+    def __init__(
+        self,
+        root: Path = PREVIEW_DISK_DIR,
+        memory_bytes: int = PREVIEW_MEMORY_BYTES,
+        disk_bytes: int = PREVIEW_DISK_MAX_BYTES,
+    ):
+        self.root = Path(root)
+        self.memory_bytes = memory_bytes
+        self.disk_bytes = disk_bytes
+        self._memory: "OrderedDict[str, bytes]" = OrderedDict()
+        self._memory_size = 0
+        self._puts = 0
+        self.root.mkdir(parents=True, exist_ok=True)
+
+    def _path(self, key: str) -> Path:
+        return self.root / key[:2] / key
+
+    def get_memory(self, key: str) -> Optional[bytes]:
+        data = self._memory.get(key)
+        if data is not None:
+            self._memory.move_to_end(key)
+        return data
+
+    def put_memory(self, key: str, data: bytes):
+        if len(data) > self.memory_bytes or key in self._memory:
+            return
+        self._memory[key] = data
+        self._memory_size += len(data)
+        while self._memory_size > self.memory_bytes:
+            _, evicted = self._memory.popitem(last=False)
+            self._memory_size -= len(evicted)
+
+    def get_disk(self, key: str) -> Optional[bytes]:
+        """Read a render from the disk tier; blocking, call from a thread."""
+        path = self._path(key)
+        try:
+            with open(path, "rb") as f:
+                data = f.read()
+            # Touch for LRU ordering
+            os.utime(path)
+        except OSError:
+            return None
+        return data
+
+    def put_disk(self, key: str, data: bytes):
+        """Write a render to the disk tier; blocking, call from a thread."""
+        if self.disk_bytes <= 0:
+            return
+        path = self._path(key)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        fd, staging = tempfile.mkstemp(dir=path.parent, prefix=".tmp-")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+            os.replace(staging, path)
+        except Exception:
+            os.unlink(staging)
+            raise
+        self._puts += 1
+        if self._puts % PREVIEW_EVICT_EVERY == 0:
+            self.evict()
+
+    def evict(self):
+        """Remove least recently used renders until the disk tier fits ``disk_bytes``."""
+        with open(self.root / ".lock", "w") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            entries = []
+            for bucket in self.root.iterdir():
+                if not bucket.is_dir():
+                    continue
+                for path in bucket.iterdir():
+                    if path.name.startswith(".tmp-"):
+                        continue
+                    try:
+                        stat = path.stat()
+                    except OSError:
+                        continue
+                    entries.append((stat.st_mtime, stat.st_size, path))
+            entries.sort()
+            total = sum(size for _, size, _ in entries)
+            for _, size, path in entries:
+                if total <= self.disk_bytes:
+                    break
+                try:
+                    path.unlink()
+                except OSError:
+                    pass
+                total -= size
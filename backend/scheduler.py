@@ -0,0 +1,321 @@
+"""Fair-share admission of conversions to the worker pool.
+
+Every conversion asks the scheduler for one of the pool's slots. Requests
+are weighed by their estimated cost in worker-seconds (page count from the
+PDF, megapixels from the image header, a per-page or per-megapixel price for
+the conversion type) and fall into a cost class. Each class has a weight,
+and waiting requests are dispatched in start-time fair queueing order: a
+request's tag is its class's virtual finish time plus ``cost / weight``, and
+the smallest tag goes first. A burst of OCR jobs therefore advances its own
+class's clock quickly, while a thumbnail-sized ``png-to-jpg`` request that
+arrives behind it gets a small tag and overtakes it.
+
+Admission is refused early rather than queued forever:
+
+* with 503 when the admitted total reaches ``max_queue``;
+* with 429 when one client (an auth token or an IP address) already has
+  ``SCHEDULER_CLIENT_QUOTA`` conversions admitted;
+* with 503 when the estimated wait before dispatch, the cost queued ahead
+  plus the remaining cost of what is running divided by the slots, exceeds
+  the request's ``max_wait``.
+
+Rejections are ``AdmissionRejected`` errors with a Retry-After header. The per-type concurrency limits of
+the pool still apply at dispatch: a request whose type is at its limit is
+skipped in favour of the next tag. The client and cost of a request travel
+with it in a context variable (``demand``), so conversions deep in the call
+stack need not pass them along.
+"""
+
+import asyncio
+import hashlib
+import math
+import os
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from typing import Callable, Dict, List, Optional
+
+import fitz  # PyMuPDF
+from fastapi import HTTPException
+from PIL import Image
+
+import metrics
+
+# Conversions one client may have admitted (running or waiting) at once
+SCHEDULER_CLIENT_QUOTA = int(os.getenv("SCHEDULER_CLIENT_QUOTA", "4"))
+
+# Longest estimated wait, in seconds, before a synchronous request is rejected
+SCHEDULER_MAX_WAIT = float(os.getenv("SCHEDULER_MAX_WAIT", "30"))
+
+# Cost classes as (name, highest cost in worker-seconds, weight); cheap work gets the larger share
+COST_CLASSES = (
+    ("light", 2.0, 8),
+    ("standard", 20.0, 3),
+    ("heavy", math.inf, 1),
+)
+
+# Estimated worker-seconds per PDF page, by conversion type
+PAGE_COSTS = {
+    "pdf-ocr": 1.5,
+    "pdf-ocr-searchable": 1.5,
+    "pdf-compress": 0.2,
+    "batch-compress": 0.2,
+    "pdf-to-docx": 0.08,
+    "pdf-to-xlsx": 0.08,
+    "pdf-to-pptx": 0.1,
+    "pipeline": 0.1,
+    "flashcards": 0.05,
+}
+DEFAULT_PAGE_COST = 0.02
+
+# Estimated worker-seconds per image megapixel, by conversion type
+MEGAPIXEL_COSTS = {
+    "image-to-text": 0.8,
+}
+DEFAULT_MEGAPIXEL_COST = 0.05
+
+# Estimated worker-seconds per megabyte of an office document
+OFFICE_MEGABYTE_COST = 1.0
+
+# Fixed cost of any conversion: process hand-off, file I/O
+BASE_COST = 0.05
+
+# Cost assumed when nothing is known about a request
+DEFAULT_COST = 1.0
+
+
+class AdmissionRejected(HTTPException):
+    """A conversion refused before it started because capacity ran out.
+
+    Nothing was run, so retrying after ``Retry-After`` is safe; queued jobs
+    wait these out instead of failing.
+    """
+
+
+@dataclass
+class Demand:
+    """Who asks for a slot and how much work the conversion is expected to be."""
+
+    client: Optional[str] = None             # None: no per-client quota
+    cost: float = DEFAULT_COST               # Estimated worker-seconds
+    max_wait: Optional[float] = SCHEDULER_MAX_WAIT  # None: wait as long as it takes
+
+
+_current_demand: ContextVar[Optional[Demand]] = ContextVar("demand", default=None)
+
+
+def current_demand() -> Demand:
+    demand = _current_demand.get()
+    return demand if demand is not None else Demand()
+
+
+@contextmanager
+def demand(value: Demand):
+    """Make ``value`` the demand of the conversions started in the enclosed code."""
+    token = _current_demand.set(value)
+    try:
+        yield value
+    finally:
+        _current_demand.reset(token)
+
+
+def client_key(authorization: Optional[str], host: Optional[str]) -> str:
+    """Quota key of a request: a digest of its auth token, or its IP address."""
+    if authorization:
+        return "token:" + hashlib.sha256(authorization.encode()).hexdigest()[:16]
+    return f"ip:{host or 'unknown'}"
+
+
+def _pdf_pages(path: str) -> int:
+    try:
+        with fitz.open(path) as doc:
+            return max(1, doc.page_count)
+    except Exception:
+        return 1
+
+
+def _megapixels(path: str) -> float:
+    try:
+        with Image.open(path) as image:
+            return image.width * image.height / 1_000_000
+    except Exception:
+        return 1.0
+
+
+def estimate_cost(conversion_type: str, input_paths: List[str], upload_kinds: List[Optional[str]]) -> float:
+    """Estimated worker-seconds of a conversion, from the headers of its inputs.
+
+    Only the PDF cross-reference and image headers are read; blocking, call
+    from a thread.
+    """
+    cost = BASE_COST
+    for path, kind in zip(input_paths, upload_kinds):
+        if kind == "pdf":
+            cost += _pdf_pages(path) * PAGE_COSTS.get(conversion_type, DEFAULT_PAGE_COST)
+        elif kind in ("zip", "ole"):
+            cost += os.path.getsize(path) / (1024 * 1024) * OFFICE_MEGABYTE_COST
+        else:
+            cost += _megapixels(path) * MEGAPIXEL_COSTS.get(conversion_type, DEFAULT_MEGAPIXEL_COST)
+    return cost
+
+
+def cost_class(cost: float) -> str:
+    for name, highest, _ in COST_CLASSES:
+        if cost <= highest:
+            return name
+    return COST_CLASSES[-1][0]
+
+
+@dataclass
+class _Ticket:
+    conversion_type: str
+    client: Optional[str]
+    cost: float
+    cost_class: str
+    start: float                             # Virtual start tag
+    finish: float                            # Virtual finish tag; dispatch order
+    future: asyncio.Future = field(repr=False)
+    dispatched_at: float = 0.0
+
+
+class FairScheduler:
+    """Weighted fair queueing of conversions over a fixed number of slots."""
+
+    def __init__(
+        self,
+        slots: int,
+        limit_for: Callable[[str], int],
+        max_queue: int,
+        client_quota: int = SCHEDULER_CLIENT_QUOTA,
+        retry_after: int = 5,
+    ):
+        self.slots = max(1, slots)
+        self.limit_for = limit_for
+        self.max_queue = max(1, max_queue)
+        self.client_quota = client_quota
+        self.retry_after = retry_after
+        self.weights = {name: weight for name, _, weight in COST_CLASSES}
+        self._waiting: List[_Ticket] = []
+        self._running: List[_Ticket] = []
+        self._running_by_type: Dict[str, int] = {}
+        self._clients: Dict[str, int] = {}
+        self._class_finish: Dict[str, float] = {}
+        self._virtual_time = 0.0
+
+    @property
+    def admitted(self) -> int:
+        return len(self._waiting) + len(self._running)
+
+    @property
+    def waiting(self) -> int:
+        return len(self._waiting)
+
+    def estimated_wait(self, finish: float) -> float:
+        """Seconds until a request with tag ``finish`` would be dispatched."""
+        now = time.monotonic()
+        running = sum(max(0.0, ticket.cost - (now - ticket.dispatched_at)) for ticket in self._running)
+        ahead = sum(ticket.cost for ticket in self._waiting if ticket.finish <= finish)
+        # What runs and what is queued ahead drains across all slots
+        if len(self._running) < self.slots and not ahead:
+            return 0.0
+        return (running + ahead) / self.slots
+
+    def _reject(self, status_code: int, detail: str, retry_after: float, reason: str):
+        metrics.SCHEDULER_REJECTIONS.inc(reason=reason)
+        retry_after = max(self.retry_after, math.ceil(retry_after))
+        raise AdmissionRejected(status_code=status_code, detail=detail, headers={"Retry-After": str(retry_after)})
+
+    async def acquire(self, conversion_type: str, request: Optional[Demand] = None) -> Callable[[], None]:
+        """Wait for a slot and return the function that frees it."""
+        request = request or current_demand()
+        if self.admitted >= self.max_queue:
+            self._reject(503, "Server is busy, please retry later", 0, "queue_full")
+        if request.client is not None and self._clients.get(request.client, 0) >= self.client_quota:
+            self._reject(
+                429, "Too many concurrent requests from this client, please retry later", 0, "client_quota"
+            )
+
+        name = cost_class(request.cost)
+        start = max(self._virtual_time, self._class_finish.get(name, 0.0))
+        finish = start + request.cost / self.weights[name]
+        wait = self.estimated_wait(finish)
+        if request.max_wait is not None and wait > request.max_wait:
+            self._reject(
+                503,
+                f"Estimated wait of {wait:.0f}s exceeds {request.max_wait:.0f}s, please retry later",
+                wait - request.max_wait,
+                "deadline",
+            )
+
+        ticket = _Ticket(
+            conversion_type=conversion_type,
+            client=request.client,
+            cost=request.cost,
+            cost_class=name,
+            start=start,
+            finish=finish,
+            future=asyncio.get_running_loop().create_future(),
+        )
+        self._class_finish[name] = finish
+        self._waiting.append(ticket)
+        if ticket.client is not None:
+            self._clients[ticket.client] = self._clients.get(ticket.client, 0) + 1
+        self._dispatch()
+
+        queued_at = time.perf_counter()
+        try:
+            await ticket.future
+        except BaseException:
+            if ticket.future.done() and not ticket.future.cancelled():
+                # Dispatched just as the caller went away
+                self._finish(ticket)
+            else:
+                self._waiting.remove(ticket)
+                self._forget_client(ticket)
+                self._dispatch()
+            raise
+        metrics.current_trace().add_stage("admission", time.perf_counter() - queued_at)
+
+        released = False
+
+        def release():
+            nonlocal released
+            if not released:
+                released = True
+                self._finish(ticket)
+
+        return release
+
+    def _dispatch(self):
+        while len(self._running) < self.slots and self._waiting:
+            eligible = [
+                ticket for ticket in self._waiting
+                if self._running_by_type.get(ticket.conversion_type, 0) < self.limit_for(ticket.conversion_type)
+            ]
+            if not eligible:
+                return
+            ticket = min(eligible, key=lambda ticket: (ticket.finish, ticket.start))
+            self._waiting.remove(ticket)
+            self._running.append(ticket)
+            self._running_by_type[ticket.conversion_type] = self._running_by_type.get(ticket.conversion_type, 0) + 1
+            self._virtual_time = max(self._virtual_time, ticket.start)
+            ticket.dispatched_at = time.monotonic()
+            ticket.future.set_result(None)
+
+    def _finish(self, ticket: _Ticket):
+        self._running.remove(ticket)
+        self._running_by_type[ticket.conversion_type] -= 1
+        self._forget_client(ticket)
+        if not self._running and not self._waiting:
+            # Idle: restart the virtual clock so tags stay small
+            self._virtual_time = 0.0
+            self._class_finish.clear()
+        self._dispatch()
+
+    def _forget_client(self, ticket: _Ticket):
+        if ticket.client is None:
+            return
+        self._clients[ticket.client] -= 1
+        if not self._clients[ticket.client]:
+            del self._clients[ticket.client]
@@ -0,0 +1,80 @@
+"""Coalescing of identical conversions that are in flight at the same time.
+
+When a shared PDF goes round a class, dozens of requests for the same
+conversion of the same bytes arrive within seconds, all missing the result
+cache because none of them has finished yet. ``SingleFlight`` runs one task
+per key (the result cache key) and lets every concurrent caller wait for it.
+
+The task is awaited through ``asyncio.shield``: a caller that disconnects is
+cancelled on its own, without cancelling the work the others are waiting
+for. The task also keeps running when every caller has gone, so its result
+still lands in the result cache. Callers use the result inside ``join``;
+the ``cleanup`` of the flight (removing its working directory) runs once the
+task has finished and the last caller has left.
+"""
+
+import asyncio
+import logging
+from contextlib import asynccontextmanager
+from dataclasses import dataclass
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class _Flight:
+    key: str
+    task: asyncio.Task
+    cleanup: Optional[Callable[[], None]]
+    waiters: int = 0
+    cleaned: bool = False
+
+
+class SingleFlight:
+    """At most one running task per key; concurrent callers share its result."""
+
+    def __init__(self):
+        self._flights: Dict[str, _Flight] = {}
+
+    def __len__(self) -> int:
+        return len(self._flights)
+
+    @asynccontextmanager
+    async def join(
+        self,
+        key: str,
+        fn: Callable[[], Awaitable[Any]],
+        cleanup: Optional[Callable[[], None]] = None,
+    ) -> AsyncIterator[Tuple[Any, bool]]:
+        """Run ``fn()`` unless a task for ``key`` is running; yield ``(result, leader)``.
+
+        ``leader`` is True for the caller that started the task. ``fn`` and
+        ``cleanup`` of the other callers are ignored.
+        """
+        flight = self._flights.get(key)
+        leader = flight is None
+        if leader:
+            flight = self._flights[key] = _Flight(key=key, task=asyncio.create_task(fn()), cleanup=cleanup)
+            flight.task.add_done_callback(lambda task: self._finished(flight))
+        flight.waiters += 1
+        try:
+            yield await asyncio.shield(flight.task), leader
+        finally:
+            flight.waiters -= 1
+            self._release(flight)
+
+    def _finished(self, flight: _Flight):
+        if not flight.task.cancelled() and flight.task.exception() is not None and not flight.waiters:
+            logger.error(f"Shared conversion failed after its callers left: {flight.task.exception()}")
+        self._release(flight)
+
+    def _release(self, flight: _Flight):
+        if flight.cleaned or flight.waiters or not flight.task.done():
+            return
+        flight.cleaned = True
+        # Later callers start a new task instead of joining one whose files are gone
+        if self._flights.get(flight.key) is flight:
+            del self._flights[flight.key]
+        if flight.cleanup is not None:
+            flight.cleanup()
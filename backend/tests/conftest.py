@@ -0,0 +1,36 @@
+"""Shared fixtures. Run from the backend directory: ``python -m pytest``."""
+
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import pytest
+
+
+@pytest.fixture
+def executor():
+    # Spawned like the API's pool, so task functions must live at module level
+    pool = ProcessPoolExecutor(2, mp_context=multiprocessing.get_context("spawn"))
+    yield pool
+    pool.shutdown(wait=True, cancel_futures=True)
+
+
+@pytest.fixture(scope="session")
+def app_dir(tmp_path_factory):
+    # main keeps uploads and the caches under the working directory
+    directory = tmp_path_factory.mktemp("app")
+    previous = os.getcwd()
+    os.chdir(directory)
+    yield directory
+    os.chdir(previous)
+
+
+@pytest.fixture
+def client(app_dir):
+    """The API with its worker pool running, served in-process."""
+    from fastapi.testclient import TestClient
+
+    import main
+
+    with TestClient(main.app) as client:
+        yield client
@@ -0,0 +1,34 @@
+import io
+import zipfile
+
+from archive import ZipStream
+
+
+def test_zip_stream_is_readable(tmp_path):
+    pdf = tmp_path / "a.pdf"
+    pdf.write_bytes(b"%PDF-1.7 " + bytes(range(256)) * 4000)
+    text = tmp_path / "a.txt"
+    text.write_text("hello " * 10_000)
+
+    stream = ZipStream()
+    chunks = []
+    chunks += list(stream.add_file(str(pdf), stream.unique_name("a.pdf")))
+    chunks += list(stream.add_file(str(text), stream.unique_name("a.txt")))
+    chunks.append(stream.add_bytes(stream.unique_name("a.txt"), b"second"))
+    chunks.append(stream.close())
+
+    with zipfile.ZipFile(io.BytesIO(b"".join(chunks))) as archive:
+        assert archive.testzip() is None
+        assert archive.namelist() == ["a.pdf", "a.txt", "a-2.txt"]
+        assert archive.read("a.pdf") == pdf.read_bytes()
+        assert archive.read("a.txt") == text.read_bytes()
+        assert archive.read("a-2.txt") == b"second"
+        # Already-compressed outputs are stored, text is deflated
+        assert archive.getinfo("a.pdf").compress_type == zipfile.ZIP_STORED
+        assert archive.getinfo("a.txt").compress_type == zipfile.ZIP_DEFLATED
+
+
+def test_empty_zip_stream():
+    data = ZipStream().close()
+    with zipfile.ZipFile(io.BytesIO(data)) as archive:
+        assert archive.namelist() == []
@@ -0,0 +1,42 @@
+import asyncio
+import os
+import time
+
+import pytest
+from starlette.background import BackgroundTask
+
+from artifacts import ArtifactResponse, RequestDirectories, parse_range
+
+
+def test_parse_range():
+    assert parse_range("bytes=0-99", 1000) == (0, 99)
+    assert parse_range("bytes=900-", 1000) == (900, 999)
+    assert parse_range("bytes=-100", 1000) == (900, 999)
+    assert parse_range("bytes=0-5000", 1000) == (0, 999)
+    assert parse_range("bytes=0-1,5-6", 1000) is None
+    with pytest.raises(ValueError):
+        parse_range("bytes=1000-", 1000)
+
+
+def test_directory_is_released_when_sending_fails(tmp_path):
+    directories = RequestDirectories(tmp_path)
+    directory = directories.create()
+    response = ArtifactResponse(os.path.join(directory, "missing.pdf"), background=BackgroundTask(directories.release, directory))
+
+    async def send(message):
+        pass
+
+    with pytest.raises(RuntimeError):
+        asyncio.run(response({"type": "http", "method": "GET", "headers": []}, None, send))
+    assert not os.path.exists(directory)
+    assert directory not in directories.active
+
+
+def test_sweep_reclaims_lost_active_directories(tmp_path):
+    directories = RequestDirectories(tmp_path, ttl=60, active_ttl=3600)
+    directory = directories.create()
+    assert directories.sweep(time.time() + 600) == 0
+    assert os.path.exists(directory)
+    assert directories.sweep(time.time() + 7200) == 1
+    assert not os.path.exists(directory)
+    assert directory not in directories.active
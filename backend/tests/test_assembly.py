@@ -0,0 +1,118 @@
+import io
+import zipfile
+
+import fitz
+import pytest
+from fastapi import HTTPException
+from PIL import Image
+
+import assembly
+from assembly import images_to_pdf, merge, range_name, split
+
+
+def make_pdf(path, pages, label):
+    with fitz.open() as doc:
+        for number in range(pages):
+            doc.new_page().insert_text((72, 72), f"{label} page {number + 1}")
+        doc.save(path)
+    return str(path)
+
+
+def page_texts(doc):
+    return [page.get_text().strip() for page in doc]
+
+
+@pytest.fixture
+def sources(tmp_path):
+    return [make_pdf(tmp_path / "a.pdf", 2, "A"), make_pdf(tmp_path / "b.pdf", 1, "B"), make_pdf(tmp_path / "c.pdf", 2, "C")]
+
+
+@pytest.mark.parametrize("save_mode", ["compact", "linear", "incremental"])
+def test_merge_save_modes(sources, tmp_path, save_mode):
+    output = str(tmp_path / "merged.pdf")
+    progress = []
+    merge(sources, output, save_mode, progress=lambda done, total: progress.append((done, total)))
+    with fitz.open(output) as doc:
+        assert page_texts(doc) == ["A page 1", "A page 2", "B page 1", "C page 1", "C page 2"]
+        assert doc.is_fast_webaccess == (save_mode == "linear")
+    if save_mode == "incremental":
+        # The first file is kept as it is and the others are appended after it
+        original = open(sources[0], "rb").read()
+        assert open(output, "rb").read().startswith(original)
+        assert progress == [(2, 3), (3, 3)]
+    else:
+        assert progress == [(1, 3), (2, 3), (3, 3)]
+
+
+def test_merge_rejects_protected_inputs(sources, tmp_path):
+    locked = str(tmp_path / "locked.pdf")
+    with fitz.open(sources[1]) as doc:
+        doc.save(locked, encryption=fitz.PDF_ENCRYPT_AES_256, user_pw="secret", owner_pw="secret")
+    with pytest.raises(HTTPException) as excinfo:
+        merge([sources[0], locked], str(tmp_path / "merged.pdf"))
+    assert excinfo.value.status_code == 400
+    assert "locked.pdf" in excinfo.value.detail
+
+
+def test_split_single_range_is_a_pdf(sources, tmp_path):
+    output = str(tmp_path / "out.pdf")
+    split(sources[0], output, [(1, 2)], "a")
+    with fitz.open(output) as doc:
+        assert page_texts(doc) == ["A page 2"]
+
+
+def test_split_ranges_are_named_in_a_zip(sources, tmp_path):
+    output = str(tmp_path / "a-split.zip")
+    split(sources[0], output, [(0, 1), (0, 2), (0, 1)], "a", save_mode="linear")
+    with zipfile.ZipFile(output) as archive:
+        names = archive.namelist()
+        # Repeated ranges get the range number appended
+        assert names == [range_name("a", 0, 1), range_name("a", 0, 2), "a-page-1-3.pdf"]
+        assert names[:2] == ["a-page-1.pdf", "a-pages-1-2.pdf"]
+        with fitz.open("pdf", io.BytesIO(archive.read("a-pages-1-2.pdf"))) as doc:
+            assert page_texts(doc) == ["A page 1", "A page 2"]
+            assert doc.is_fast_webaccess
+    # Nothing but the archive is left behind
+    assert sorted(p.name for p in tmp_path.iterdir()) == ["a-split.zip", "a.pdf", "b.pdf", "c.pdf"]
+
+
+def test_split_has_no_incremental_mode(sources, tmp_path):
+    with pytest.raises(HTTPException):
+        split(sources[0], str(tmp_path / "out.zip"), [(0, 1), (1, 2)], "a", save_mode="incremental")
+
+
+def save_image(path, size, color, image_format="JPEG"):
+    Image.new("RGB", size, color).save(path, image_format)
+    return str(path)
+
+
+def test_images_to_pdf_flushes_pages_in_order(tmp_path, executor, monkeypatch):
+    monkeypatch.setattr(assembly, "IMAGES_FLUSH_PAGES", 2)
+    sizes = [(300 + 10 * n, 200) for n in range(5)]
+    paths = [save_image(tmp_path / f"{n}.png", size, "blue", "PNG") for n, size in enumerate(sizes)]
+    output = str(tmp_path / "images.pdf")
+    progress = []
+    images_to_pdf(paths, output, executor=executor, progress=lambda done, total: progress.append(done))
+    with fitz.open(output) as doc:
+        # Pages written before each flush keep their order and size
+        assert [(page.rect.width, page.rect.height) for page in doc] == sizes
+        assert all(len(page.get_images()) == 1 for page in doc)
+    assert progress == [1, 2, 3, 4, 5]
+
+
+def test_images_to_pdf_embeds_fitting_jpegs_untouched(tmp_path):
+    photo = save_image(tmp_path / "photo.jpg", (320, 240), "green")
+    output = str(tmp_path / "images.pdf")
+    images_to_pdf([photo], output)
+    with fitz.open(output) as doc:
+        xref = doc[0].get_images()[0][0]
+        assert doc.extract_image(xref)["image"] == open(photo, "rb").read()
+
+    # A max_dimension or a paper page size re-encodes the image
+    images_to_pdf([photo], output, max_dimension=100)
+    with fitz.open(output) as doc:
+        assert doc.extract_image(doc[0].get_images()[0][0])["image"] != open(photo, "rb").read()
+    images_to_pdf([photo], output, page_size="a4")
+    with fitz.open(output) as doc:
+        # Landscape images get a landscape A4 page
+        assert doc[0].rect.width > doc[0].rect.height
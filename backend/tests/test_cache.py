@@ -0,0 +1,93 @@
+import os
+import time
+
+from cache import KEY_OPTIONS, ResultCache, key_params
+
+
+def store(cache: ResultCache, tmp_path, name: str, size: int) -> str:
+    artifact = tmp_path / f"{name}.pdf"
+    artifact.write_bytes(b"x" * size)
+    key = ResultCache.key("pdf-compress", [name], {"compression_level": 70})
+    cache.put(key, str(artifact), f"{name}-compressed.pdf", name, "application/pdf", None)
+    return key
+
+
+def test_key_depends_on_inputs_and_params():
+    key = ResultCache.key("pdf-compress", ["a"], {"compression_level": 70})
+    assert key == ResultCache.key("pdf-compress", ["a"], {"compression_level": 70})
+    assert key != ResultCache.key("pdf-compress", ["b"], {"compression_level": 70})
+    assert key != ResultCache.key("pdf-compress", ["a"], {"compression_level": 60})
+    assert key != ResultCache.key("pdf-ocr", ["a"], {"compression_level": 70})
+
+
+def test_key_params_keep_the_options_a_conversion_reads():
+    options = {"compression_level": 70, "compression_mode": "auto", "page_ranges": "1-2", "text_format": "text"}
+    assert key_params("pdf-compress", options) == {"compression_level": 70, "compression_mode": "auto"}
+    assert key_params("pdf-to-text", options) == {"page_ranges": "1-2", "text_format": "text"}
+    assert key_params("pdf-to-docx", options) == {}
+    # Unknown conversions keep every option rather than risk sharing an entry
+    assert key_params("not-a-type", options) == options
+    assert all(isinstance(names, tuple) for names in KEY_OPTIONS.values())
+
+
+def test_put_then_get(tmp_path):
+    cache = ResultCache(tmp_path / "cache", max_bytes=10_000)
+    key = store(cache, tmp_path, "report", 100)
+    entry = cache.get(key)
+    assert entry is not None
+    assert open(entry.path, "rb").read() == b"x" * 100
+    # The filename follows the stem of whichever upload hit the entry
+    assert entry.filename_for("other") == "other-compressed.pdf"
+    assert entry.media_type == "application/pdf"
+    assert cache.get("0" * 64) is None
+
+
+def test_json_results(tmp_path):
+    cache = ResultCache(tmp_path / "cache", max_bytes=10_000)
+    cache.put("ab" * 32, None, None, "doc", None, {"text": "hello"})
+    entry = cache.get("ab" * 32)
+    assert entry.path is None
+    assert entry.data == {"text": "hello"}
+
+
+def test_uncacheable_types(tmp_path):
+    cache = ResultCache(tmp_path / "cache", max_bytes=10_000)
+    assert cache.cacheable("pdf-compress")
+    assert not cache.cacheable("pdf-protect")
+    assert not ResultCache(tmp_path / "off", max_bytes=0).cacheable("pdf-compress")
+
+
+def test_evicts_least_recently_used(tmp_path):
+    cache = ResultCache(tmp_path / "cache", max_bytes=1000)
+    keys = []
+    for i in range(4):
+        keys.append(store(cache, tmp_path, f"doc{i}", 300))
+        # Keep the first entry recently used
+        os.utime(cache._entry_dir(keys[0]) / "meta.json", (time.time() + 10, time.time() + 10))
+    assert cache.get(keys[0]) is not None
+    assert cache.get(keys[1]) is None
+    assert cache.get(keys[3]) is not None
+    assert cache._size <= 1000
+
+
+def test_eviction_only_walks_when_over_the_limit(tmp_path, monkeypatch):
+    cache = ResultCache(tmp_path / "cache", max_bytes=10_000)
+    walks = []
+    entries = cache._entries
+    monkeypatch.setattr(cache, "_entries", lambda: walks.append(1) or entries())
+    for i in range(50):
+        store(cache, tmp_path, f"doc{i}", 100)
+    # The first put learns the size; later ones only add to the running total
+    assert len(walks) == 1
+    for i in range(50, 120):
+        store(cache, tmp_path, f"doc{i}", 100)
+    assert 1 < len(walks) < 20
+    assert cache._size <= 10_000
+
+
+def test_existing_entry_is_kept(tmp_path):
+    cache = ResultCache(tmp_path / "cache", max_bytes=10_000)
+    key = store(cache, tmp_path, "doc", 100)
+    (tmp_path / "other.pdf").write_bytes(b"y" * 50)
+    cache.put(key, str(tmp_path / "other.pdf"), "doc-compressed.pdf", "doc", "application/pdf", None)
+    assert open(cache.get(key).path, "rb").read() == b"x" * 100
@@ -0,0 +1,115 @@
+import dataclasses
+import json
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+import fitz
+import pytest
+
+import cli
+
+
+def make_pdf(path, text):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with fitz.open() as doc:
+        doc.new_page().insert_text((72, 72), text)
+        doc.save(path)
+    return path
+
+
+def crash_on_marked_files():
+    """Worker initializer: a file named ``crash*`` kills the worker, like a native library dying."""
+    conversion = cli.CONVERSIONS["pdf-to-text"]
+
+    def run(source, output, settings):
+        if Path(source).name.startswith("crash"):
+            os._exit(1)
+        return conversion.run(source, output, settings)
+
+    cli.CONVERSIONS["pdf-to-text"] = dataclasses.replace(conversion, run=run)
+
+
+def manifest_records(output):
+    with open(output / ".manifest.jsonl", encoding="utf-8") as f:
+        return [json.loads(line) for line in f]
+
+
+@pytest.fixture
+def tree(tmp_path):
+    source = tmp_path / "source"
+    make_pdf(source / "a.pdf", "Alpha")
+    make_pdf(source / "nested" / "b.pdf", "Beta")
+    (source / "notes.txt").write_text("not a PDF")
+    return source
+
+
+def test_converts_the_tree_and_resumes_from_the_manifest(tree, tmp_path, monkeypatch):
+    output = tmp_path / "out"
+    args = cli.parse_args([str(tree), str(output), "--conversion", "pdf-to-text", "--workers", "2"])
+    assert cli.run(args) == 0
+    assert (output / "a.txt").read_text().strip() == "Alpha"
+    assert (output / "nested" / "b.txt").read_text().strip() == "Beta"
+    assert sorted(record["source"] for record in manifest_records(output)) == ["a.pdf", os.path.join("nested", "b.pdf")]
+    # Outputs are renamed into place; no staging files are left behind
+    assert not list(output.rglob(".partial-*"))
+
+    # A rerun reads nothing it has already converted
+    hashed = []
+    real_hash = cli.hash_file
+    monkeypatch.setattr(cli, "hash_file", lambda path: hashed.append(path) or real_hash(path))
+    make_pdf(tree / "c.pdf", "Gamma")
+    assert cli.run(args) == 0
+    assert hashed == [str(tree / "c.pdf")]
+    assert (output / "c.txt").read_text().strip() == "Gamma"
+
+    # Touched but unchanged files are hashed again and skipped, not converted
+    os.utime(tree / "a.pdf", ns=(0, 0))
+    before = (output / "a.txt").stat().st_mtime_ns
+    assert cli.run(args) == 0
+    assert (output / "a.txt").stat().st_mtime_ns == before
+    assert manifest_records(output)[-1]["mtime_ns"] == 0
+
+
+def test_identical_files_are_linked_not_converted(tree, tmp_path):
+    (tree / "copy.pdf").write_bytes((tree / "a.pdf").read_bytes())
+    output = tmp_path / "out"
+    assert cli.run(cli.parse_args([str(tree), str(output), "--conversion", "pdf-to-text", "--workers", "1"])) == 0
+    assert (output / "copy.txt").read_text() == (output / "a.txt").read_text()
+    assert (output / "copy.txt").stat().st_ino == (output / "a.txt").stat().st_ino
+
+
+def test_changed_settings_convert_again(tree, tmp_path):
+    output = tmp_path / "out"
+    arguments = [str(tree), str(output), "--conversion", "pdf-compress", "--workers", "1"]
+    assert cli.run(cli.parse_args(arguments)) == 0
+    compressed = output / "a-compressed.pdf"
+    first = compressed.stat().st_mtime_ns
+    assert cli.run(cli.parse_args(arguments)) == 0
+    assert compressed.stat().st_mtime_ns == first
+    assert cli.run(cli.parse_args(arguments + ["--compression-level", "40"])) == 0
+    assert compressed.stat().st_mtime_ns != first
+
+
+def test_a_crashing_file_fails_alone_and_is_retried_next_run(tree, tmp_path, monkeypatch):
+    make_pdf(tree / "crash.pdf", "Crashes the worker")
+    monkeypatch.setattr(cli, "_executor", lambda workers: ProcessPoolExecutor(
+        workers, mp_context=multiprocessing.get_context("spawn"), initializer=crash_on_marked_files
+    ))
+    output = tmp_path / "out"
+    args = cli.parse_args([str(tree), str(output), "--conversion", "pdf-to-text", "--workers", "2"])
+    assert cli.run(args) == 1
+
+    # The files in flight with it were converted again one at a time
+    latest = {record["source"]: record for record in manifest_records(output)}
+    assert latest["crash.pdf"]["status"] == "failed"
+    assert latest["a.pdf"]["status"] == "done" and latest[os.path.join("nested", "b.pdf")]["status"] == "done"
+    assert (output / "a.txt").read_text().strip() == "Alpha"
+    assert not (output / "crash.txt").exists()
+
+    # Failures are not recorded as done, so the next run tries the file again
+    monkeypatch.undo()
+    assert cli.run(args) == 0
+    assert (output / "crash.txt").read_text().strip() == "Crashes the worker"
+    assert manifest_records(output)[-1]["source"] == "crash.pdf"
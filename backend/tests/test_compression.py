@@ -0,0 +1,94 @@
+import io
+import os
+import random
+
+import fitz
+import pytest
+from fastapi import HTTPException
+from PIL import Image
+
+import compression
+from compression import compress, find_image_candidates, validate_mode
+
+
+def noisy_image(size, mode="RGB") -> bytes:
+    """Random pixels, so the encoded image is large and shrinks when downsampled."""
+    rng = random.Random(size[0] * size[1])
+    img = Image.frombytes(mode, size, rng.randbytes(size[0] * size[1] * len(mode)))
+    buffer = io.BytesIO()
+    img.save(buffer, "PNG" if "A" in mode else "JPEG", quality=95)
+    return buffer.getvalue()
+
+
+@pytest.fixture
+def photo_pdf(tmp_path):
+    """Two pages of text, each with a large photo shown small, and a transparent logo on page 1."""
+    path = tmp_path / "photos.pdf"
+    with fitz.open() as doc:
+        for number in range(2):
+            page = doc.new_page()
+            page.insert_text((72, 72), f"Caption for photo {number + 1}")
+            page.insert_image(fitz.Rect(72, 100, 216, 208), stream=noisy_image((800 + number, 600)))
+        doc[0].insert_image(fitz.Rect(300, 100, 364, 164), stream=noisy_image((200, 200), "RGBA"))
+        doc.save(path)
+    return str(path)
+
+
+def test_unknown_mode_is_rejected():
+    with pytest.raises(HTTPException) as excinfo:
+        validate_mode("lossless")
+    assert excinfo.value.status_code == 400
+
+
+def test_raster_renders_every_page_as_an_image(photo_pdf, tmp_path):
+    output = str(tmp_path / "raster.pdf")
+    progress = []
+    compress(photo_pdf, output, quality=40, mode="raster", progress=lambda done, total: progress.append((done, total)))
+    with fitz.open(output) as doc:
+        assert len(doc) == 2
+        # The text is flattened into the page images
+        assert all(page.get_text().strip() == "" for page in doc)
+        assert all(len(page.get_images()) == 1 for page in doc)
+    assert progress[-1] == (2, 2)
+
+
+def test_smart_skips_soft_masked_images(photo_pdf):
+    with fitz.open(photo_pdf) as doc:
+        candidates = find_image_candidates(doc, 70)
+        masked = [info[0] for info in doc[0].get_images(full=True) if info[1]]
+    assert len(candidates) == 2
+    assert masked and masked[0] not in {c.xref for c in candidates}
+    # Sized for the displayed rectangle at the target DPI, not the pixel size
+    assert all(c.max_width < 800 for c in candidates)
+
+
+def test_smart_keeps_text_and_shrinks_images(photo_pdf, tmp_path, executor, monkeypatch):
+    monkeypatch.setattr(compression, "SMART_CHUNK_IMAGES", 1)
+    output = str(tmp_path / "smart.pdf")
+    progress = []
+    compress(photo_pdf, output, quality=50, mode="smart", executor=executor,
+             progress=lambda done, total: progress.append((done, total)))
+    assert os.path.getsize(output) < os.path.getsize(photo_pdf)
+    with fitz.open(output) as doc:
+        assert "Caption for photo 1" in doc[0].get_text()
+        assert "Caption for photo 2" in doc[1].get_text()
+        # The transparent logo keeps its soft mask
+        assert any(info[1] for info in doc[0].get_images(full=True))
+    assert progress == [(1, 2), (2, 2)]
+
+
+def test_smart_encodes_a_chunk_per_task(photo_pdf, monkeypatch):
+    opened = []
+    real_open = compression.fitz.open
+
+    def counting_open(*args, **kwargs):
+        opened.append(args)
+        return real_open(*args, **kwargs)
+
+    with fitz.open(photo_pdf) as doc:
+        candidates = find_image_candidates(doc, 50)
+    monkeypatch.setattr(compression.fitz, "open", counting_open)
+    replacements = compression.encode_images(photo_pdf, candidates, 50)
+    # Both images are re-encoded after opening the document once
+    assert len(opened) == 1
+    assert sorted(page for page, _, _ in replacements) == [0, 1]
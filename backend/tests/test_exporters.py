@@ -0,0 +1,42 @@
+import docx
+import fitz
+import openpyxl
+import pptx
+import pytest
+
+from exporters import export_docx, export_pptx, export_xlsx
+
+
+@pytest.fixture
+def pdf_with_control_characters(tmp_path):
+    path = tmp_path / "control.pdf"
+    with fitz.open() as doc:
+        page = doc.new_page()
+        page.insert_text((72, 72), "Heading \x01 text")
+        for row in range(3):
+            for column in range(3):
+                rect = fitz.Rect(72 + column * 100, 120 + row * 20, 172 + column * 100, 140 + row * 20)
+                page.draw_rect(rect)
+                page.insert_text((rect.x0 + 4, rect.y1 - 5), f"c\x01{row}{column}")
+        doc.save(path)
+    return str(path)
+
+
+def test_docx_drops_control_characters(pdf_with_control_characters, tmp_path):
+    output = export_docx(pdf_with_control_characters, str(tmp_path / "out.docx"))
+    text = "\n".join(paragraph.text for paragraph in docx.Document(output).paragraphs)
+    assert "Heading  text" in text
+    assert "\x01" not in text
+
+
+def test_xlsx_drops_control_characters(pdf_with_control_characters, tmp_path):
+    output = export_xlsx(pdf_with_control_characters, str(tmp_path / "out.xlsx"))
+    rows = [[cell.value for cell in row] for sheet in openpyxl.load_workbook(output) for row in sheet.iter_rows()]
+    assert ["c00", "c01", "c02"] in rows
+
+
+def test_pptx_drops_control_characters(pdf_with_control_characters, tmp_path):
+    output = export_pptx(pdf_with_control_characters, str(tmp_path / "out.pptx"))
+    texts = [shape.text_frame.text for slide in pptx.Presentation(output).slides for shape in slide.shapes if shape.has_text_frame]
+    assert any("Heading" in text for text in texts)
+    assert not any("\x01" in text for text in texts)
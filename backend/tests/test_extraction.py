@@ -0,0 +1,29 @@
+import pytest
+from fastapi import HTTPException
+
+from extraction import parse_page_ranges
+
+
+@pytest.mark.parametrize(
+    "spec, expected",
+    [
+        (None, [(0, 10)]),
+        ("", [(0, 10)]),
+        ("  ", [(0, 10)]),
+        ("1", [(0, 1)]),
+        ("1-3", [(0, 3)]),
+        ("1-3,7,10-", [(0, 3), (6, 7), (9, 10)]),
+        ("-2", [(0, 2)]),
+        (" 2 - 4 , ,5", [(1, 4), (4, 5)]),
+        ("10", [(9, 10)]),
+    ],
+)
+def test_parse_page_ranges(spec, expected):
+    assert parse_page_ranges(spec, 10) == expected
+
+
+@pytest.mark.parametrize("spec", ["0", "11", "3-2", "5-11", "a", "1-b", ",", "1;2"])
+def test_parse_page_ranges_rejects(spec):
+    with pytest.raises(HTTPException) as error:
+        parse_page_ranges(spec, 10)
+    assert error.value.status_code == 400
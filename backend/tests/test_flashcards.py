@@ -0,0 +1,84 @@
+import flashcards
+from cache import ResultCache
+from flashcards import Chunk, FlashcardBackend, HeuristicBackend, LLMBackend, chunk_text, deduplicate, generate_flashcards
+
+TEXT = """Chapter 1 Cells
+
+A cell is the basic structural unit of every living organism. Cells divide to make new cells.
+
+Chapter 2 Energy
+
+Mitochondria are organelles that release energy from glucose. Energy is stored as ATP in every cell.
+"""
+
+
+class RecordingBackend(FlashcardBackend):
+    """One card per chunk, recording which chunks it was asked about."""
+
+    name = "recording"
+
+    def __init__(self, fail_on: str = ""):
+        self.calls = []
+        self.fail_on = fail_on
+        self.fallback = HeuristicBackend()
+
+    def generate(self, chunk, limit):
+        self.calls.append(chunk.section)
+        if self.fail_on and self.fail_on in chunk.section:
+            raise RuntimeError("service unavailable")
+        return [{"question": f"What is in {chunk.section}?", "answer": chunk.text[:40]}]
+
+
+def test_chunks_follow_sections():
+    chunks = chunk_text(TEXT)
+    assert [chunk.section for chunk in chunks] == ["Chapter 1 Cells", "Chapter 2 Energy"]
+    assert chunks[1].text.startswith("Mitochondria are organelles")
+
+
+def test_deduplicate_drops_near_repeats():
+    cards = [
+        {"question": "What is a cell?", "answer": "The basic unit of life."},
+        {"question": "What is a cell ?", "answer": "The basic unit of all life"},
+        {"question": "What are mitochondria?", "answer": "Organelles that release energy."},
+    ]
+    assert deduplicate(cards) == [cards[0], cards[2]]
+    # Normalized text that is identical is always a duplicate; close text only above the threshold
+    assert deduplicate([cards[0], dict(cards[0], answer="the BASIC unit of life")], threshold=1.01) == [cards[0]]
+    assert deduplicate(cards, threshold=1.01) == cards
+
+
+def test_memo_key_covers_chunk_backend_and_limit():
+    chunk = Chunk("Intro", "Some text.")
+    key = flashcards._memo_key(HeuristicBackend(), chunk, 3)
+    assert key == flashcards._memo_key(HeuristicBackend(), Chunk("Intro", "Some text."), 3)
+    assert key != flashcards._memo_key(HeuristicBackend(), chunk, 4)
+    assert key != flashcards._memo_key(HeuristicBackend(), Chunk("Other", "Some text."), 3)
+    assert key != flashcards._memo_key(LLMBackend(model="a"), chunk, 3)
+    assert flashcards._memo_key(LLMBackend(model="a"), chunk, 3) != flashcards._memo_key(LLMBackend(model="b"), chunk, 3)
+
+
+def test_only_changed_chunks_are_regenerated(tmp_path):
+    cache = ResultCache(tmp_path / "cache", max_bytes=1_000_000)
+    backend = RecordingBackend()
+    first = generate_flashcards(TEXT, backend=backend, cache=cache)
+    assert backend.calls == ["Chapter 1 Cells", "Chapter 2 Energy"]
+
+    backend.calls.clear()
+    assert generate_flashcards(TEXT, backend=backend, cache=cache) == first
+    assert backend.calls == []
+
+    edited = TEXT.replace("ATP", "adenosine triphosphate")
+    generate_flashcards(edited, backend=backend, cache=cache)
+    assert backend.calls == ["Chapter 2 Energy"]
+
+
+def test_failed_chunks_fall_back_and_are_not_memoized(tmp_path):
+    cache = ResultCache(tmp_path / "cache", max_bytes=1_000_000)
+    backend = RecordingBackend(fail_on="Energy")
+    cards = generate_flashcards(TEXT, backend=backend, cache=cache)
+    # The heuristic fallback answered for the failed chunk
+    assert any("Mitochondria" in card["answer"] or "mitochondria" in card["question"].lower() for card in cards)
+
+    backend.calls.clear()
+    generate_flashcards(TEXT, backend=backend, cache=cache)
+    assert backend.calls == ["Chapter 2 Energy"]
@@ -0,0 +1,83 @@
+import pytest
+from fastapi import HTTPException
+from PIL import Image
+
+import imaging
+from imaging import EXIF_ORIENTATION_TAG, convert_image, load_image, pdf_image
+
+
+def save_photo(path, size=(400, 200), orientation=None, mode="RGB"):
+    """A JPEG whose left half is red, tagged with ``orientation`` like a phone photo."""
+    image = Image.new(mode, size, "white")
+    image.paste("red" if mode == "RGB" else 0, (0, 0, size[0] // 2, size[1]))
+    exif = Image.Exif()
+    if orientation:
+        exif[EXIF_ORIENTATION_TAG] = orientation
+    image.save(path, "JPEG", exif=exif.tobytes(), quality=95)
+    return str(path)
+
+
+def test_exif_rotation_is_baked_into_reencoded_images(tmp_path):
+    # Orientation 6: the camera was turned, the image displays rotated 90 degrees clockwise
+    photo = save_photo(tmp_path / "photo.jpg", orientation=6)
+    output = convert_image(photo, str(tmp_path / "out.jpg"), "jpeg", 90)
+    with Image.open(output) as image:
+        assert image.size == (200, 400)
+        assert image.getexif().get(EXIF_ORIENTATION_TAG, 1) == 1
+        # The red half is now on top
+        assert image.getpixel((100, 50))[0] > 200 and image.getpixel((100, 50))[1] < 60
+        assert image.getpixel((100, 350))[1] > 200
+
+
+def test_fitting_jpegs_pass_through_with_their_rotation(tmp_path):
+    photo = save_photo(tmp_path / "photo.jpg", orientation=6)
+    width, height, data, rotate = pdf_image(photo)
+    assert (width, height, rotate) == (200, 400, 270)
+    assert data == open(photo, "rb").read()
+
+    # Too large for max_dimension: decoded, resized and turned upright instead
+    width, height, data, rotate = pdf_image(photo, max_dimension=100)
+    assert (width, height, rotate) == (50, 100, 0)
+    assert data != open(photo, "rb").read()
+
+    # Mirrored orientations cannot be expressed as a page rotation
+    mirrored = save_photo(tmp_path / "mirrored.jpg", orientation=5)
+    assert pdf_image(mirrored)[3] == 0
+    assert pdf_image(photo, passthrough=False)[2] != open(photo, "rb").read()
+
+
+def test_draft_decoding_never_goes_below_the_target(tmp_path):
+    photo = save_photo(tmp_path / "large.jpg", size=(4000, 3000))
+    image = load_image(photo, max_dimension=700)
+    assert image.size == (700, 525)
+
+
+def test_auto_format_keeps_transparency(tmp_path):
+    source = tmp_path / "logo.png"
+    Image.new("RGBA", (64, 64), (255, 0, 0, 128)).save(source)
+    output = convert_image(str(source), str(tmp_path / "logo.jpg"), "auto", 80)
+    assert output.endswith(".webp")
+    with Image.open(output) as image:
+        assert image.mode == "RGBA"
+
+
+def test_decompression_bombs_are_rejected_from_the_header(tmp_path, monkeypatch):
+    photo = save_photo(tmp_path / "photo.jpg", size=(400, 300))
+    monkeypatch.setattr(imaging, "IMAGE_MAX_PIXELS", 100_000)
+    with pytest.raises(HTTPException) as excinfo:
+        load_image(photo)
+    assert excinfo.value.status_code == 413
+
+    # Far past the limit Pillow itself refuses to open the file
+    monkeypatch.setattr(Image, "MAX_IMAGE_PIXELS", 50_000)
+    with pytest.raises(HTTPException) as excinfo:
+        pdf_image(photo)
+    assert excinfo.value.status_code == 413
+
+
+def test_files_that_are_not_images_are_rejected(tmp_path):
+    path = tmp_path / "notes.jpg"
+    path.write_bytes(b"not an image at all")
+    with pytest.raises(HTTPException) as excinfo:
+        load_image(str(path))
+    assert excinfo.value.status_code == 400
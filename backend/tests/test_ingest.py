@@ -0,0 +1,103 @@
+import asyncio
+import hashlib
+
+import pytest
+from fastapi import HTTPException
+from starlette.requests import Request
+
+from ingest import ingest_request, sniff_type
+
+BOUNDARY = "testboundary"
+
+
+def multipart(fields=(), files=()) -> bytes:
+    body = b""
+    for name, value in fields:
+        body += f'--{BOUNDARY}\r\nContent-Disposition: form-data; name="{name}"\r\n\r\n{value}\r\n'.encode()
+    for name, filename, data in files:
+        body += (
+            f'--{BOUNDARY}\r\nContent-Disposition: form-data; name="{name}"; filename="{filename}"\r\n'
+            "Content-Type: application/octet-stream\r\n\r\n"
+        ).encode() + data + b"\r\n"
+    return body + f"--{BOUNDARY}--\r\n".encode()
+
+
+def ingest(body: bytes, directory, send_length=True, chunk=4096, **limits):
+    """Feed ``body`` to ingest_request in network-sized chunks."""
+    headers = [(b"content-type", f"multipart/form-data; boundary={BOUNDARY}".encode())]
+    if send_length:
+        headers.append((b"content-length", str(len(body)).encode()))
+    chunks = iter([body[start:start + chunk] for start in range(0, len(body), chunk)] + [b""])
+
+    async def receive():
+        data = next(chunks)
+        return {"type": "http.request", "body": data, "more_body": bool(data)}
+
+    request = Request({"type": "http", "method": "POST", "headers": headers}, receive)
+    return asyncio.run(ingest_request(request, str(directory), **limits))
+
+
+def test_files_and_fields_are_written_hashed_and_sniffed(tmp_path):
+    pdf = b"%PDF-1.7\n" + b"x" * 10_000
+    form = ingest(multipart([("conversion_type", "pdf-compress")], [("file", "a.pdf", pdf), ("file", "a.pdf", b"\x89PNG\r\n\x1a\nrest")]), tmp_path)
+    assert form.get("conversion_type") == "pdf-compress"
+    first, second = form.files
+    assert open(first.path, "rb").read() == pdf
+    assert (first.size, first.sha256, first.kind) == (len(pdf), hashlib.sha256(pdf).hexdigest(), "pdf")
+    # A repeated name gets its own file
+    assert second.path != first.path and second.kind == "png"
+
+
+def test_file_cap(tmp_path):
+    body = multipart(files=[("file", "big.pdf", b"%PDF-" + b"x" * 100_000)])
+    with pytest.raises(HTTPException) as excinfo:
+        ingest(body, tmp_path, max_file_bytes=10_000, chunk=1024)
+    assert excinfo.value.status_code == 413
+    assert "big.pdf" in excinfo.value.detail
+
+
+def test_request_cap_from_content_length(tmp_path):
+    body = multipart(files=[("file", "a.pdf", b"%PDF-" + b"x" * 5000)])
+    with pytest.raises(HTTPException) as excinfo:
+        ingest(body, tmp_path, max_request_bytes=1000)
+    assert excinfo.value.status_code == 413
+
+
+def test_request_cap_without_content_length(tmp_path):
+    body = multipart(files=[("file", "a.pdf", b"%PDF-" + b"x" * 5000), ("file", "b.pdf", b"%PDF-" + b"x" * 5000)])
+    with pytest.raises(HTTPException) as excinfo:
+        ingest(body, tmp_path, send_length=False, chunk=1024, max_request_bytes=6000)
+    assert excinfo.value.status_code == 413
+
+
+def test_file_count_limit(tmp_path):
+    body = multipart(files=[("file", f"{n}.pdf", b"%PDF-1.7") for n in range(3)])
+    with pytest.raises(HTTPException) as excinfo:
+        ingest(body, tmp_path, max_files=2)
+    assert excinfo.value.status_code == 413
+    assert "Too many files" in excinfo.value.detail
+
+
+def test_non_multipart_requests_are_rejected(tmp_path):
+    async def receive():
+        return {"type": "http.request", "body": b"{}", "more_body": False}
+
+    request = Request({"type": "http", "method": "POST", "headers": [(b"content-type", b"application/json")]}, receive)
+    with pytest.raises(HTTPException) as excinfo:
+        asyncio.run(ingest_request(request, str(tmp_path)))
+    assert excinfo.value.status_code == 400
+
+
+@pytest.mark.parametrize("head, kind", [
+    (b"%PDF-1.4", "pdf"),
+    (b"junk before the header %PDF-1.4", "pdf"),
+    (b"\xff\xd8\xff\xe0", "jpeg"),
+    (b"RIFF\x00\x00\x00\x00WEBPVP8 ", "webp"),
+    (b"\x00\x00\x00\x1cftypavif", "avif"),
+    (b"\x00\x00\x00\x1cftypheic", "heif"),
+    (b"PK\x03\x04", "zip"),
+    (b"\xd0\xcf\x11\xe0\xa1\xb1\x1a\xe1", "ole"),
+    (b"plain text", None),
+])
+def test_sniff_type(head, kind):
+    assert sniff_type(head) == kind
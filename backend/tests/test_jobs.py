@@ -0,0 +1,77 @@
+import asyncio
+
+from fastapi import HTTPException
+
+from jobs import JobManager, JobState
+from scheduler import AdmissionRejected
+from workers import WorkerCrashed
+
+
+def run_job(tmp_path, handler, admission_timeout=5.0):
+    async def scenario():
+        manager = JobManager(tmp_path, handler, admission_timeout=admission_timeout)
+        job = manager.create("pdf-ocr")
+        await manager._run(job)
+        return job
+
+    return asyncio.run(scenario())
+
+
+def busy(status_code=503):
+    return AdmissionRejected(status_code=status_code, detail="Server is busy", headers={"Retry-After": "0.01"})
+
+
+def test_admission_rejections_are_retried(tmp_path):
+    calls = []
+
+    async def handler(job):
+        calls.append(1)
+        if len(calls) < 3:
+            raise busy(429 if len(calls) == 1 else 503)
+        return "done"
+
+    job = run_job(tmp_path, handler)
+    assert job.state == JobState.SUCCEEDED
+    assert job.result == "done"
+    assert len(calls) == 3
+
+
+def test_retries_stop_at_the_admission_timeout(tmp_path):
+    calls = []
+
+    async def handler(job):
+        calls.append(1)
+        raise busy()
+
+    job = run_job(tmp_path, handler, admission_timeout=0.1)
+    assert job.state == JobState.FAILED
+    assert "Server is busy" in job.error
+    assert 1 < len(calls) < 20
+    assert job.finished_at is not None
+
+
+def test_crashed_worker_is_not_retried(tmp_path):
+    calls = []
+
+    async def handler(job):
+        calls.append(1)
+        raise WorkerCrashed()
+
+    job = run_job(tmp_path, handler)
+    assert job.state == JobState.FAILED
+    assert len(calls) == 1
+
+
+def test_other_errors_fail_the_job(tmp_path):
+    async def unavailable(job):
+        raise HTTPException(status_code=503, detail="Office conversion is unavailable")
+
+    async def broken(job):
+        raise RuntimeError("boom")
+
+    job = run_job(tmp_path, unavailable)
+    assert job.state == JobState.FAILED
+    assert job.error == "Office conversion is unavailable"
+    job = run_job(tmp_path, broken)
+    assert job.state == JobState.FAILED
+    assert job.error == "boom"
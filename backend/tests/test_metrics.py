@@ -0,0 +1,80 @@
+import asyncio
+
+import metrics
+from metrics import Counter, Gauge, Histogram, Registry, TraceMiddleware
+
+
+def test_text_exposition_format():
+    registry = Registry()
+    requests = registry.register(Counter("requests_total", "Requests.", ["type", "status"]))
+    workers = registry.register(Gauge("workers", "Workers."))
+    latency = registry.register(Histogram("latency_seconds", "Latency.", ["type"], buckets=(0.1, 1)))
+    requests.inc(type="pdf-compress", status="200")
+    requests.inc(2, type="pdf-compress", status="200")
+    requests.inc(type='a "quoted"\nname', status="500")
+    workers.set_function(lambda: 4)
+    latency.observe(0.05, type="pdf-ocr")
+    latency.observe(0.5, type="pdf-ocr")
+    latency.observe(5, type="pdf-ocr")
+
+    assert registry.render() == "\n".join([
+        "# HELP requests_total Requests.",
+        "# TYPE requests_total counter",
+        'requests_total{type="a \\"quoted\\"\\nname",status="500"} 1',
+        'requests_total{type="pdf-compress",status="200"} 3',
+        "# HELP workers Workers.",
+        "# TYPE workers gauge",
+        "workers 4",
+        "# HELP latency_seconds Latency.",
+        "# TYPE latency_seconds histogram",
+        'latency_seconds_bucket{type="pdf-ocr",le="0.1"} 1',
+        'latency_seconds_bucket{type="pdf-ocr",le="1"} 2',
+        'latency_seconds_bucket{type="pdf-ocr",le="+Inf"} 3',
+        'latency_seconds_sum{type="pdf-ocr"} 5.55',
+        'latency_seconds_count{type="pdf-ocr"} 3',
+    ]) + "\n"
+
+
+def test_conversion_type_labels_are_capped(monkeypatch):
+    monkeypatch.setattr(metrics, "_seen_conversion_types", set())
+    monkeypatch.setattr(metrics, "MAX_CONVERSION_TYPES", 2)
+    assert metrics.conversion_type_label("pdf-compress") == "pdf-compress"
+    assert metrics.conversion_type_label("pdf-ocr") == "pdf-ocr"
+    assert metrics.conversion_type_label("made-up-1") == "other"
+    # Types seen before the cap keep their label
+    assert metrics.conversion_type_label("pdf-compress") == "pdf-compress"
+    assert metrics.conversion_type_label("x" * 65) == "other"
+
+
+def test_middleware_echoes_client_trace_ids_and_finishes_traced_paths(monkeypatch):
+    finished = []
+    monkeypatch.setattr(metrics.RequestTrace, "finish", lambda trace, status: finished.append((trace, status)))
+
+    async def app(scope, receive, send):
+        await receive()
+        metrics.current_trace().pages = 3
+        await send({"type": "http.response.start", "status": 201, "headers": []})
+        await send({"type": "http.response.body", "body": b"hello"})
+
+    async def call(path, headers):
+        sent = []
+
+        async def receive():
+            return {"type": "http.request", "body": b"abcd", "more_body": False}
+
+        async def send(message):
+            sent.append(message)
+
+        await TraceMiddleware(app, ["/api/convert"])({"type": "http", "path": path, "headers": headers}, receive, send)
+        return dict(sent[0]["headers"])
+
+    headers = asyncio.run(call("/api/convert", [(b"x-request-id", b"client-id-1")]))
+    assert headers[b"x-request-id"] == b"client-id-1"
+    (trace, status), = finished
+    assert (status, trace.bytes_in, trace.bytes_out, trace.pages) == (201, 4, 5, 3)
+    assert "response" in trace.stages
+
+    # Unprintable IDs are replaced, and untraced paths are not recorded
+    headers = asyncio.run(call("/health", [(b"x-request-id", b"bad\x01id")]))
+    assert headers[b"x-request-id"] != b"bad\x01id"
+    assert len(finished) == 1
@@ -0,0 +1,130 @@
+import fitz
+import pytest
+from fastapi import HTTPException
+
+import ocr
+from ocr import OCROptions, format_page, iter_ocr_pages, make_searchable
+
+
+@pytest.fixture
+def mixed_pdf(tmp_path):
+    """Page 1 has a text layer, page 2 is a bare drawing, page 3 has text again."""
+    path = tmp_path / "mixed.pdf"
+    with fitz.open() as doc:
+        doc.new_page().insert_text((72, 72), "This page already has plenty of text.")
+        doc.new_page().draw_rect(fitz.Rect(72, 72, 300, 300), fill=(0, 0, 0))
+        doc.new_page().insert_text((72, 72), "Another page with its own text layer.")
+        doc.save(path)
+    return str(path)
+
+
+@pytest.fixture
+def tesseract(monkeypatch):
+    """Record the images tesseract is asked to read; it is not installed here."""
+    calls = []
+
+    def image_to_string(image, lang="eng"):
+        calls.append((image.size, lang))
+        return f"recognized {len(calls)}"
+
+    monkeypatch.setattr(ocr.pytesseract, "image_to_string", image_to_string)
+    return calls
+
+
+@pytest.fixture
+def tesseract_pdf(monkeypatch):
+    """Answer like ``textonly_pdf=1``: one page of invisible text, sized to the image at its DPI."""
+    calls = []
+
+    def image_to_pdf_or_hocr(image, lang="eng", extension="pdf", config=""):
+        calls.append((image.size, config))
+        dpi = int(config.split("--dpi ")[1].split()[0])
+        with fitz.open() as layer:
+            page = layer.new_page(width=image.width * 72 / dpi, height=image.height * 72 / dpi)
+            page.insert_text((72, 144), f"recognized {len(calls)}", render_mode=3)
+            return layer.tobytes()
+
+    monkeypatch.setattr(ocr.pytesseract, "image_to_pdf_or_hocr", image_to_pdf_or_hocr)
+    return calls
+
+
+def test_pages_with_text_skip_tesseract(mixed_pdf, tesseract):
+    pages = list(iter_ocr_pages(mixed_pdf, OCROptions(dpi=72), chunk_pages=2))
+    assert [(page.page_number, page.source) for page in pages] == [(1, "text-layer"), (2, "ocr"), (3, "text-layer")]
+    assert pages[1].text == "recognized 1"
+    assert "plenty of text" in pages[0].text
+    assert len(tesseract) == 1
+
+
+def test_dpi_and_language_reach_tesseract(mixed_pdf, tesseract):
+    list(iter_ocr_pages(mixed_pdf, OCROptions(dpi=144, language="deu")))
+    # An A4 page (595 x 842 points) at 144 DPI
+    assert tesseract == [((1190, 1684), "deu")]
+
+
+def test_every_page_is_ocrd_when_asked(mixed_pdf, tesseract):
+    pages = list(iter_ocr_pages(mixed_pdf, OCROptions(dpi=72, skip_text_layer=False)))
+    assert [page.source for page in pages] == ["ocr", "ocr", "ocr"]
+
+
+def test_progress_is_reported_per_chunk(mixed_pdf, tesseract):
+    progress = []
+    list(iter_ocr_pages(mixed_pdf, OCROptions(dpi=72), progress=lambda done, total: progress.append((done, total)), chunk_pages=2))
+    assert progress == [(2, 3), (3, 3)]
+
+
+@pytest.mark.parametrize("options", [OCROptions(dpi=10), OCROptions(dpi=1200), OCROptions(language="eng; rm -rf")])
+def test_invalid_options_are_rejected(options):
+    with pytest.raises(HTTPException) as error:
+        options.validate()
+    assert error.value.status_code == 400
+
+
+def test_format_page():
+    assert format_page(ocr.PageText(2, "hello", "ocr")) == "Page 2:\nhello\n\n"
+
+
+def test_searchable_output_appends_text_layers(mixed_pdf, tesseract_pdf, tmp_path):
+    output = str(tmp_path / "searchable.pdf")
+    progress = []
+    ocr_pages = make_searchable(mixed_pdf, output, OCROptions(dpi=72), progress=lambda done, total: progress.append(done), chunk_pages=2)
+    assert ocr_pages == 1
+    assert progress == [2, 3]
+    assert [config for _, config in tesseract_pdf] == ["--dpi 72 -c textonly_pdf=1"]
+    # The original bytes are kept and the layer is appended with an incremental save
+    original = open(mixed_pdf, "rb").read()
+    assert open(output, "rb").read().startswith(original)
+    with fitz.open(output) as doc:
+        assert "recognized 1" in doc[1].get_text()
+        assert "plenty of text" in doc[0].get_text() and "recognized" not in doc[0].get_text()
+        # The drawing is still vector content, not a rendered image
+        assert doc[1].get_images() == []
+
+
+def test_searchable_overlay_follows_page_rotation(tesseract_pdf, tmp_path):
+    source = tmp_path / "rotated.pdf"
+    with fitz.open() as doc:
+        doc.new_page().draw_rect(fitz.Rect(72, 72, 300, 300), fill=(0, 0, 0))
+        doc[0].set_rotation(90)
+        doc.save(source)
+    output = str(tmp_path / "searchable.pdf")
+    make_searchable(str(source), output, OCROptions(dpi=72))
+    with fitz.open(output) as doc:
+        page = doc[0]
+        assert page.rotation == 90
+        words = page.get_text("words")
+        assert [word[4] for word in words] == ["recognized", "1"]
+        # Word boxes are in unrotated space; on the visible page the text sits where tesseract put it
+        first = fitz.Rect(words[0][:4]) * page.rotation_matrix
+        assert abs(first.x0 - 72) < 1 and first.y0 < 144 < first.y1 + 3
+
+
+def test_searchable_output_is_a_copy_when_every_page_has_text(tesseract_pdf, tmp_path):
+    source = tmp_path / "text.pdf"
+    with fitz.open() as doc:
+        doc.new_page().insert_text((72, 72), "Already searchable text on this page.")
+        doc.save(source)
+    output = str(tmp_path / "searchable.pdf")
+    assert make_searchable(str(source), output) == 0
+    assert open(output, "rb").read() == source.read_bytes()
+    assert tesseract_pdf == []
@@ -0,0 +1,150 @@
+import asyncio
+import stat
+import sys
+
+import pytest
+from fastapi import HTTPException
+
+import office
+from office import OfficePool
+
+# Stands in for soffice: a long-running listener, or a one-shot --convert-to that copies its input
+FAKE_SOFFICE = """#!{python}
+import shutil, sys, time
+from pathlib import Path
+args = sys.argv[1:]
+if "--convert-to" not in args:
+    time.sleep(60)
+    sys.exit(0)
+source = Path(args[-1])
+if b"broken" in source.read_bytes():
+    sys.stderr.write("source file could not be loaded")
+    sys.exit(1)
+shutil.copyfile(source, Path(args[args.index("--outdir") + 1]) / (source.stem + ".pdf"))
+"""
+
+# Stands in for office_bridge.py: answers one JSON line per request, or never for "hang"
+FAKE_BRIDGE = """
+import json, shutil, sys, time
+print(json.dumps({"ready": True}), flush=True)
+for line in sys.stdin:
+    request = json.loads(line)
+    if "hang" in request["input"]:
+        time.sleep(60)
+    shutil.copyfile(request["input"], request["output"])
+    print(json.dumps({"ok": True}), flush=True)
+"""
+
+
+@pytest.fixture
+def fake_office(tmp_path, monkeypatch):
+    soffice = tmp_path / "soffice"
+    soffice.write_text(FAKE_SOFFICE.format(python=sys.executable))
+    soffice.chmod(soffice.stat().st_mode | stat.S_IEXEC)
+    bridge = tmp_path / "bridge.py"
+    bridge.write_text(FAKE_BRIDGE)
+    monkeypatch.setattr(office, "OFFICE_SOFFICE", str(soffice))
+    monkeypatch.setattr(office, "OFFICE_PYTHON", sys.executable)
+    monkeypatch.setattr(office, "BRIDGE_SCRIPT", str(bridge))
+    return tmp_path
+
+
+def document(directory, name, content=b"document"):
+    path = directory / name
+    path.write_bytes(content)
+    return str(path)
+
+
+def test_without_the_bridge_each_job_runs_soffice(fake_office, monkeypatch):
+    monkeypatch.setattr(office, "bridge_available", lambda: False)
+
+    async def scenario():
+        pool = OfficePool(fake_office / "pool", size=1)
+        try:
+            output = await pool.convert("docx-to-pdf", document(fake_office, "a.docx"), str(fake_office / "a.pdf"))
+            with pytest.raises(HTTPException) as excinfo:
+                await pool.convert("docx-to-pdf", document(fake_office, "b.docx", b"broken"), str(fake_office / "b.pdf"))
+            return output, excinfo.value, pool.workers[0].use_bridge
+        finally:
+            await pool.stop()
+
+    output, error, use_bridge = asyncio.run(scenario())
+    assert open(output, "rb").read() == b"document"
+    assert error.status_code == 422 and "could not be loaded" in error.detail
+    assert not use_bridge
+
+
+def test_missing_soffice_is_reported(fake_office, monkeypatch):
+    monkeypatch.setattr(office, "bridge_available", lambda: False)
+    monkeypatch.setattr(office, "OFFICE_SOFFICE", str(fake_office / "not-installed"))
+
+    async def scenario():
+        pool = OfficePool(fake_office / "pool", size=1)
+        try:
+            await pool.convert("xlsx-to-pdf", document(fake_office, "a.xlsx"), str(fake_office / "a.pdf"))
+        finally:
+            await pool.stop()
+
+    with pytest.raises(HTTPException) as excinfo:
+        asyncio.run(scenario())
+    assert excinfo.value.status_code == 500
+
+
+def test_workers_are_recycled_after_max_jobs(fake_office, monkeypatch):
+    monkeypatch.setattr(office, "bridge_available", lambda: True)
+    monkeypatch.setattr(office, "OFFICE_MAX_JOBS", 2)
+    recycles = office.WORKER_RECYCLES.value(reason="jobs")
+
+    async def scenario():
+        pool = OfficePool(fake_office / "pool", size=1)
+        try:
+            offices = []
+            for n in range(3):
+                await pool.convert("docx-to-pdf", document(fake_office, f"{n}.docx"), str(fake_office / f"{n}.pdf"))
+                offices.append(pool.workers[0].office.pid if pool.workers[0].office else None)
+                # Let a background recycle finish before the next job
+                await asyncio.gather(*pool._recycling)
+            return offices, pool.workers[0].jobs
+        finally:
+            await pool.stop()
+
+    offices, jobs = asyncio.run(scenario())
+    # The same LibreOffice served the first two jobs, a fresh one the third
+    assert offices[0] == offices[1] != offices[2]
+    assert jobs == 1
+    assert office.WORKER_RECYCLES.value(reason="jobs") == recycles + 1
+
+
+def test_timed_out_jobs_recycle_their_worker(fake_office, monkeypatch):
+    monkeypatch.setattr(office, "bridge_available", lambda: True)
+
+    async def scenario():
+        pool = OfficePool(fake_office / "pool", size=1)
+        try:
+            with pytest.raises(HTTPException) as excinfo:
+                await pool.convert("docx-to-pdf", document(fake_office, "hang.docx"), str(fake_office / "hang.pdf"), timeout=0.5)
+            await asyncio.gather(*pool._recycling)
+            # The restarted worker converts the next document
+            output = await pool.convert("docx-to-pdf", document(fake_office, "ok.docx"), str(fake_office / "ok.pdf"))
+            return excinfo.value, output
+        finally:
+            await pool.stop()
+
+    error, output = asyncio.run(scenario())
+    assert error.status_code == 504
+    assert open(output, "rb").read() == b"document"
+
+
+def test_full_queue_is_rejected(fake_office, monkeypatch):
+    monkeypatch.setattr(office, "bridge_available", lambda: False)
+
+    async def scenario():
+        pool = OfficePool(fake_office / "pool", size=1, max_waiting=0)
+        try:
+            await pool.convert("pptx-to-pdf", document(fake_office, "a.pptx"), str(fake_office / "a.pdf"))
+        finally:
+            await pool.stop()
+
+    with pytest.raises(HTTPException) as excinfo:
+        asyncio.run(scenario())
+    assert excinfo.value.status_code == 503
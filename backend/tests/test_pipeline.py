@@ -0,0 +1,111 @@
+import io
+import json
+import os
+import random
+
+import fitz
+import pytest
+from fastapi import HTTPException
+from PIL import Image
+
+import pipeline
+from pipeline import has_secrets, parse_steps, run_pipeline
+
+
+def photo_pdf(path, label, seed):
+    """One page of text with a large, noisy photo shown small."""
+    rng = random.Random(seed)
+    buffer = io.BytesIO()
+    Image.frombytes("RGB", (600, 450), rng.randbytes(600 * 450 * 3)).save(buffer, "JPEG", quality=95)
+    with fitz.open() as doc:
+        page = doc.new_page()
+        page.insert_text((72, 72), label)
+        page.insert_image(fitz.Rect(72, 100, 216, 208), stream=buffer.getvalue())
+        doc.save(path)
+    return str(path)
+
+
+@pytest.fixture
+def saves(monkeypatch):
+    """Record where each segment saves the document (None for a scan only)."""
+    outputs = []
+    real_segment = pipeline.run_segment
+
+    def run_segment(input_paths, opening, replacements, output_path, *args):
+        outputs.append(output_path)
+        return real_segment(input_paths, opening, replacements, output_path, *args)
+
+    monkeypatch.setattr(pipeline, "run_segment", run_segment)
+    return outputs
+
+
+@pytest.mark.parametrize("spec, inputs, message", [
+    ("", 1, "required"),
+    ("{}", 1, "JSON list"),
+    (json.dumps([{"type": "pdf-to-docx"}]), 1, "cannot run in a pipeline"),
+    (json.dumps([{"type": "pdf-compress", "quality": 5}]), 1, "unknown options"),
+    (json.dumps([{"type": "pdf-compress", "compression_mode": "raster"}]), 1, "smart compression"),
+    (json.dumps([{"type": "pdf-protect"}]), 1, "requires a password"),
+    (json.dumps([{"type": "pdf-compress"}, {"type": "pdf-unlock", "password": "x"}]), 1, "must be the first step"),
+    (json.dumps([{"type": "pdf-protect", "password": "x"}, {"type": "pdf-compress"}]), 1, "must be the last step"),
+    (json.dumps([{"type": "merge-pdfs"}]), 1, "at least two files"),
+    (json.dumps([{"type": "pdf-compress"}]), 2, "exactly one file"),
+    (json.dumps([{"type": "pdf-compress"}] * 11), 1, "at most"),
+])
+def test_invalid_pipelines_are_rejected(spec, inputs, message):
+    with pytest.raises(HTTPException) as excinfo:
+        parse_steps(spec, inputs)
+    assert excinfo.value.status_code == 400
+    assert message in excinfo.value.detail
+
+
+def test_passwords_stay_out_of_cache_params():
+    steps = parse_steps(json.dumps([{"type": "pdf-compress", "compression_level": 40}, {"type": "pdf-protect", "password": "secret"}]), 1)
+    assert has_secrets(steps)
+    assert "secret" not in json.dumps(pipeline.cache_params(steps))
+    assert not has_secrets(parse_steps(json.dumps([{"type": "pdf-compress"}]), 1))
+
+
+def test_compressing_an_upload_scans_it_in_place_and_saves_once(tmp_path, saves):
+    source = photo_pdf(tmp_path / "a.pdf", "Document A", 1)
+    output = str(tmp_path / "out.pdf")
+    run_pipeline([source], output, parse_steps(json.dumps([{"type": "pdf-compress", "compression_level": 40}]), 1))
+    assert saves == [None, output]
+    assert os.path.getsize(output) < os.path.getsize(source)
+
+
+def test_merge_compress_protect(tmp_path, saves):
+    sources = [photo_pdf(tmp_path / "a.pdf", "Document A", 1), photo_pdf(tmp_path / "b.pdf", "Document B", 2)]
+    output = str(tmp_path / "out.pdf")
+    steps = parse_steps(json.dumps([
+        {"type": "merge-pdfs"},
+        {"type": "pdf-compress", "compression_level": 40},
+        {"type": "pdf-protect", "password": "secret"},
+    ]), 2)
+    progress = []
+    run_pipeline(sources, output, steps, progress=lambda done, total: progress.append(done))
+    assert progress == [1, 2, 3]
+    # The merged document is written once as a working copy for the image workers, then saved
+    assert saves == [f"{output}.step2.pdf", output]
+    assert not os.path.exists(f"{output}.step2.pdf")
+    with fitz.open(output) as doc:
+        assert doc.needs_pass and doc.authenticate("secret")
+        assert [page.get_text().strip() for page in doc] == ["Document A", "Document B"]
+        # The photos were recompressed in the final output
+        assert all(len(doc.extract_image(page.get_images()[0][0])["image"]) < 50_000 for page in doc)
+
+
+def test_unlock_starts_from_the_password(tmp_path, saves):
+    plain = photo_pdf(tmp_path / "plain.pdf", "Locked text", 3)
+    locked = str(tmp_path / "locked.pdf")
+    with fitz.open(plain) as doc:
+        doc.save(locked, encryption=fitz.PDF_ENCRYPT_AES_256, user_pw="old", owner_pw="old")
+    output = str(tmp_path / "out.pdf")
+    with pytest.raises(HTTPException) as excinfo:
+        run_pipeline([locked], output, parse_steps(json.dumps([{"type": "pdf-unlock", "password": "wrong"}]), 1))
+    assert excinfo.value.detail == "Invalid password"
+
+    run_pipeline([locked], output, parse_steps(json.dumps([{"type": "pdf-unlock", "password": "old"}]), 1))
+    with fitz.open(output) as doc:
+        assert not doc.needs_pass
+        assert doc[0].get_text().strip() == "Locked text"
@@ -0,0 +1,103 @@
+import io
+import os
+import time
+
+import fitz
+import pytest
+from fastapi import HTTPException
+from PIL import Image
+
+import metrics
+import previews
+from previews import PreviewCache, parse_clip, render_page
+
+
+@pytest.fixture
+def pdf_bytes():
+    with fitz.open() as doc:
+        for number in range(3):
+            doc.new_page().insert_text((72, 72), f"Page {number + 1}")
+        return doc.tobytes()
+
+
+@pytest.fixture
+def pdf_path(tmp_path, pdf_bytes):
+    path = tmp_path / "doc.pdf"
+    path.write_bytes(pdf_bytes)
+    return str(path)
+
+
+def test_renders_have_the_requested_long_side(pdf_path):
+    with Image.open(io.BytesIO(render_page(pdf_path, 2, 200, "png"))) as image:
+        assert max(image.size) == 200 and image.format == "PNG"
+    # A clip of the top-left quarter is rendered at the full size, not cropped from the page
+    with Image.open(io.BytesIO(render_page(pdf_path, 1, 200, "webp", parse_clip("0,0,0.5,0.5")))) as image:
+        assert max(image.size) == 200 and image.format == "WEBP"
+    with pytest.raises(HTTPException):
+        render_page(pdf_path, 4, 200, "png")
+
+
+@pytest.mark.parametrize("spec", ["0,0,1", "0.5,0,0.5,1", "0,0,1.5,1", "a,b,c,d"])
+def test_invalid_clips_are_rejected(spec):
+    with pytest.raises(HTTPException):
+        parse_clip(spec)
+
+
+def test_memory_tier_is_bounded_in_bytes(tmp_path):
+    cache = PreviewCache(tmp_path, memory_bytes=10, disk_bytes=0)
+    cache.put_memory("a", b"12345")
+    cache.put_memory("b", b"12345")
+    assert cache.get_memory("a") == b"12345"  # now the most recently used
+    cache.put_memory("c", b"12345")
+    assert cache.get_memory("b") is None
+    assert cache.get_memory("a") is not None and cache.get_memory("c") is not None
+    # Renders larger than the whole tier are not kept
+    cache.put_memory("d", b"x" * 11)
+    assert cache.get_memory("d") is None
+
+
+def test_disk_tier_survives_restarts_and_evicts_oldest(tmp_path):
+    cache = PreviewCache(tmp_path, disk_bytes=250)
+    for number, name in enumerate(["aa1", "bb2", "cc3"]):
+        cache.put_disk(name, bytes([number]) * 100)
+        os.utime(cache._path(name), (time.time() - 100 + number, time.time() - 100 + number))
+    # A fresh cache (a restarted process) finds the renders on disk
+    restarted = PreviewCache(tmp_path, disk_bytes=250)
+    assert restarted.get_disk("bb2") == b"\x01" * 100
+    restarted.evict()
+    assert restarted.get_disk("aa1") is None
+    assert restarted.get_disk("bb2") is not None and restarted.get_disk("cc3") is not None
+    assert not [path for path in tmp_path.rglob(".tmp-*")]
+
+
+def test_preview_etag_and_tiers(client, pdf_bytes, monkeypatch):
+    import main
+
+    response = client.post("/api/documents", files={"file": ("doc.pdf", pdf_bytes, "application/pdf")})
+    assert response.status_code == 201
+    document_id = response.json()["document_id"]
+    params = {"document_id": document_id, "page": 2, "size": 120}
+
+    def lookups(tier):
+        return metrics.PREVIEW_LOOKUPS.value(tier=tier)
+
+    misses, disk, memory = lookups("miss"), lookups("disk"), lookups("memory")
+    first = client.get("/api/preview", params=params)
+    assert first.status_code == 200 and first.headers["content-type"] == "image/webp"
+    etag = first.headers["etag"]
+    assert lookups("miss") == misses + 1
+
+    # A client that already has the render gets a 304 without a body
+    cached = client.get("/api/preview", params=params, headers={"If-None-Match": etag})
+    assert cached.status_code == 304 and cached.content == b""
+
+    assert client.get("/api/preview", params=params).content == first.content
+    assert lookups("memory") == memory + 1
+
+    # With the memory tier gone (a restart) the disk tier answers
+    monkeypatch.setattr(main, "preview_cache", PreviewCache(previews.PREVIEW_DISK_DIR))
+    assert client.get("/api/preview", params=params).content == first.content
+    assert lookups("disk") == disk + 1
+
+    other = client.get("/api/preview", params=dict(params, page=3))
+    assert other.headers["etag"] != etag
@@ -0,0 +1,174 @@
+import asyncio
+
+import pytest
+
+import scheduler as scheduler_module
+from scheduler import AdmissionRejected, Demand, FairScheduler, cost_class, estimate_cost
+
+
+def scheduler(slots=1, limit=None, max_queue=50, client_quota=10):
+    return FairScheduler(slots, lambda conversion_type: limit or slots, max_queue, client_quota=client_quota, retry_after=1)
+
+
+async def dispatch_order(fair: FairScheduler, requests):
+    """Queue ``requests`` as ``(name, conversion_type, demand)`` behind a running one; return dispatch order."""
+    order = []
+    release_first = await fair.acquire("pdf-ocr", Demand(None, 30, None))
+
+    async def one(name, conversion_type, demand):
+        release = await fair.acquire(conversion_type, demand)
+        order.append(name)
+        await asyncio.sleep(0)
+        release()
+
+    tasks = []
+    for request in requests:
+        tasks.append(asyncio.create_task(one(*request)))
+        await asyncio.sleep(0)
+    release_first()
+    await asyncio.gather(*tasks)
+    return order
+
+
+def test_cost_classes():
+    assert cost_class(0.1) == "light"
+    assert cost_class(5) == "standard"
+    assert cost_class(500) == "heavy"
+
+
+def test_light_requests_overtake_queued_heavy_ones():
+    requests = [(f"ocr{i}", "pdf-ocr", Demand(f"a{i}", 30, None)) for i in range(3)]
+    requests += [("thumbnail", "png-to-jpg", Demand("b", 0.1, None))]
+    order = asyncio.run(dispatch_order(scheduler(), requests))
+    assert order[0] == "thumbnail"
+    assert order[1:] == ["ocr0", "ocr1", "ocr2"]
+
+
+def test_same_class_is_first_come_first_served():
+    requests = [(f"cmp{i}", "pdf-compress", Demand(f"c{i}", 5, None)) for i in range(4)]
+    assert asyncio.run(dispatch_order(scheduler(), requests)) == ["cmp0", "cmp1", "cmp2", "cmp3"]
+
+
+def test_type_limit_skips_to_the_next_tag():
+    async def scenario():
+        fair = scheduler(slots=2, limit=1)
+        release_ocr = await fair.acquire("pdf-ocr", Demand(None, 30, None))
+        waiting_ocr = asyncio.create_task(fair.acquire("pdf-ocr", Demand(None, 0.1, None)))
+        compress = asyncio.create_task(fair.acquire("pdf-compress", Demand(None, 5, None)))
+        release_compress = await asyncio.wait_for(compress, 1)
+        assert not waiting_ocr.done()
+        release_ocr()
+        (await asyncio.wait_for(waiting_ocr, 1))()
+        release_compress()
+        assert fair.admitted == 0
+
+    asyncio.run(scenario())
+
+
+def test_client_quota_is_rejected_with_429():
+    async def scenario():
+        fair = scheduler(slots=1, client_quota=2)
+        release = await fair.acquire("x", Demand("client", 0.1, None))
+        queued = asyncio.create_task(fair.acquire("x", Demand("client", 0.1, None)))
+        await asyncio.sleep(0)
+        with pytest.raises(AdmissionRejected) as error:
+            await fair.acquire("x", Demand("client", 0.1, None))
+        assert error.value.status_code == 429
+        assert error.value.headers["Retry-After"] == "1"
+        # Other clients are not affected
+        other = asyncio.create_task(fair.acquire("x", Demand("other", 0.1, None)))
+        await asyncio.sleep(0)
+        release()
+        (await queued)()
+        (await other)()
+        assert fair.admitted == 0
+
+    asyncio.run(scenario())
+
+
+def test_deadline_is_rejected_with_503_and_retry_after():
+    async def scenario():
+        fair = scheduler(slots=1)
+        release = await fair.acquire("pdf-ocr", Demand("a", 100, None))
+        with pytest.raises(AdmissionRejected) as error:
+            await fair.acquire("pdf-ocr", Demand("b", 40, 30))
+        assert error.value.status_code == 503
+        assert int(error.value.headers["Retry-After"]) >= 60
+        release()
+
+    asyncio.run(scenario())
+
+
+def test_full_queue_is_rejected_with_503():
+    async def scenario():
+        fair = scheduler(slots=1, max_queue=2)
+        release = await fair.acquire("x", Demand(None, 1, None))
+        queued = asyncio.create_task(fair.acquire("x", Demand(None, 1, None)))
+        await asyncio.sleep(0)
+        with pytest.raises(AdmissionRejected) as error:
+            await fair.acquire("x", Demand(None, 1, None))
+        assert error.value.status_code == 503
+        release()
+        (await queued)()
+
+    asyncio.run(scenario())
+
+
+def test_cancelled_waiter_frees_its_place():
+    async def scenario():
+        fair = scheduler(slots=1, client_quota=1)
+        release = await fair.acquire("x", Demand("a", 1, None))
+        waiter = asyncio.create_task(fair.acquire("x", Demand("b", 1, None)))
+        await asyncio.sleep(0)
+        assert fair.waiting == 1
+        waiter.cancel()
+        await asyncio.gather(waiter, return_exceptions=True)
+        assert fair.waiting == 0
+        # Client b's quota slot was returned
+        late = asyncio.create_task(fair.acquire("x", Demand("b", 1, None)))
+        await asyncio.sleep(0)
+        release()
+        release()  # Releasing twice is harmless
+        (await late)()
+        assert fair.admitted == 0
+
+    asyncio.run(scenario())
+
+
+def test_office_requests_count_toward_the_client_quota(app_dir, tmp_path, monkeypatch):
+    import main
+
+    document = tmp_path / "report.docx"
+    document.write_bytes(b"PK\x03\x04" + b"x" * (2 * 1024 * 1024))
+    cost = estimate_cost("docx-to-pdf", [str(document)], ["zip"])
+    assert cost == pytest.approx(scheduler_module.BASE_COST + 2 * scheduler_module.OFFICE_MEGABYTE_COST, rel=0.01)
+    monkeypatch.setattr(main.worker_pool.scheduler, "client_quota", 1)
+
+    async def scenario():
+        converting = asyncio.Event()
+        finish = asyncio.Event()
+
+        async def convert(conversion_type, input_path, output_path):
+            converting.set()
+            await finish.wait()
+            open(output_path, "wb").write(b"%PDF-1.7")
+            return output_path
+
+        monkeypatch.setattr(main.office_pool, "convert", convert)
+        with scheduler_module.demand(Demand("ip:10.0.0.1", cost)):
+            first = asyncio.create_task(main.run_conversion("docx-to-pdf", [str(document)], str(tmp_path), main.ConversionOptions()))
+            await converting.wait()
+            admitted = main.worker_pool.pending
+            # The same client's next conversion of any kind is over its quota
+            with pytest.raises(AdmissionRejected) as excinfo:
+                await main.run_conversion("docx-to-pdf", [str(document)], str(tmp_path), main.ConversionOptions())
+        finish.set()
+        result = await first
+        return admitted, excinfo.value, result, main.worker_pool.pending
+
+    admitted, rejection, result, pending = asyncio.run(scenario())
+    assert admitted == 1
+    assert rejection.status_code == 429
+    assert result.filename == "report.pdf"
+    # The slot is released when the conversion finishes
+    assert pending == 0
@@ -0,0 +1,149 @@
+import asyncio
+
+import pytest
+
+from singleflight import SingleFlight
+
+
+def test_concurrent_callers_share_one_run():
+    async def scenario():
+        flights = SingleFlight()
+        runs, cleanups = [], []
+        gate = asyncio.Event()
+
+        async def convert():
+            runs.append(1)
+            await gate.wait()
+            return "result"
+
+        async def caller():
+            async with flights.join("key", convert, lambda: cleanups.append(1)) as (result, leader):
+                # The flight stays registered while any caller is still using the result
+                assert len(flights) == 1
+                return result, leader
+
+        callers = [asyncio.create_task(caller()) for _ in range(3)]
+        await asyncio.sleep(0)
+        gate.set()
+        results = await asyncio.gather(*callers)
+        return results, runs, cleanups, len(flights)
+
+    results, runs, cleanups, remaining = asyncio.run(scenario())
+    assert sorted(results) == [("result", False), ("result", False), ("result", True)]
+    assert runs == [1]
+    # Cleaned up exactly once, after the last caller left
+    assert cleanups == [1] and remaining == 0
+
+
+def test_cleanup_waits_for_the_last_caller():
+    async def scenario():
+        flights = SingleFlight()
+        cleanups = []
+        leave = asyncio.Event()
+
+        async def convert():
+            return "result"
+
+        async def slow_caller():
+            async with flights.join("key", convert, lambda: cleanups.append("leader")):
+                await leave.wait()
+
+        slow = asyncio.create_task(slow_caller())
+        await asyncio.sleep(0.01)
+        async with flights.join("key", convert, lambda: cleanups.append("follower")) as (_, leader):
+            assert not leader
+        # The task is done and one caller left, but the other still uses the files
+        after_first = list(cleanups)
+        leave.set()
+        await slow
+        return after_first, cleanups, len(flights)
+
+    after_first, cleanups, remaining = asyncio.run(scenario())
+    assert after_first == []
+    # Only the leader's cleanup runs
+    assert cleanups == ["leader"] and remaining == 0
+
+
+def test_cancelled_callers_leave_the_task_running():
+    async def scenario():
+        flights = SingleFlight()
+        cleanups = []
+        gate = asyncio.Event()
+        finished = []
+
+        async def convert():
+            await gate.wait()
+            finished.append(1)
+            return "result"
+
+        async def caller():
+            async with flights.join("key", convert, lambda: cleanups.append(1)) as (result, _):
+                return result
+
+        first, second = asyncio.create_task(caller()), asyncio.create_task(caller())
+        await asyncio.sleep(0)
+        first.cancel()
+        await asyncio.sleep(0)
+        assert first.cancelled()
+        gate.set()
+        result = await second
+        return result, finished, cleanups, len(flights)
+
+    result, finished, cleanups, remaining = asyncio.run(scenario())
+    assert result == "result" and finished == [1]
+    assert cleanups == [1] and remaining == 0
+
+
+def test_task_outlives_every_caller_and_cleans_up_when_done():
+    async def scenario():
+        flights = SingleFlight()
+        cleanups = []
+        gate = asyncio.Event()
+
+        async def convert():
+            await gate.wait()
+            return "cached"
+
+        async def caller():
+            async with flights.join("key", convert, lambda: cleanups.append(1)):
+                pass
+
+        task = asyncio.create_task(caller())
+        await asyncio.sleep(0)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+        # Nobody waits any more, but the conversion still runs to fill the result cache
+        still_running = (len(flights), list(cleanups))
+        gate.set()
+        await asyncio.sleep(0.01)
+        return still_running, cleanups, len(flights)
+
+    still_running, cleanups, remaining = asyncio.run(scenario())
+    assert still_running == (1, [])
+    assert cleanups == [1] and remaining == 0
+
+
+def test_failures_reach_every_caller_and_a_new_flight_starts_after():
+    async def scenario():
+        flights = SingleFlight()
+        attempts = []
+
+        async def convert():
+            attempts.append(1)
+            await asyncio.sleep(0.01)
+            if len(attempts) == 1:
+                raise ValueError("conversion failed")
+            return "second try"
+
+        async def caller():
+            async with flights.join("key", convert) as (result, _):
+                return result
+
+        failures = await asyncio.gather(caller(), caller(), return_exceptions=True)
+        retry = await caller()
+        return failures, retry, attempts
+
+    failures, retry, attempts = asyncio.run(scenario())
+    assert all(isinstance(failure, ValueError) for failure in failures)
+    assert retry == "second try" and attempts == [1, 1]
@@ -0,0 +1,95 @@
+import asyncio
+import os
+import signal
+
+import pytest
+from fastapi import HTTPException
+
+from workers import WorkerCrashed, WorkerPool, iter_ordered, run_in_worker
+
+
+def square(value):
+    return value * value
+
+
+def reject(value):
+    if value == 3:
+        raise HTTPException(status_code=400, detail=f"Bad value {value}")
+    return value
+
+
+def fail(value):
+    if value == 2:
+        raise ValueError("broken input")
+    return value
+
+
+def crash(value):
+    if value == 2:
+        os.kill(os.getpid(), signal.SIGKILL)
+    return value
+
+
+def fan_out(fn, values, executor=None):
+    return list(iter_ordered(executor, fn, [(value,) for value in values]))
+
+
+def test_iter_ordered_keeps_order(executor):
+    assert list(iter_ordered(executor, square, [(i,) for i in range(20)], window=3)) == [i * i for i in range(20)]
+
+
+def test_iter_ordered_without_executor():
+    assert list(iter_ordered(None, square, [(2,), (3,)])) == [4, 9]
+
+
+def test_iter_ordered_reraises_http_errors(executor):
+    results = iter_ordered(executor, reject, [(i,) for i in range(6)])
+    assert [next(results) for _ in range(3)] == [0, 1, 2]
+    with pytest.raises(HTTPException) as error:
+        next(results)
+    assert error.value.status_code == 400
+    assert error.value.detail == "Bad value 3"
+
+
+def test_iter_ordered_reraises_other_errors(executor):
+    with pytest.raises(ValueError, match="broken input"):
+        list(iter_ordered(executor, fail, [(i,) for i in range(4)]))
+
+
+def test_iter_ordered_reports_a_crashed_worker(executor):
+    with pytest.raises(WorkerCrashed) as error:
+        list(iter_ordered(executor, crash, [(i,) for i in range(4)]))
+    assert error.value.status_code == 503
+
+
+def test_run_in_worker(executor):
+    assert run_in_worker(executor, square, 7) == 49
+    assert run_in_worker(None, square, 7) == 49
+
+
+def test_run_fanout_restarts_a_crashed_pool():
+    async def scenario():
+        pool = WorkerPool(processes=2, max_queue=8)
+        try:
+            with pytest.raises(WorkerCrashed):
+                await pool.run_fanout("pdf-to-docx", fan_out, crash, [0, 1, 2, 3])
+            # The next conversion gets a fresh pool instead of the broken one
+            assert await pool.run_fanout("pdf-to-docx", fan_out, square, [1, 2, 3]) == [1, 4, 9]
+            assert await pool.run("pdf-protect", square, 5) == 25
+        finally:
+            pool.shutdown()
+
+    asyncio.run(scenario())
+
+
+def test_submit_restarts_a_crashed_pool():
+    async def scenario():
+        pool = WorkerPool(processes=1, max_queue=4)
+        try:
+            with pytest.raises(WorkerCrashed):
+                await pool.submit(crash, 2)
+            assert await pool.submit(square, 3) == 9
+        finally:
+            pool.shutdown()
+
+    asyncio.run(scenario())
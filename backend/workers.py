@@ -0,0 +1,292 @@
+"""Process-pool execution layer for CPU-bound conversions.
+
+Conversion functions (PyMuPDF, Pillow, tesseract) hold the GIL or block for
+seconds at a time, so they run in a pool of worker processes instead of on the
+event loop. Admission is bounded per conversion type and globally so a burst
+of expensive jobs is rejected early instead of piling up in memory. Which
+admitted conversion gets the next slot is decided by ``scheduler``: weighted
+fair queueing by estimated cost, with per-client quotas and a wait deadline.
+"""
+
+import asyncio
+import logging
+import multiprocessing
+import os
+import pickle
+import threading
+from collections import deque
+from concurrent.futures import Executor, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from contextlib import asynccontextmanager
+from functools import partial
+from typing import Any, Callable, Dict, Iterable, Iterator, Optional
+
+from fastapi import HTTPException
+
+from scheduler import Demand, FairScheduler
+
+logger = logging.getLogger(__name__)
+
+# Number of worker processes (defaults to one per core)
+WORKER_PROCESSES = int(os.getenv("WORKER_PROCESSES", str(os.cpu_count() or 1)))
+
+# Maximum number of admitted conversions (running + waiting) before returning 503
+WORKER_MAX_QUEUE = int(os.getenv("WORKER_MAX_QUEUE", str(WORKER_PROCESSES * 4)))
+
+# Seconds clients are told to wait before retrying a rejected request
+WORKER_RETRY_AFTER = int(os.getenv("WORKER_RETRY_AFTER", "5"))
+
+# Process start method; "spawn" avoids forking a process that already runs threads
+WORKER_START_METHOD = os.getenv("WORKER_START_METHOD", "spawn")
+
+# Default per-type concurrency limits; expensive types get a share of the pool
+# so cheap conversions always have workers available
+DEFAULT_CONVERSION_LIMITS = {
+    "pdf-ocr": max(1, WORKER_PROCESSES // 2),
+    "pdf-ocr-searchable": max(1, WORKER_PROCESSES // 2),
+    "image-to-text": max(1, WORKER_PROCESSES // 2),
+    "pdf-compress": max(1, WORKER_PROCESSES // 2),
+    "batch-compress": max(1, WORKER_PROCESSES // 2),
+}
+
+
+def parse_limits(spec: Optional[str]) -> Dict[str, int]:
+    """Parse a limit override such as ``"pdf-ocr=2,pdf-compress=4"``."""
+    limits: Dict[str, int] = {}
+    if not spec:
+        return limits
+    for item in spec.split(","):
+        name, _, value = item.partition("=")
+        if name.strip() and value.strip():
+            limits[name.strip()] = max(1, int(value))
+    return limits
+
+
+class ConversionError(Exception):
+    """Picklable stand-in for an HTTPException raised inside a worker process."""
+
+    def __init__(self, status_code: int, detail: Any):
+        super().__init__(status_code, detail)
+        self.status_code = status_code
+        self.detail = detail
+
+
+class WorkerCrashed(HTTPException):
+    """A worker process died while running a task (OOM kill, native crash).
+
+    The executor is unusable afterwards and has to be replaced. Unlike a
+    rejection at admission, retrying the same input may crash again.
+    """
+
+    def __init__(self):
+        super().__init__(status_code=503, detail="Conversion worker crashed, please retry")
+
+
+def _invoke(fn: Callable, args: tuple, kwargs: dict):
+    # HTTPException cannot be unpickled in the parent, so translate it here
+    try:
+        return fn(*args, **kwargs)
+    except HTTPException as e:
+        raise ConversionError(e.status_code, e.detail) from None
+    except Exception as e:
+        # An exception the parent cannot unpickle would break the whole pool
+        try:
+            pickle.loads(pickle.dumps(e))
+        except Exception:
+            raise RuntimeError(f"{type(e).__name__}: {e}") from None
+        raise
+
+
+def iter_ordered(
+    executor: Optional[Executor],
+    fn: Callable,
+    arg_tuples: Iterable[tuple],
+    window: Optional[int] = None,
+) -> Iterator[Any]:
+    """Yield ``fn(*args)`` for each argument tuple, in order, as results complete.
+
+    At most ``window`` calls are in flight at once, which bounds memory for
+    large documents while keeping every worker busy. Without an executor the
+    calls run sequentially in the current process. Meant to be driven from a
+    thread (or a CLI process), never from the event loop.
+    """
+    if executor is None:
+        for args in arg_tuples:
+            yield fn(*args)
+        return
+
+    window = window or WORKER_PROCESSES * 2
+    pending = deque()
+    args_iter = iter(arg_tuples)
+    try:
+        for args in args_iter:
+            pending.append(executor.submit(_invoke, fn, args, {}))
+            if len(pending) >= window:
+                break
+        while pending:
+            future = pending.popleft()
+            try:
+                result = future.result()
+            except ConversionError as e:
+                raise HTTPException(status_code=e.status_code, detail=e.detail)
+            except BrokenProcessPool:
+                raise WorkerCrashed() from None
+            for args in args_iter:
+                pending.append(executor.submit(_invoke, fn, args, {}))
+                break
+            yield result
+    finally:
+        # The consumer stopped early (error or client disconnect); drop queued work
+        for future in pending:
+            future.cancel()
+
+
+def run_in_worker(executor: Optional[Executor], fn: Callable, *args) -> Any:
+    """Run one ``fn(*args)`` in the executor and wait for it; in-process without one.
+
+    For the whole-document steps of page-parallel engines (parsing, the final
+    save), which would otherwise hold the coordinating process's GIL.
+    """
+    return next(iter_ordered(executor, fn, [args]))
+
+
+class _TrackedExecutor(ProcessPoolExecutor):
+    """ProcessPoolExecutor that counts submitted tasks that have not finished."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._lock = threading.Lock()
+        self.in_flight = 0
+
+    def submit(self, fn, /, *args, **kwargs):
+        future = super().submit(fn, *args, **kwargs)
+        with self._lock:
+            self.in_flight += 1
+        future.add_done_callback(self._task_done)
+        return future
+
+    def _task_done(self, future):
+        with self._lock:
+            self.in_flight -= 1
+
+
+class WorkerPool:
+    """Bounded process pool with per-conversion-type admission control."""
+
+    def __init__(
+        self,
+        processes: int = WORKER_PROCESSES,
+        max_queue: int = WORKER_MAX_QUEUE,
+        limits: Optional[Dict[str, int]] = None,
+    ):
+        self.processes = max(1, processes)
+        self.max_queue = max(1, max_queue)
+        self.limits = dict(DEFAULT_CONVERSION_LIMITS)
+        self.limits.update(limits if limits is not None else parse_limits(os.getenv("WORKER_LIMITS")))
+        self._executor: Optional[_TrackedExecutor] = None
+        self.scheduler = FairScheduler(
+            self.processes, self.limit_for, self.max_queue, retry_after=WORKER_RETRY_AFTER
+        )
+
+    def start(self):
+        if self._executor is None:
+            context = multiprocessing.get_context(WORKER_START_METHOD)
+            self._executor = _TrackedExecutor(max_workers=self.processes, mp_context=context)
+            logger.info(f"Started worker pool with {self.processes} processes")
+
+    def shutdown(self, wait: bool = True):
+        if self._executor is not None:
+            self._executor.shutdown(wait=wait, cancel_futures=True)
+            self._executor = None
+
+    @property
+    def executor(self) -> ProcessPoolExecutor:
+        self.start()
+        return self._executor
+
+    @property
+    def pending(self) -> int:
+        """Admitted conversions, running or waiting for a slot."""
+        return self.scheduler.admitted
+
+    @property
+    def waiting(self) -> int:
+        """Admitted conversions still waiting for a slot."""
+        return self.scheduler.waiting
+
+    @property
+    def busy(self) -> int:
+        """Worker processes currently running a task."""
+        in_flight = self._executor.in_flight if self._executor is not None else 0
+        return min(in_flight, self.processes)
+
+    @property
+    def queued_tasks(self) -> int:
+        """Tasks submitted to the executor that wait for a free worker."""
+        in_flight = self._executor.in_flight if self._executor is not None else 0
+        return max(0, in_flight - self.processes)
+
+    def limit_for(self, conversion_type: str) -> int:
+        return min(self.limits.get(conversion_type, self.processes), self.processes)
+
+    async def acquire(self, conversion_type: str, demand: Optional[Demand] = None) -> Callable[[], None]:
+        """Reserve a slot for one conversion and return the function that frees it.
+
+        ``demand`` (by default the one of the current request) gives the
+        client and estimated cost the scheduler weighs the request by. Used
+        directly by streaming responses, which must be admitted before the
+        response starts but hold their slot until the stream is exhausted.
+        """
+        return await self.scheduler.acquire(conversion_type, demand)
+
+    @asynccontextmanager
+    async def admit(self, conversion_type: str):
+        """Reserve a slot for one conversion, rejecting early when saturated."""
+        release = await self.acquire(conversion_type)
+        try:
+            yield
+        finally:
+            release()
+
+    def _restart(self, executor: ProcessPoolExecutor):
+        """Drop a broken executor; the next task starts a fresh one."""
+        # Tasks that shared the broken executor all fail; only the first replaces it
+        if self._executor is executor:
+            logger.error("Worker pool is broken, restarting")
+            self.shutdown(wait=False)
+
+    async def submit(self, fn: Callable, *args, **kwargs):
+        """Run ``fn`` in a worker process without admission control."""
+        loop = asyncio.get_running_loop()
+        executor = self.executor
+        try:
+            return await loop.run_in_executor(executor, partial(_invoke, fn, args, kwargs))
+        except ConversionError as e:
+            raise HTTPException(status_code=e.status_code, detail=e.detail)
+        except BrokenProcessPool:
+            # A worker died (OOM kill, segfault in a native library); start a fresh pool
+            self._restart(executor)
+            raise WorkerCrashed() from None
+
+    async def run(self, conversion_type: str, fn: Callable, *args, **kwargs):
+        """Admit a conversion of ``conversion_type`` and run ``fn`` in the pool."""
+        async with self.admit(conversion_type):
+            return await self.submit(fn, *args, **kwargs)
+
+    async def run_fanout(self, conversion_type: str, fn: Callable, *args, **kwargs):
+        """Admit a conversion and run ``fn(*args, executor=...)`` in a thread.
+
+        For page-parallel engines: ``fn`` coordinates the document in this
+        process and fans the per-page work out to the worker processes.
+        """
+        async with self.admit(conversion_type):
+            executor = self.executor
+            try:
+                return await asyncio.to_thread(partial(fn, *args, executor=executor, **kwargs))
+            except WorkerCrashed:
+                self._restart(executor)
+                raise
+            except BrokenProcessPool:
+                # Raised by an engine that submits to the executor directly
+                self._restart(executor)
+                raise WorkerCrashed() from None
@@ -47,13 +47,24 @@ type ConversionType =
   | "pdf-protect"
   | "pdf-unlock"
   | "pdf-ocr"
+  | "pdf-ocr-searchable"
   | "merge-pdfs"
   | "split-pdf"
   | "batch-compress"
   | "batch-compress-images"
   | "batch-convert-to-pdf"
+  | "images-to-pdf"
   | "pdf-to-infographic";
 
+// File extensions of responses whose type the conversion type alone does not tell
+const RESPONSE_EXTENSIONS: Record<string, string> = {
+  "application/zip": "zip",
+  "image/jpeg": "jpg",
+  "image/png": "png",
+  "image/webp": "webp",
+  "image/avif": "avif",
+};
+
 const ConverterPage = () => {
   const { toast } = useToast();
   const { user, subscriptionTier } = useAuth();
@@ -64,6 +75,7 @@ const ConverterPage = () => {
   const [conversionType, setConversionType] = useState<ConversionType | ''>('');
   const [isConverting, setIsConverting] = useState(false);
   const [convertedFileUrl, setConvertedFileUrl] = useState<string | null>(null);
+  const [convertedFileExtension, setConvertedFileExtension] = useState<string | null>(null);
   const [convertedText, setConvertedText] = useState<string | null>(null);
   const [infographicUrl, setInfographicUrl] = useState<string | null>(null);
   const [compressionLevel, setCompressionLevel] = useState(70);
@@ -142,7 +154,7 @@ const ConverterPage = () => {
   };
 
   const isBatchOperation = () => {
-    return conversionType === "merge-pdfs" || conversionType === "batch-compress" || conversionType === "batch-compress-images" || conversionType === "batch-convert-to-pdf";
+    return conversionType === "merge-pdfs" || conversionType === "batch-compress" || conversionType === "batch-compress-images" || conversionType === "batch-convert-to-pdf" || conversionType === "images-to-pdf";
   };
 
   const isPdfToInfographic = () => {
@@ -155,6 +167,7 @@ const ConverterPage = () => {
       case "pdf-unlock":
         return <FileLock size={16} />;
       case "pdf-ocr":
+      case "pdf-ocr-searchable":
       case "image-to-text":
         return <ScanText size={16} />;
       case "merge-pdfs":
@@ -289,6 +302,8 @@ const ConverterPage = () => {
         const blob = await response.blob();
         const url = URL.createObjectURL(blob);
         setConvertedFileUrl(url);
+        // Splitting several ranges returns a ZIP, and image compression may switch formats
+        setConvertedFileExtension(RESPONSE_EXTENSIONS[blob.type] || null);
         
         if (isCompression()) {
           setCompressedSize(formatFileSize(blob.size));
@@ -534,6 +549,7 @@ const ConverterPage = () => {
                           <SelectItem value="batch-compress">Compress Multiple PDFs</SelectItem>
                           <SelectItem value="batch-compress-images">Compress Multiple Images</SelectItem>
                           <SelectItem value="batch-convert-to-pdf">Convert Multiple to PDF</SelectItem>
+                          <SelectItem value="images-to-pdf">Combine Images into One PDF</SelectItem>
                         </SelectContent>
                       </Select>
                     </div>
@@ -617,7 +633,7 @@ const ConverterPage = () => {
                 
                 <a 
                   href={convertedFileUrl} 
-                  download={`${file?.name.split('.')[0] || 'converted'}-${isCompression() ? 'compressed' : 'converted'}.${conversionType.split("-to-")[1] || file?.name.split('.').pop()}`}
+                  download={`${file?.name.split('.')[0] || 'converted'}-${isCompression() ? 'compressed' : 'converted'}.${convertedFileExtension || conversionType.split("-to-")[1] || file?.name.split('.').pop()}`}
                 >
                   <Button className="flex items-center gap-2">
                     <Download size={16} />
@@ -44,6 +44,7 @@ export const getConversionOptions = (fileFormat: string): { value: string, label
         { value: 'pdf-to-text', label: 'Extract Text from PDF' },
         { value: 'pdf-compress', label: 'Compress PDF' },
         { value: 'pdf-ocr', label: 'OCR PDF' },
+        { value: 'pdf-ocr-searchable', label: 'Make PDF Searchable (OCR)' },
         { value: 'pdf-protect', label: 'Protect PDF' },
         { value: 'pdf-unlock', label: 'Unlock PDF' },
         { value: 'split-pdf', label: 'Split PDF' },
@@ -105,7 +106,8 @@ export const getBatchProcessingOptions = (fileFormat: string): { value: string,
     case 'gif':
       return [
         { value: 'batch-compress-images', label: 'Compress Multiple Images' },
-        { value: 'batch-convert-to-pdf', label: 'Convert Multiple to PDF' }
+        { value: 'batch-convert-to-pdf', label: 'Convert Multiple to PDF' },
+        { value: 'images-to-pdf', label: 'Combine Images into One PDF' }
       ];
     default:
       return [];